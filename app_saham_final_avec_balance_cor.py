@@ -4,8 +4,35 @@ import plotly.express as px
 import plotly.graph_objects as go
 from io import BytesIO
 import numpy as np
-from datetime import datetime
+from datetime import date, datetime
 import base64
+import hashlib
+import itertools
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Parquet (optionnel) : stockage BAM persistant et cache disque des balances
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_DISPONIBLE = True
+except ImportError:
+    PARQUET_DISPONIBLE = False
+
+# Lecteur xlsx rapide (optionnel)
+try:
+    from python_calamine import CalamineWorkbook
+    CALAMINE_DISPONIBLE = True
+except ImportError:
+    CALAMINE_DISPONIBLE = False
 
 # Configuration de la page
 st.set_page_config(
@@ -146,6 +173,8 @@ if 'combined_data_bam' not in st.session_state:
     st.session_state.combined_data_bam = None
 if 'cleaning_report_bam' not in st.session_state:
     st.session_state.cleaning_report_bam = None
+if 'missing_report_bam' not in st.session_state:
+    st.session_state.missing_report_bam = None
 if 'processing_done' not in st.session_state:
     st.session_state.processing_done = False
 
@@ -163,6 +192,30 @@ if 'total_depots_bam' not in st.session_state:
 if 'total_credits_bam' not in st.session_state:
     st.session_state.total_credits_bam = None
 
+# Bornes (début, fin) de chaque période (Annee, mois) dans le jeu BAM combiné trié
+if 'bam_period_bounds' not in st.session_state:
+    st.session_state.bam_period_bounds = {}
+
+# Cube BAM pré-agrégé (Annee, mois, Direction_Regionale, Localite) et ses instantanés fin d'année
+if 'bam_cube' not in st.session_state:
+    st.session_state.bam_cube = None
+if 'bam_cube_year_end' not in st.session_state:
+    st.session_state.bam_cube_year_end = {}
+if 'bam_cube_periods' not in st.session_state:
+    st.session_state.bam_cube_periods = {}
+
+# Index des totaux de place BAM par (Annee, mois) et par (Annee, mois, Localite)
+if 'bam_market_totals' not in st.session_state:
+    st.session_state.bam_market_totals = {}
+
+# Bornes (début, fin) de chaque année dans le jeu BAM combiné trié
+if 'bam_year_bounds' not in st.session_state:
+    st.session_state.bam_year_bounds = {}
+
+# Lignes BAM écartées faute d'Annee ou de mois lors du dernier enregistrement
+if 'bam_rows_without_period' not in st.session_state:
+    st.session_state.bam_rows_without_period = 0
+
 # Fonctions de calcul des totaux
 def calculate_total_depots(df):
     """Calcule le total des dépôts"""
@@ -182,6 +235,211 @@ def calculate_total_guichets(df):
         return df['Nombre_Guichets'].sum()
     return 0
 
+# Caches LRU partagés par toutes les sessions (créés via st.cache_resource)
+def new_lru_cache():
+    """Nouveau cache LRU : entrées ordonnées + verrou (sessions concurrentes)."""
+    return {'entries': OrderedDict(), 'lock': threading.Lock()}
+
+def lru_cache_get(cache, cle):
+    """Valeur en cache (marquée comme récente) ou None."""
+    with cache['lock']:
+        valeur = cache['entries'].get(cle)
+        if valeur is not None:
+            cache['entries'].move_to_end(cle)
+        return valeur
+
+def lru_cache_put(cache, cle, valeur, max_entries):
+    """Ajoute une valeur et évince les entrées les plus anciennes au-delà de max_entries."""
+    with cache['lock']:
+        cache['entries'][cle] = valeur
+        cache['entries'].move_to_end(cle)
+        while len(cache['entries']) > max_entries:
+            cache['entries'].popitem(last=False)
+
+# Pool de processus du serveur (lecture Excel BAM, parsing Balance) : un seul
+# pool, de taille plafonnée, quel que soit le nombre de sessions et de fichiers
+PROCESS_POOL_MAX_WORKERS = max(1, int(os.environ.get('PROCESS_POOL_WORKERS', str(min(4, os.cpu_count() or 1)))))
+
+@st.cache_resource
+def _get_process_pool():
+    """
+    Pool de processus partagé par toutes les sessions. Démarrage 'spawn' :
+    le serveur Streamlit est multithreadé, un fork y copierait des verrous
+    tenus par d'autres threads.
+    """
+    return ProcessPoolExecutor(
+        max_workers=PROCESS_POOL_MAX_WORKERS,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+def reset_process_pool():
+    """Abandonne le pool (cassé) : le prochain appel en démarre un nouveau."""
+    _get_process_pool().shutdown(wait=False, cancel_futures=True)
+    _get_process_pool.clear()
+
+def iter_process_pool(fonction, arguments, en_vol):
+    """
+    Soumet fonction(*args) au pool du serveur pour chaque tuple de
+    `arguments` (itérable, lu au fur et à mesure) et renvoie les futures
+    dans l'ordre, au plus `en_vol` tâches soumises et non consommées à la
+    fois. Les tâches restantes sont annulées si l'appelant s'interrompt.
+    """
+    pool = _get_process_pool()
+    en_cours = deque()
+    try:
+        for args in arguments:
+            if len(en_cours) >= en_vol:
+                yield en_cours.popleft()
+            en_cours.append(pool.submit(fonction, *args))
+        while en_cours:
+            yield en_cours.popleft()
+    finally:
+        for future in en_cours:
+            future.cancel()
+
+# Cache partagé des jeux de données (toutes sessions) : un upload identique
+# n'est gardé qu'une fois en mémoire, quel que soit le nombre d'analystes
+DATASET_CACHE_MAX_BYTES = int(os.environ.get('DATASET_CACHE_MAX_MB', '2048')) * 1024 * 1024
+DATASET_CACHE_TTL = int(os.environ.get('DATASET_CACHE_TTL_S', str(4 * 3600)))
+
+@st.cache_resource
+def _get_dataset_cache():
+    """Jeux de données partagés, indexés par empreinte du contenu."""
+    cache = new_lru_cache()
+    cache['taille'] = 0
+    return cache
+
+def _current_session_id():
+    """Identifiant de la session Streamlit courante ('local' hors serveur)."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'local'
+
+def _session_active(session_id):
+    """False si la session Streamlit est terminée (navigateur déconnecté)."""
+    if session_id == 'local' or not runtime.exists():
+        return True
+    return runtime.get_instance().is_active_session(session_id)
+
+def hash_dataframe(df):
+    """Empreinte SHA-256 du contenu d'un DataFrame (colonnes, types, valeurs)."""
+    sha = hashlib.sha256()
+    sha.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode('utf-8'))
+    sha.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return sha.hexdigest()
+
+def _evict_datasets(cache, maintenant):
+    """
+    Éviction (verrou tenu) : références des sessions terminées relâchées,
+    entrées expirées (TTL), puis entrées sans référence dans l'ordre LRU
+    tant que le plafond mémoire est dépassé, puis, en dernier recours, les
+    plus anciennes même référencées (les sessions gardent leur propre
+    référence, seul le partage est perdu).
+    """
+    def retirer(digest):
+        cache['taille'] -= cache['entries'].pop(digest)['taille']
+    
+    actives = {}
+    for digest, entree in list(cache['entries'].items()):
+        entree['refs'] = {
+            reference for reference in entree['refs']
+            if actives.setdefault(reference[0], _session_active(reference[0]))
+        }
+        if maintenant - entree['acces'] > DATASET_CACHE_TTL:
+            retirer(digest)
+    
+    for digest, entree in list(cache['entries'].items()):
+        if cache['taille'] <= DATASET_CACHE_MAX_BYTES:
+            return
+        if not entree['refs']:
+            retirer(digest)
+    
+    while cache['taille'] > DATASET_CACHE_MAX_BYTES and len(cache['entries']) > 1:
+        retirer(next(iter(cache['entries'])))
+
+def share_dataset(slot, df, digest=None):
+    """
+    Dédoublonne `df` avec le cache partagé du serveur : si un jeu de même
+    contenu existe déjà (autre session, rerun...), c'est cette instance qui
+    est renvoyée et `df` peut être libéré. La session courante est comptée
+    comme référence (par `slot` : 'bam', 'saham_referentiel'...) ; sa
+    référence précédente sur ce slot est relâchée. `digest` : empreinte
+    déjà connue du contenu (sinon calculée par hash_dataframe).
+    
+    Le DataFrame renvoyé est partagé : il ne doit pas être modifié en place.
+    """
+    cache = _get_dataset_cache()
+    if digest is None:
+        digest = hash_dataframe(df)
+    reference = (_current_session_id(), slot)
+    ancien = st.session_state.get(f'_dataset_{slot}')
+    maintenant = time.time()
+    
+    with cache['lock']:
+        entree = cache['entries'].get(digest)
+        if entree is None:
+            entree = {'data': df, 'taille': int(df.memory_usage(deep=True).sum()), 'refs': set(), 'acces': maintenant}
+            cache['entries'][digest] = entree
+            cache['taille'] += entree['taille']
+        entree['refs'].add(reference)
+        entree['acces'] = maintenant
+        cache['entries'].move_to_end(digest)
+        
+        if ancien and ancien != digest and ancien in cache['entries']:
+            cache['entries'][ancien]['refs'].discard(reference)
+        
+        _evict_datasets(cache, maintenant)
+    
+    st.session_state[f'_dataset_{slot}'] = digest
+    return entree['data']
+
+def share_upload(slot, fichier, lire):
+    """
+    share_dataset pour un fichier uploadé, avec pour empreinte le SHA-256
+    des octets du fichier : aux reruns suivants (ou pour un autre analyste
+    chargeant le même fichier), le DataFrame est retrouvé dans le cache
+    sans relire l'Excel ni hacher le DataFrame. `lire(fichier)` n'est
+    appelé qu'au premier chargement.
+    """
+    digest = f"{slot}:{hashlib.sha256(fichier.getvalue()).hexdigest()}"
+    cache = _get_dataset_cache()
+    with cache['lock']:
+        entree = cache['entries'].get(digest)
+    df = entree['data'] if entree is not None else lire(fichier)
+    return share_dataset(slot, df, digest)
+
+def select_view(vues, key):
+    """
+    Navigation entre les vues d'une page. Contrairement à st.tabs, qui
+    exécute le contenu de tous les onglets à chaque rerun, seule la vue
+    choisie est calculée et affichée.
+    """
+    return st.radio("Vue", vues, horizontal=True, key=key, label_visibility="collapsed")
+
+
+def memo_view(nom, sources, calcul):
+    """
+    Résultat de `calcul()` mémorisé dans la session sous `nom`, tant que
+    les DataFrames `sources` sont les mêmes objets : une vue réaffichée
+    retrouve ses agrégations sans les recalculer.
+    """
+    memo = st.session_state.setdefault('_view_cache', {})
+    entree = memo.get(nom)
+    if entree is None or len(entree[0]) != len(sources) or any(a is not b for a, b in zip(entree[0], sources)):
+        entree = (tuple(sources), calcul())
+        memo[nom] = entree
+    return entree[1]
+
+
+def dataset_cache_stats():
+    """(nombre de jeux partagés, mémoire occupée en octets, nombre de références)"""
+    cache = _get_dataset_cache()
+    with cache['lock']:
+        return (
+            len(cache['entries']),
+            cache['taille'],
+            sum(len(entree['refs']) for entree in cache['entries'].values())
+        )
+
 # Logo Saham encodé en base64
 SAHAM_LOGO_BASE64 = "/9j/4AAQSkZJRgABAQAAAQABAAD/4gHYSUNDX1BST0ZJTEUAAQEAAAHIAAAAAAQwAABtbnRyUkdCIFhZWiAH4AABAAEAAAAAAABhY3NwAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAQAA9tYAAQAAAADTLQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAlkZXNjAAAA8AAAACRyWFlaAAABFAAAABRnWFlaAAABKAAAABRiWFlaAAABPAAAABR3dHB0AAABUAAAABRyVFJDAAABZAAAAChnVFJDAAABZAAAAChiVFJDAAABZAAAAChjcHJ0AAABjAAAADxtbHVjAAAAAAAAAAEAAAAMZW5VUwAAAAgAAAAcAHMAUgBHAEJYWVogAAAAAAAAb6IAADj1AAADkFhZWiAAAAAAAABimQAAt4UAABjaWFlaIAAAAAAAACSgAAAPhAAAts9YWVogAAAAAAAA9tYAAQAAAADTLXBhcmEAAAAAAAQAAAACZmYAAPKnAAANWQAAE9AAAApbAAAAAAAAAABtbHVjAAAAAAAAAAEAAAAMZW5VUwAAACAAAAAcAEcAbwBvAGcAbABlACAASQBuAGMALgAgADIAMAAxADb/2wBDAAUDBAQEAwUEBAQFBQUGBwwIBwcHBw8LCwkMEQ8SEhEPERETFhwXExQaFRERGCEYGh0dHx8fExciJCIeJBweHx7/2wBDAQUFBQcGBw4ICA4eFBEUHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh4eHh7/wAARCAHGAekDASIAAhEBAxEB/8QAHAABAAIDAQEBAAAAAAAAAAAAAAEGAgMEBQcI/8QAMhAAAgEDBAEEAQMDBAMBAQAAAAECAwQRBRIhMUEGEyJRYRQycSNCgTNScpFlYsEkU//EABwBAQABBQEBAAAAAAAAAAAAAAABAgQFBgcDCP/EAC0RAAICAgICAgICAgICAwEAAAABAgMEEQUhBhITMSJBFFEjMkJhM4EHFTRi/9oADAMBAAIRAxEAPwD8/gA9TCAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABKAABUiH30AGmu+AH0UgAyUCuKTIBLIKGyWtAAAAAAAADQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABKAABUh/RCJBHy+itIr0SACdAAAgkAApYAAIIYYSb46BDG9BfZvt7SnUTTqNzzwmb5aVeRhuVPdF9YPFCU11LB6KF9dUf2VX/nk8X7N9F7VKv6maalOpST305Qx9oxhlrODsUNXjU+N5ShNfeD2U46PdR2xqe3J9LBQ7XEyEONqv7gV0HdudArOLnbyVRfycm4srqg/nSaIWTH9lN3E2Vr8Vs0APKeGsA942Rl9GJnTOL76AAPX1etni5JfZDIJIKHLQAAJT2SkAACQAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAACSlPb0AAh1+yt1+wcEyFFLoz7eDdSt60lxbzl9cFMrqo/bPenAuseoxPOTk6FPTLyssU6Oz/AJI2PQr/AGvO3rwWzzq/7L5cFmv6iclkI98tPr26fu05NfweTbHe1FP/ACe1V8LFtMtreKyav91oxYIqZTwQj3Mfpp6ZkAClnowACCAGAEQQlgkBE9FLi2OFywpx7jwyVj8B7fGCZRi19HvVfdV/qz2WGp3dnLNOpJp9pvJ2rfXqNd7LqjFL+CsEp+GW1mLGS6Mvi83OvqzsuMdM0zUI7qTSf1k5l96erUpP2luXg5Nvd1beWadRr/J3dL9RuLUa/wAl+TG2V219xNjquwMxf5OmcG4tatB/OLRpL46lhqNPDjHL/By73025pytZxx9ZJr5CcXqw8MnxyN0fensqxDaPbeafc2T/AKlNy/hHhk5OWNrX+DK131TXTNWyuOvxpalEkDDBX9/RZNa+wABop0wAwuSRvS2AAQQ2AACoAAAAAAAAAAAAAAAAAAAAAAAAAAAAAq0AACjZDIbwTBOXRKx5DhUk8Q/b5EpxitnrTRObSiTODisvH+Hk9em6dXvJKUYP20/k3xwdTQdGjUpqpXXHhMsEFTpUnSpU1FPgwGZyvr+MToHBeJW3tWWLo5lto9lSUZyk5TXjB04OlCKjCnHj8GtxaJzg1+3PnN9M6pieO4lFa0uzOU5PhLAzLHZhuMslg7bN7bMisampaUScxxunBTzxhnF1/TKfs+/brbLto7E+hUpqvazg+MLsyWFlzUktmv8APcXTZjys12fPsybe7tPAPReUlTuZxXhmnBveNJSqTPnrKqcMiQAaBUUN7AABAAAADAH0U7MGvslLjgywCdjYABGyJQ9jBrkknAwJdoivdb2mbaNzcUpJ0ptY8Z7LFo+vJJQuouLf9yZWYiTeeyxuwq7V39myYHkN2M1H9H0aEqF1T+E6c448pNnK1DRKFfM6K2z+nwVeyvrm1knTqPC8Fr0bWqN1DFw1Gp4MPbi248tr6N7xeVweSgoWrTKzf6bdWsvnCTj9pZPGfRKlWnNbXTU4s5eo6JaV4Opb/CX0e9PK+v4ssOS8R6+WnvZTyM8nsvLC5t5NOm2vtHhaafJmMfIjb9HP8vArl9FoVnUlBp9rDPPv9un5PD9Q6wof9Ig+u2XODiOclvtGK5zmqsOtkZk5SYmTGz7NJMS0vHJxNR1xPNC2+KXGTgzk5ScpPLfk26hbyt7qVKSxzwedm8YVEHBNHz9z/I5U8mUJPol4wQQmSZb6NaT/ZD7AfYJKWwACnYAAIYAACIb0A/lwuMAiXC58kN6RXCDlJJI9OiWU728UF+1csu7UaVGFvFL4+TnemrRWtgq8lzLydFJtObNP5PL9n6HcPEOJ/j1K6SMZPa1jvyzi+rbvdttabSS7SOxf1Y0LGVRvEn0Ui7qyrV5VG+Wz04nEf+zRYea8y4f4kYriGF0RjAX+nFfk32ttUua0adOLll8/wbPc41V72cvxMeWbb2j1aFYyvLpPD2xfJcJx2RjSXSNGl0adjbunHiTwemTSjvb4NSzcid09I7L43xUOPo+SX2jwazdK0s5RT+T6KdKbk5Tk+ZM6XqO7VxcbYyyonKM3xeH6w2znHlPLvMyZQT+jHySiQZlrSNOgvySOh6bt3W1DbN5T8M9/qXTZ209umm4fg2ek7fNX3scqPB3JydWOypHcvBrV/IOu3R1Pi/GFm4bZQMY7Hg7etaTOi3Xox3RfePBw8OTePDMziZcbEmaJynDzwZuCQbMU3ntmWOcEwjyi82m+jBVRlvTMqjy0k/B3vR0X+pqPHgr8Ibazl9otXpOnKFOpOSxFvgxHJz1Bm5eHYjszdnVb5f8k5RhLmbwQkaLL/Zn0LWvjjFGXDM6c5Q/azCKMsEqxx+iHUp/wC30Zu4lnPT/Brq1JVP3PKIxySl9k/LJlPwUx7SMecE54ElwYxjkp+/s9ox93s220cTnUb4USl69VdW+qSz/cXVONO0qyk8LBQb6W+6qNcrcbPw9O3tHJvP8pacNmlNmRik8k4NrcfVI5EpeyRIAKSQAAAAAAACpMhpv6DM6dJ1JRiouTf14FGlOrNKCzyWvRNKo2dP9TcZlN9LwjG5uSqU+zZeA8fuzbU9dDSNLo2tONSqt82v+jpVJ1G1tfx6wTNqSUuE/peDGPDf5NPzcqdjO5cTwVWHCK/ownnc8snPAx8l9eSJqcZ4xwY7tmadkHNxTJYi2pLBktvkh7dywSm0ymUfaDicj1Tab3SuIrpfJorc1jJfa1JV7apRks7lwUi9oOjXlTkumbbxGZ7fjI4r5fxEq7HbFfZ5UZRIaJRssmn9HN1v9kPsjkl9gjY7AAIJQAAJABjJ4JKXHfZkezSqH6mts2N4Z4qbcm/4LZ6OtVTo/qai4ksox/I5Kphs2XxjBeZkrr6OtXhsoQpQWElyZUecLx5FeSlM1Vaqo29SpJ4xE0iPtffs7tZH+LhvfWkcH1VeJ1Vb03wV9rBnc1HXvJ1G8rIowq16mymss3bGiqqezhHKZc+RypRMqFCdWsqcFlly0XT6dnQ9ySW9rk8ug6X7DVetxNcpfZ0pSdSq85X0kYXPz9pxR0LxTxnpXWL6GHKfXB4tfvI2lqqKeZz4TXg6FarGjZznJpSiUrU7uV7cOb/auEW3FUSvl7NF75Ty6xaHVW9HlqJ5bby88s25FSeODGL5Nzrh6LSOJX3+8nJ/bMyYRc5KK7bMYczSO56a0517j3qqeyL4PDKyIVRe2ZPheMsy7l6rZ3NMoSs9Jg3H5s9UeOTO4qSknSwsRfBrW7HJoOXa5zcon0Tw2EsWhRn0ZpwnmE1mL7OPquhQk3UtMRzzg6knjozpSk+X0emJmyq6LXmOBozItxXZRbq1qUqjhUi4NcZaPMoyVRLcmmfQbqnp9xHZWpuT+znrQ7GU8rdFfhmxVcvFLs5jm+C3uftD6K1Z21S5qKMYvvBdrelG3tYUo4ylyzTQoWtm1KjBuaN9KMp5k3jPgw/I8grPo3PxzxtcdBTn9mOOTOUYwoupKSSJccfk5Pqi5lRoxpR43Fhj4ztl0bDzPKQw6tyOhb1adbOySyvBtwvLKfpV7OzuFNtyi+0y1U6sLqiqlKX+C6y8D4o7SMVw/kdWfL42zY8E9I1xyuw5MxiWjbUk3r9EykKcsvCQSybqSVLdUl1FFcK3OSRb5mRHDg22cr1HcOja+zGXL7Ki++Toa7duveSa6yc5PJvnGY3wVpnz/wCXcj/JvaRIAMnLtGowjpAAHmVAAEgAAABJtpLlsJZjnwdf03aK4rqq+VBlrlX/ABGV4bAlm3qCOl6d0tUKfu3Ec55WTsTfwwlnHSJrVZVEotYS4MM+DS+RyZTn0z6A4TjYYlSSXZjGMd258TfaNkUY5MovLwY+MvaXZmcibjA8GvXX6alBUntbfOPJ7qFVXNrCsvKKv6inOep7Gmoro63pe4dazdu+4ftRnJ4UVT7o0fF5Xee65PR75kRM5RaWWuOiF0YGXTN8Uk47RlTbycT1ZabmrmisJfuSO5AxlThVhKE+mZDCv+KWzX+c4v8AmYsnFdooT6IPVq1CVteShJYXaPKjeMa1WQ2j555GiWNc4NEPsEsjkuVos9AAE+oAAI0yGPBi+Q8iCcpYIfRVBe79Ub7Kg61anTj3KWH/AAXylSjbW8beH7YLCSK56UtY1K8q0+qfn8ljqVN8d65yalzWV7P1Oy+FcYqalJrs1c7sZOb6muMWKpQ+M2+f4OtSW6cX9FT9RXLr6k34isFtxVW5dmZ8z5F4+MoJnLVOqkoQjulJ9lt9PabTt6EbirFKb5OZodfT7Z77nbOfa/B2oaxp0pucquPpGbzHOK1FGicBVgxn8tr7PbXk8xSzhcoxhJKeZLLOfca7aRhNUYylJrhmzRr+jqWdy2Shw19muW4du/ZnScXnMWa+Kt6MtXsa93FOlUcVjlLyV240q5oxcYxcn94Lk5+2pKKwn0jUqkvKLrD5NYq9Gix5Xxqvkdy39lClZXKniVJ/zg3UdPvKs1CnQ4f9zRd24t8wX/RP6j2/jTpr+S6nzia0ka/X/wDHsE+2V/TdBk6i95Ljl5O9SjTtqKpU0kka5VakpZkzbRpe4s5MVmZ0shG1cT43Hjn7IxcnFOb67PJZ61b17p27iljtmfqOurSw29NrBSqUpJqpB4aMlh8YradmD5vyaVGTGuL6Rf5pOTa5j4GWljPB4fT2oU7q39mrJKaXB7sS3NSWOeDEZWNKqX0bdw/I15dakn2a8cmcVlNPolxwRnksnsy83KS0S4pLoJtDIyFt9Eykkvy/RlGWeypa9dyurp7ZYUXg7ut3StbZPOJMptWe6UmvLybfxeN6pSaOR+c8rCT+OBluPdpWpSsqq3ZcH4OfFkz5M5kY0LY60c4wM+zEmrIvsvdtcUbukqlJrP0ZbKninko1rXuaEk6NVxO5Zeo69COKsHJ47Nby+He/xOqcN5zBRSt+zv0ISdRRfx/k5HqXU1Szb0mk/LTObqGvV7lvEXHJyKilUk6k5ZbPbB4r1aciw8h8uqvi1Wxu9xuT7YxglYS4IZsij6rRy7Kt+efvsAAnZ5IAAN7JAAIAAABstlhRi12y5aJbU7Sw9yS5kVOyxUuKSx0+S73UVCjTiutqMBztjj9HTfA8KM7PkaMZSTWfswXYim4oYNNlJt9nZYuMW0iTOmsSzkwMZZJh09kTrVq0cn1NYVpVI3VJJxXeDwaFd/ptQhuUopvDLRCutvt1Ipr8nnu9Ntrlbqa2T+0ZevOfxuEjRszxz60GjUL+k3w8rrBgzY4pp5i0zCUE/JrspeWI/lKSiSYJmSKVW1ssj0RfxWQkmY/k8tt0XTD7Njq1Ixcl+Tywco9lgpyeMSWMfZ5qjy2/spJ4pJx02J8kdY/hGSIJ4J6Nx/QAAhFAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAB6NAAAGwAASSgAASDIAAhAAAkpCDYARsyAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAACdgHgjJJC5eQSXRsAAJ7GiJ/Y+gB1H/2Q=="
 
@@ -390,42 +648,313 @@ def get_month_from_filename(filename):
     
     return None
 
+# Moteur de lecture Excel : 'auto' (calamine si installé, sinon openpyxl en flux),
+# 'calamine', 'openpyxl' ou 'pandas' (pd.read_excel, utilisé aussi en secours)
+EXCEL_READER_ENGINE = os.environ.get('EXCEL_READER_ENGINE', 'auto')
+
+# Contrôle (coûteux) : chaque lecture rapide est comparée à pd.read_excel
+EXCEL_READER_CHECK = os.environ.get('EXCEL_READER_CHECK', '') == '1'
+
+def _convert_excel_cell(valeur):
+    """Valeur de cellule au format attendu par pandas (comme pd.read_excel)"""
+    if valeur is None:
+        return ''
+    if isinstance(valeur, float) and valeur.is_integer():
+        return int(valeur)
+    # calamine renvoie les cellules date sans heure en `date` : en datetime,
+    # la colonne devient datetime64 comme avec openpyxl
+    if isinstance(valeur, date) and not isinstance(valeur, datetime):
+        return datetime(valeur.year, valeur.month, valeur.day)
+    return valeur
+
+def _iter_rows_openpyxl(contenu):
+    """Lignes de la première feuille, lue en flux (openpyxl read-only)"""
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(BytesIO(contenu), read_only=True, data_only=True)
+    try:
+        feuille = workbook.worksheets[0]
+        feuille.reset_dimensions()
+        for ligne in feuille.iter_rows(values_only=True):
+            yield ligne
+    finally:
+        workbook.close()
+
+def _iter_rows_calamine(contenu):
+    """Lignes de la première feuille, lue avec calamine"""
+    feuille = CalamineWorkbook.from_filelike(BytesIO(contenu)).get_sheet_by_index(0)
+    return iter(feuille.to_python(skip_empty_area=False))
+
+def _rows_to_frame(lignes, colonne_utile):
+    """
+    Construit le DataFrame à partir des lignes brutes (en-tête en première
+    ligne), en ne gardant que les colonnes retenues par `colonne_utile`.
+    Renvoie None si aucune colonne n'est retenue.
+    """
+    from pandas.io.parsers import TextParser
+    
+    entete = next(lignes, None)
+    if entete is None:
+        return None
+    entete = [_convert_excel_cell(v) for v in entete]
+    indices = [i for i, nom in enumerate(entete) if nom != '' and (colonne_utile is None or colonne_utile(str(nom)))]
+    if not indices:
+        return None
+    
+    donnees = [[entete[i] for i in indices]]
+    for ligne in lignes:
+        largeur = len(ligne)
+        donnees.append([_convert_excel_cell(ligne[i]) if i < largeur else '' for i in indices])
+    
+    # Supprimer les lignes vides en fin de feuille (comme pd.read_excel)
+    while len(donnees) > 1 and all(v == '' for v in donnees[-1]):
+        donnees.pop()
+    
+    return TextParser(donnees, header=0).read()
+
+def read_excel_fast(source, colonne_utile=None):
+    """
+    Lecture d'un fichier Excel (première feuille) limitée aux colonnes utiles.
+    
+    `source` : contenu binaire ou fichier uploadé ; `colonne_utile(nom)`
+    indique si une colonne doit être lue (None = toutes). Le moteur rapide
+    est choisi selon EXCEL_READER_ENGINE ; en cas d'échec (ou de format non
+    reconnu), retour à pd.read_excel.
+    """
+    contenu = source if isinstance(source, bytes) else source.getvalue()
+    
+    moteur = EXCEL_READER_ENGINE
+    if moteur == 'auto':
+        moteur = 'calamine' if CALAMINE_DISPONIBLE else 'openpyxl'
+    
+    if moteur in ('calamine', 'openpyxl'):
+        try:
+            lignes = _iter_rows_calamine(contenu) if moteur == 'calamine' else _iter_rows_openpyxl(contenu)
+            df = _rows_to_frame(lignes, colonne_utile)
+            if df is not None:
+                return _check_excel_frame(df, contenu, colonne_utile, moteur) if EXCEL_READER_CHECK else df
+        except Exception as e:
+            print(f"⚠️ Lecture Excel rapide ({moteur}) impossible ({e}) : pd.read_excel")
+    
+    return _read_excel_pandas(contenu, colonne_utile)
+
+def _read_excel_pandas(contenu, colonne_utile=None):
+    """Lecture de référence avec pd.read_excel (colonnes utiles uniquement)"""
+    usecols = (lambda nom: colonne_utile(str(nom))) if colonne_utile is not None else None
+    try:
+        return pd.read_excel(BytesIO(contenu), usecols=usecols)
+    except ValueError:
+        # Aucune colonne retenue : lecture complète (message d'erreur explicite en aval)
+        return pd.read_excel(BytesIO(contenu))
+
+def _check_excel_frame(df, contenu, colonne_utile, moteur):
+    """
+    Compare la lecture rapide à pd.read_excel (mêmes colonnes, types et
+    valeurs) ; en cas d'écart, le signale et renvoie la lecture de référence.
+    """
+    reference = _read_excel_pandas(contenu, colonne_utile)
+    try:
+        pd.testing.assert_frame_equal(df, reference)
+        return df
+    except AssertionError as e:
+        print(f"⚠️ Lecture Excel ({moteur}) différente de pd.read_excel : {e}")
+        return reference
+
+# Lecture parallèle des fichiers Excel mensuels BAM (mémorisée par contenu)
+BAM_EXCEL_WORKERS = PROCESS_POOL_MAX_WORKERS
+BAM_EXCEL_CACHE_MAX_ENTRIES = 256
+
+@st.cache_resource
+def _get_bam_excel_cache():
+    """Cache LRU des fichiers Excel BAM décodés (clé : SHA-256 du contenu)."""
+    return new_lru_cache()
+
+def _read_excel_bytes(contenu):
+    """Décode un fichier Excel BAM (exécuté dans un processus du pool)."""
+    return read_excel_fast(contenu, bam_column_wanted)
+
+def read_bam_excel_files(uploaded_files, workers=1):
+    """
+    Décode une liste de fichiers Excel uploadés, dans l'ordre.
+    
+    Chaque fichier est mémorisé par le SHA-256 de son contenu : un rerun
+    (changement de mois, clic...) ne redécode rien. Les fichiers non encore
+    décodés le sont dans le pool de processus du serveur, `workers` à la
+    fois au plus ; si le pool échoue, ils sont décodés séquentiellement.
+    Renvoie une liste de DataFrames ou d'exceptions (fichier illisible).
+    """
+    cache = _get_bam_excel_cache()
+    resultats = [None] * len(uploaded_files)
+    a_decoder = {}
+    
+    for i, uploaded_file in enumerate(uploaded_files):
+        contenu = uploaded_file.getvalue()
+        digest = hashlib.sha256(contenu).hexdigest()
+        df = lru_cache_get(cache, digest)
+        if df is not None:
+            resultats[i] = df
+        else:
+            a_decoder.setdefault(digest, (contenu, []))[1].append(i)
+    
+    if not a_decoder:
+        return resultats
+    
+    digests = list(a_decoder)
+    contenus = [a_decoder[digest][0] for digest in digests]
+    decodes = None
+    
+    if workers > 1 and len(contenus) > 1:
+        try:
+            decodes = []
+            for future in iter_process_pool(_read_excel_bytes, ((contenu,) for contenu in contenus), workers):
+                try:
+                    decodes.append(future.result())
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    decodes.append(e)
+        except Exception as e:
+            print(f"⚠️ Lecture parallèle indisponible ({e}) : lecture séquentielle")
+            if isinstance(e, BrokenProcessPool):
+                reset_process_pool()
+            decodes = None
+    
+    if decodes is None:
+        decodes = []
+        for contenu in contenus:
+            try:
+                decodes.append(_read_excel_bytes(contenu))
+            except Exception as e:
+                decodes.append(e)
+    
+    for digest, df in zip(digests, decodes):
+        if not isinstance(df, Exception):
+            lru_cache_put(cache, digest, df, BAM_EXCEL_CACHE_MAX_ENTRIES)
+        for i in a_decoder[digest][1]:
+            resultats[i] = df
+    
+    return resultats
+
 def combine_bam_files(files_data):
-    combined_df = pd.DataFrame()
+    """
+    Combine les fichiers mensuels BAM en un seul DataFrame.
+    
+    `files_data` : liste ou itérateur (éventuellement paresseux) de dicts
+    {'data': DataFrame, 'month': int, ...}. Les DataFrames ne sont pas copiés :
+    ils sont concaténés en une seule fois (union des colonnes dans l'ordre
+    d'apparition) et la colonne `mois` est construite ensuite.
+    """
+    frames = []
+    mois = []
+    colonnes = {}
     for file_info in files_data:
-        df = file_info['data'].copy()
-        df['mois'] = file_info['month']
-        combined_df = pd.concat([combined_df, df], ignore_index=True)
+        df = file_info['data']
+        frames.append(df.drop(columns='mois') if 'mois' in df.columns else df)
+        mois.append(np.full(len(df), file_info['month']))
+        colonnes.update(dict.fromkeys(list(df.columns) + ['mois']))
+    
+    if not frames:
+        return pd.DataFrame()
+    
+    combined_df = pd.concat(frames, ignore_index=True, sort=False)
+    combined_df.insert(list(colonnes).index('mois'), 'mois', np.concatenate(mois))
     return combined_df
 
+# Nombre maximal de lignes incomplètes détaillées dans un rapport de valeurs manquantes
+MISSING_DETAILS_MAX_ROWS = 1000
+
+
+class _MissingDetails(Sequence):
+    """
+    Détail des lignes incomplètes, construit à la demande (ligne par ligne)
+    à partir du masque des valeurs manquantes.
+    """
+    
+    def __init__(self, df, mask, positions):
+        self._df = df
+        self._mask = mask
+        self._positions = positions
+    
+    def __len__(self):
+        return len(self._positions)
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        pos = self._positions[i]
+        row = self._df.iloc[pos]
+        manquantes = self._mask[pos]
+        idx = self._df.index[pos]
+        return {
+            'row_number': idx + 2,
+            'excel_row': idx + 2,
+            'missing_columns': [col for col, m in zip(self._df.columns, manquantes) if m],
+            'data_preview': {col: row[col] for col, m in zip(self._df.columns, manquantes) if not m}
+        }
+
+
 def detect_missing_values(df, data_type):
+    """
+    Rapport des valeurs manquantes (NaN ou texte vide), calculé à partir
+    d'un masque booléen unique. Le détail par ligne est limité aux
+    MISSING_DETAILS_MAX_ROWS premières lignes incomplètes.
+    """
+    mask = df.isna()
+    for col in df.columns:
+        if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
+            try:
+                mask[col] |= df[col].str.strip().eq('').fillna(False).astype(bool)
+            except AttributeError:
+                # Colonne objet sans aucune valeur texte
+                pass
+    
+    mask_values = mask.to_numpy(dtype=bool)
+    positions = np.flatnonzero(mask_values.any(axis=1))
+    
     report = {
         'data_type': data_type,
         'total_rows': len(df),
         'columns': list(df.columns),
-        'missing_details': []
+        'missing_details': _MissingDetails(df, mask_values, positions[:MISSING_DETAILS_MAX_ROWS]),
+        'missing_by_column': {col: int(n) for col, n in zip(df.columns, mask_values.sum(axis=0))},
+        'details_truncated': len(positions) > MISSING_DETAILS_MAX_ROWS
     }
     
-    for idx, row in df.iterrows():
-        missing_cols = []
-        for col in df.columns:
-            value = row[col]
-            if pd.isna(value) or (isinstance(value, str) and value.strip() == ''):
-                missing_cols.append(col)
-        
-        if missing_cols:
-            report['missing_details'].append({
-                'row_number': idx + 2,
-                'excel_row': idx + 2,
-                'missing_columns': missing_cols,
-                'data_preview': {col: row[col] for col in df.columns if col not in missing_cols}
-            })
-    
-    report['total_missing_rows'] = len(report['missing_details'])
-    report['percentage_complete'] = ((len(df) - len(report['missing_details'])) / len(df) * 100) if len(df) > 0 else 0
+    report['total_missing_rows'] = len(positions)
+    report['percentage_complete'] = ((len(df) - len(positions)) / len(df) * 100) if len(df) > 0 else 0
     
     return report
 
+def show_missing_values_report(report):
+    """
+    Affiche un rapport de detect_missing_values : complétude, valeurs
+    manquantes par colonne et lignes incomplètes (détail plafonné).
+    """
+    if not report or not report['total_missing_rows']:
+        return
+    
+    titre = (
+        f"⚠️ Valeurs manquantes : {report['total_missing_rows']:,} ligne(s) incomplète(s) "
+        f"sur {report['total_rows']:,} ({report['percentage_complete']:.1f}% de lignes complètes)"
+    ).replace(',', ' ')
+    with st.expander(titre, expanded=False):
+        par_colonne = {col: n for col, n in report['missing_by_column'].items() if n}
+        st.dataframe(
+            pd.DataFrame({'Colonne': list(par_colonne), 'Valeurs manquantes': list(par_colonne.values())}),
+            use_container_width=True, hide_index=True
+        )
+        
+        details = report['missing_details']
+        st.dataframe(
+            pd.DataFrame({
+                'Ligne Excel': [detail['excel_row'] for detail in details],
+                'Colonnes manquantes': [', '.join(map(str, detail['missing_columns'])) for detail in details]
+            }),
+            use_container_width=True, hide_index=True
+        )
+        if report['details_truncated']:
+            st.caption(f"Détail limité aux {MISSING_DETAILS_MAX_ROWS} premières lignes incomplètes")
+
 def convert_df_to_excel(df, filename):
     output = BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -444,54 +973,106 @@ def normalize_bam_columns(df):
     new_columns = {}
     
     for col in df_normalized.columns:
-        col_lower = col.lower()
-        
-        # Recherche par mot-clé
-        if 'code' in col_lower and 'localit' in col_lower:
-            new_columns[col] = 'Code_Localite'
-        elif 'localit' in col_lower and 'code' not in col_lower:
-            new_columns[col] = 'Localite'
-        elif 'nombre' in col_lower and 'guichet' in col_lower:
-            new_columns[col] = 'Nombre_Guichets'
-        elif 'montant' in col_lower and 'd' in col_lower and 'p' in col_lower:
-            # Montant des dépôts
-            new_columns[col] = 'Montant_Depots'
-        elif 'montant' in col_lower and 'cr' in col_lower:
-            # Montant des crédits
-            new_columns[col] = 'Montant_Credits'
-        elif col_lower == 'mois':
-            new_columns[col] = 'mois'
+        cible = bam_column_target(col)
+        if cible is not None:
+            new_columns[col] = cible
     
     # Renommer
     df_normalized.rename(columns=new_columns, inplace=True)
     
     return df_normalized
 
-def clean_numeric_columns(df):
-    """Nettoie les colonnes numériques - version ultra-robuste"""
+def bam_column_target(col):
+    """Nom normalisé d'une colonne BAM (recherche par mot-clé), ou None"""
+    col_lower = col.strip().lower()
+    
+    if 'code' in col_lower and 'localit' in col_lower:
+        return 'Code_Localite'
+    elif 'localit' in col_lower and 'code' not in col_lower:
+        return 'Localite'
+    elif 'nombre' in col_lower and 'guichet' in col_lower:
+        return 'Nombre_Guichets'
+    elif 'montant' in col_lower and 'd' in col_lower and 'p' in col_lower:
+        # Montant des dépôts
+        return 'Montant_Depots'
+    elif 'montant' in col_lower and 'cr' in col_lower:
+        # Montant des crédits
+        return 'Montant_Credits'
+    elif col_lower == 'mois':
+        return 'mois'
+    return None
+
+def bam_column_wanted(col):
+    """Colonne à lire dans un fichier BAM (mensuel ou combiné)"""
+    return bam_column_target(col) is not None or col.strip() in ('Annee', 'Direction_Regionale', 'DirectionRegionale')
+
+# Colonnes numériques des fichiers BAM
+BAM_NUMERIC_COLUMNS = ['Montant_Depots', 'Montant_Credits', 'Nombre_Guichets']
+
+
+class _NumericTranslateTable(dict):
+    """
+    Table str.translate pour les montants au format français : garde les
+    chiffres et le point, change la virgule en point et supprime tout le
+    reste (espaces, espaces insécables, devises...). Les caractères sont
+    résolus à la première rencontre puis mémorisés.
+    """
+    
+    def __missing__(self, code):
+        caractere = chr(code)
+        if caractere == ',':
+            valeur = '.'
+        elif caractere == '.' or caractere.isdecimal():
+            valeur = caractere
+        else:
+            valeur = None
+        self[code] = valeur
+        return valeur
+
+
+_NUMERIC_TRANSLATE_TABLE = _NumericTranslateTable()
+
+
+def clean_numeric_frame(df, columns):
+    """
+    Moteur de nettoyage numérique commun BAM / Saham.
+    
+    Les colonnes déjà numériques sont seulement complétées (NaN → 0). Les
+    autres sont nettoyées en une passe str.translate sur leurs valeurs
+    distinctes, puis converties avec pd.to_numeric.
+    
+    Renvoie (df nettoyé, {colonne: nombre de valeurs forcées à 0}).
+    """
     df_clean = df.copy()
-    numeric_cols = ['Montant_Depots', 'Montant_Credits', 'Nombre_Guichets']
+    forcees = {}
     
-    for col in numeric_cols:
-        if col in df_clean.columns:
-            # Convertir en string
-            df_clean[col] = df_clean[col].astype(str)
-            
-            # Enlever TOUS les types d'espaces (normaux, insécables, tabs, etc.)
-            df_clean[col] = df_clean[col].str.replace(r'\s+', '', regex=True)
-            
-            # Enlever les caractères non-numériques sauf point et virgule
-            df_clean[col] = df_clean[col].str.replace(r'[^\d.,]', '', regex=True)
-            
-            # Remplacer virgule par point pour décimales
-            df_clean[col] = df_clean[col].str.replace(',', '.')
-            
-            # Convertir en numérique (NaN si impossible)
-            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
-            
-            # Remplacer NaN par 0
-            df_clean[col] = df_clean[col].fillna(0)
+    for col in columns:
+        if col not in df_clean.columns:
+            continue
+        
+        serie = df_clean[col]
+        if not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+            # Nettoyer chaque valeur distincte une seule fois
+            codes, uniques = pd.factorize(serie.to_numpy(dtype=object))
+            textes = [str(valeur).translate(_NUMERIC_TRANSLATE_TABLE) for valeur in uniques]
+            nombres = pd.to_numeric(pd.Series(textes, dtype=object), errors='coerce')
+            if (codes == -1).any():
+                # Code -1 (valeur manquante) → dernier élément ajouté : NaN
+                valeurs = np.append(nombres.to_numpy(dtype=np.float64), np.nan)[codes]
+            else:
+                valeurs = nombres.to_numpy()[codes]
+            serie = pd.Series(valeurs, index=serie.index)
+        
+        manquantes = serie.isna()
+        forcees[col] = int(manquantes.sum())
+        df_clean[col] = serie.fillna(0) if forcees[col] else serie
     
+    return df_clean, forcees
+
+
+def clean_numeric_columns(df):
+    """Nettoie les colonnes numériques BAM"""
+    df_clean, _ = clean_numeric_frame(df, BAM_NUMERIC_COLUMNS)
     return df_clean
 
 def add_direction_regionale(df):
@@ -695,7 +1276,7 @@ def create_powerbi_visualizations(df):
             if 'DirectionRegionale' in df_filtered.columns:
                 st.subheader("Dépôts par Direction Régionale")
                 
-                regional_depots = df_filtered.groupby('DirectionRegionale')['Montant_Depots'].sum().reset_index()
+                regional_depots = df_filtered.groupby('DirectionRegionale', observed=True)['Montant_Depots'].sum().reset_index()
                 regional_depots['Depots_Md'] = regional_depots['Montant_Depots'] / 1e6
                 regional_depots = regional_depots.sort_values('Depots_Md', ascending=False)
                 
@@ -721,7 +1302,7 @@ def create_powerbi_visualizations(df):
             if 'DirectionRegionale' in df_filtered.columns:
                 st.subheader("Crédits par Direction Régionale")
                 
-                regional_credits = df_filtered.groupby('DirectionRegionale')['Montant_Credits'].sum().reset_index()
+                regional_credits = df_filtered.groupby('DirectionRegionale', observed=True)['Montant_Credits'].sum().reset_index()
                 regional_credits['Credits_Md'] = regional_credits['Montant_Credits'] / 1e6
                 
                 fig_pie = px.pie(
@@ -740,7 +1321,7 @@ def create_powerbi_visualizations(df):
             if 'DirectionRegionale' in df_filtered.columns:
                 st.subheader("Guichets par Direction Régionale")
                 
-                regional_guichets = df_filtered.groupby('DirectionRegionale')['Nombre_Guichets'].sum().reset_index()
+                regional_guichets = df_filtered.groupby('DirectionRegionale', observed=True)['Nombre_Guichets'].sum().reset_index()
                 regional_guichets = regional_guichets.sort_values('Nombre_Guichets', ascending=False)
                 
                 fig_guichets = px.bar(
@@ -779,7 +1360,7 @@ def create_powerbi_visualizations(df):
             
             st.subheader("Tableau Récapitulatif")
             
-            detailed_summary = df_month_filtered.groupby(['DirectionRegionale', 'mois']).agg({
+            detailed_summary = df_month_filtered.groupby(['DirectionRegionale', 'mois'], observed=True).agg({
                 'Montant_Depots': 'sum',
                 'Montant_Credits': 'sum',
                 'Nombre_Guichets': 'sum'
@@ -799,7 +1380,7 @@ def create_powerbi_visualizations(df):
             st.subheader("Comparaisons")
             col1, col2, col3 = st.columns(3)
             
-            regional_summary = df_month_filtered.groupby('DirectionRegionale').agg({
+            regional_summary = df_month_filtered.groupby('DirectionRegionale', observed=True).agg({
                 'Montant_Depots': 'sum',
                 'Montant_Credits': 'sum',
                 'Nombre_Guichets': 'sum'
@@ -836,7 +1417,7 @@ def create_powerbi_visualizations(df):
         with col1:
             st.subheader("Dépôts par Localité")
             
-            top_localites = df_filtered.groupby('Localite')['Montant_Depots'].sum().reset_index()
+            top_localites = df_filtered.groupby('Localite', observed=True)['Montant_Depots'].sum().reset_index()
             top_localites['Depots_Md'] = top_localites['Montant_Depots'] / 1e6
             top_localites = top_localites.nlargest(15, 'Depots_Md').sort_values('Depots_Md')
             
@@ -889,7 +1470,7 @@ def create_powerbi_visualizations(df):
             st.markdown("---")
             st.subheader("Analyse Détaillée")
             
-            detailed_table = df_filtered.groupby(['DirectionRegionale', 'Localite']).agg({
+            detailed_table = df_filtered.groupby(['DirectionRegionale', 'Localite'], observed=True).agg({
                 'Montant_Depots': 'sum',
                 'Montant_Credits': 'sum',
                 'Nombre_Guichets': 'sum'
@@ -931,17 +1512,24 @@ def normalize_referentiel_columns(df):
     
     # Mapper les variations de noms
     for col in df_normalized.columns:
-        col_lower = col.lower()
-        
-        if 'code' in col_lower and 'agence' in col_lower:
-            df_normalized.rename(columns={col: 'Code_Agence'}, inplace=True)
-        elif 'code' in col_lower and 'localit' in col_lower:
-            df_normalized.rename(columns={col: 'Code_Localite'}, inplace=True)
-        elif 'localit' in col_lower and 'code' not in col_lower:
-            df_normalized.rename(columns={col: 'Localite'}, inplace=True)
+        cible = referentiel_column_target(col)
+        if cible is not None:
+            df_normalized.rename(columns={col: cible}, inplace=True)
     
     return df_normalized
 
+def referentiel_column_target(col):
+    """Nom normalisé d'une colonne du référentiel agences, ou None"""
+    col_lower = col.strip().lower()
+    
+    if 'code' in col_lower and 'agence' in col_lower:
+        return 'Code_Agence'
+    elif 'code' in col_lower and 'localit' in col_lower:
+        return 'Code_Localite'
+    elif 'localit' in col_lower and 'code' not in col_lower:
+        return 'Localite'
+    return None
+
 def normalize_financial_columns(df):
     """Normalise les colonnes des données financières"""
     df_normalized = df.copy()
@@ -951,87 +1539,169 @@ def normalize_financial_columns(df):
     
     # Mapper les variations de noms
     for col in df_normalized.columns:
-        col_lower = col.lower()
-        
-        if 'p' in col_lower and 'riod' in col_lower:
-            df_normalized.rename(columns={col: 'Periode'}, inplace=True)
-        elif 'code' in col_lower and 'agence' in col_lower:
-            df_normalized.rename(columns={col: 'Code_Agence'}, inplace=True)
-        elif 'd' in col_lower and 'p' in col_lower and 't' in col_lower:
-            df_normalized.rename(columns={col: 'Depots'}, inplace=True)
-        elif 'cr' in col_lower and 'dit' in col_lower:
-            df_normalized.rename(columns={col: 'Credits'}, inplace=True)
+        cible = financial_column_target(col)
+        if cible is not None:
+            df_normalized.rename(columns={col: cible}, inplace=True)
     
     return df_normalized
 
+def financial_column_target(col):
+    """Nom normalisé d'une colonne des données financières, ou None"""
+    col_lower = col.strip().lower()
+    
+    if 'p' in col_lower and 'riod' in col_lower:
+        return 'Periode'
+    elif 'code' in col_lower and 'agence' in col_lower:
+        return 'Code_Agence'
+    elif 'd' in col_lower and 'p' in col_lower and 't' in col_lower:
+        return 'Depots'
+    elif 'cr' in col_lower and 'dit' in col_lower:
+        return 'Credits'
+    return None
+
 def clean_numeric_saham(df, columns):
     """Nettoie les colonnes numériques Saham"""
-    df_clean = df.copy()
-    
-    for col in columns:
-        if col in df_clean.columns:
-            # Convertir en string
-            df_clean[col] = df_clean[col].astype(str)
-            # Enlever tous les espaces
-            df_clean[col] = df_clean[col].str.replace(r'\s+', '', regex=True)
-            # Enlever caractères non-numériques sauf point et virgule
-            df_clean[col] = df_clean[col].str.replace(r'[^\d.,]', '', regex=True)
-            # Remplacer virgule par point
-            df_clean[col] = df_clean[col].str.replace(',', '.')
-            # Convertir en numérique
-            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
-            # Remplacer NaN par 0
-            df_clean[col] = df_clean[col].fillna(0)
-    
+    df_clean, _ = clean_numeric_frame(df, columns)
     return df_clean
 
-def join_and_aggregate_saham(df_financial, df_referentiel):
+# Index Code_Agence -> Localite gardés en cache (par empreinte du référentiel)
+AGENCE_INDEX_CACHE_MAX_ENTRIES = 8
+
+@st.cache_resource
+def _get_agence_index_cache():
+    """Index agences -> localités des référentiels, partagés entre sessions."""
+    return new_lru_cache()
+
+def _agence_codes(serie):
+    """Codes agence comparables entre fichiers : texte sans espaces autour."""
+    return serie.astype(str).str.strip()
+
+def build_agence_index(df_referentiel):
     """
-    Jointure des données financières avec le référentiel agences
-    puis agrégation par localité avec calcul PDM
+    Index haché Code_Agence -> Localite d'un référentiel agences, construit
+    une fois par contenu (cache partagé entre sessions). Un code en double
+    garde sa première localité. Renvoie {'codes': pd.Index,
+    'localites': array aligné sur les codes, 'doublons': nb de codes en double}.
     """
-    # Normaliser les DataFrames
-    df_fin = normalize_financial_columns(df_financial.copy())
-    df_ref = normalize_referentiel_columns(df_referentiel.copy())
-    
-    # Nettoyer les colonnes numériques financières
+    cache = _get_agence_index_cache()
+    cle = hash_dataframe(df_referentiel)
+    index = lru_cache_get(cache, cle)
+    
+    if index is None:
+        df_ref = normalize_referentiel_columns(df_referentiel)
+        codes = _agence_codes(df_ref['Code_Agence'])
+        premiers = ~codes.duplicated().to_numpy()
+        index = {
+            'codes': pd.Index(codes.to_numpy()[premiers]),
+            'localites': df_ref['Localite'].to_numpy()[premiers],
+            'doublons': int((~premiers).sum())
+        }
+        lru_cache_put(cache, cle, index, AGENCE_INDEX_CACHE_MAX_ENTRIES)
+    return index
+
+def join_saham_agences(df_financial, index):
+    """
+    Données financières normalisées et nettoyées, avec la Localite de
+    chaque agence lue dans l'index (recherche vectorisée, sans merge).
+    Renvoie (DataFrame, rapport) ; rapport = {'codes_non_trouves': codes
+    absents du référentiel, 'lignes_non_trouvees', 'doublons_referentiel'}.
+    """
+    df_fin = normalize_financial_columns(df_financial)
     df_fin = clean_numeric_saham(df_fin, ['Depots', 'Credits'])
     
-    # S'assurer que Code_Agence est du même type dans les 2 DataFrames
-    df_fin['Code_Agence'] = df_fin['Code_Agence'].astype(str).str.strip()
-    df_ref['Code_Agence'] = df_ref['Code_Agence'].astype(str).str.strip()
+    codes = _agence_codes(df_fin['Code_Agence'])
+    positions = index['codes'].get_indexer(codes)
+    non_trouves = positions < 0
     
-    # ÉTAPE 1 : Jointure
-    df_joined = df_fin.merge(
-        df_ref[['Code_Agence', 'Localite']], 
-        on='Code_Agence', 
-        how='left'
+    df_joined = df_fin.assign(
+        Code_Agence=codes,
+        Localite=pd.api.extensions.take(index['localites'], positions, allow_fill=True)
     )
+    rapport = {
+        'codes_non_trouves': sorted(codes[non_trouves].unique()),
+        'lignes_non_trouvees': int(non_trouves.sum()),
+        'doublons_referentiel': index['doublons']
+    }
+    return df_joined, rapport
+
+def aggregate_saham(df_financial, df_referentiel):
+    """
+    Jointure des données financières avec le référentiel agences (index
+    Code_Agence -> Localite), agrégation par (Periode, Localite) et PDM de
+    chaque localité dans sa période. Renvoie (df_agg, rapport de jointure).
+    """
+    df_joined, rapport = join_saham_agences(df_financial, build_agence_index(df_referentiel))
     
-    # ÉTAPE 2 : Agrégation par Localité et Période
+    # Agrégation par Localité et Période
     df_agg = df_joined.groupby(['Periode', 'Localite']).agg({
         'Depots': 'sum',
         'Credits': 'sum'
     }).reset_index()
     
-    # ÉTAPE 3 : Calcul PDM (Part De Marché) par Période
-    # PDM = (Total Dépôts Localité / Total Global Dépôts) × 100
-    
-    # Calculer le total global par période
-    total_depots_par_periode = df_agg.groupby('Periode')['Depots'].sum().reset_index()
-    total_depots_par_periode.columns = ['Periode', 'Total_Global_Depots']
-    
-    # Joindre avec le DataFrame agrégé
-    df_agg = df_agg.merge(total_depots_par_periode, on='Periode')
-    
-    # Calculer PDM
-    df_agg['PDM'] = (df_agg['Depots'] / df_agg['Total_Global_Depots']) * 100
-    
-    # Supprimer la colonne temporaire
-    df_agg = df_agg.drop('Total_Global_Depots', axis=1)
+    # PDM = (Total Dépôts Localité / Total Global Dépôts de la période) × 100
+    df_agg['PDM'] = (df_agg['Depots'] / df_agg.groupby('Periode')['Depots'].transform('sum')) * 100
     
+    return df_agg, rapport
+
+def join_and_aggregate_saham(df_financial, df_referentiel):
+    """
+    Jointure des données financières avec le référentiel agences
+    puis agrégation par localité avec calcul PDM
+    """
+    df_agg, _ = aggregate_saham(df_financial, df_referentiel)
     return df_agg
 
+def show_saham_join_report():
+    """Signale les codes agence absents du référentiel lors de la dernière agrégation."""
+    rapport = st.session_state.get('saham_join_report')
+    if not rapport:
+        return
+    codes = rapport['codes_non_trouves']
+    if codes:
+        apercu = ", ".join(codes[:20]) + (" …" if len(codes) > 20 else "")
+        st.warning(
+            f"⚠️ {len(codes)} code(s) agence absent(s) du référentiel "
+            f"({rapport['lignes_non_trouvees']} ligne(s) sans localité, exclues de l'agrégation) : {apercu}"
+        )
+    if rapport['doublons_referentiel']:
+        st.caption(f"ℹ️ {rapport['doublons_referentiel']} code(s) agence en double dans le référentiel (première localité retenue)")
+
+# Tranches de PDM : <5, [5, 7[, [7, 10[, >=10 (bornes basses des 3 dernières)
+PDM_TRANCHE_BORNES = np.array([5, 7, 10], dtype=float)
+PDM_TRANCHE_LABELS = np.array(['Inf <5%', 'Inf 5-7%', 'Sup 7-10%', 'Sup >10%'], dtype=object)
+
+def classify_saham(df, top_n=25):
+    """
+    Classification vectorisée des localités Saham (nouveau DataFrame) :
+    - Top : 'Top N' pour les localités des N plus gros dépôts, 'Autres' sinon ;
+    - Tranche_PDM : tranche de part de marché (np.searchsorted sur les
+      bornes) ; une PDM infinie (total de place nul) est classée 'Sup >10%',
+      une PDM manquante 'Inf <5%'.
+    """
+    villes_top = top_k_rows(df, 'Depots', top_n)['Localite']
+    pdm = df['PDM'].to_numpy(dtype=float)
+    codes = np.searchsorted(PDM_TRANCHE_BORNES, pdm, side='right')
+    codes[np.isnan(pdm)] = 0
+    
+    return df.assign(
+        Top=np.where(df['Localite'].isin(villes_top), f'Top {top_n}', 'Autres'),
+        Tranche_PDM=PDM_TRANCHE_LABELS[codes]
+    )
+
+
+def get_saham_classification(df, top_n=25, periode=None, source='dashboard'):
+    """
+    classify_saham sur `df` (restreint à `periode` si donnée), mémorisée par
+    (vue appelante `source`, version des données, période, N) : le résultat
+    est recalculé seulement si `df` est un autre objet. Le DataFrame renvoyé
+    est partagé : le copier (copy(deep=False)) avant d'y ajouter des colonnes.
+    """
+    def calcul():
+        df_periode = df if periode is None else df[df['Periode'] == periode]
+        return classify_saham(df_periode, top_n)
+    
+    return memo_view(f'saham_classification_{source}_{periode}_{top_n}', (df,), calcul)
+
 def create_top_visualizations_saham(df):
     """Crée les visualisations Top 25, Top 10, Top 5 pour Saham Bank"""
     
@@ -1217,579 +1887,81 @@ def create_pdm_visualizations_saham(df):
     
     st.dataframe(df_pdm_display, use_container_width=True, hide_index=True, height=400)
 
-def create_dashboard_saham(df_saham, df_bam=None):
+def create_dashboard_structure_saham(df_saham, df_bam, total_depots_bam, total_credits_bam, target_pdm, afficher_millions=True):
     """
-    Dashboard Saham Bank COMPLET avec :
-    1. Calcul Catégorie : Saham Présent / Absent
-    2. Calcul Top : Top 25 localités / Autres  
+    Dashboard structuré avec les 5 sections distinctes :
+    1. Calcul Catégorie (Saham Présent / Absent)
+    2. Calcul Top (Top 25 / Autres)
     3. PDM Saham
     4. Targets Dépôts / Crédits
-    5. Evolution (Target - Montant)
+    5. Evolution
     """
     
-    st.header("🎯 Dashboard Saham Bank")
-    
-    st.markdown("""
-    **Éléments du Dashboard :**
-    - ✅ Calcul Catégorie : Saham Présent / Absent
-    - ✅ Calcul Top : Top 25 localités / Autres
-    - ✅ PDM Saham
-    - ✅ Targets Dépôts / Crédits
-    - ✅ Evolution (Target - Montant Dépôts ou crédits Saham)
-    """)
+    facteur = 1e6  # milliers DH ÷ 1 000 000 = Md
+    unite = "Md"
     
-    # Vérifier données BAM
+    # Villes BAM
     if df_bam is not None:
-        total_depots_place = df_bam['Montant_Depots'].sum()
-        total_credits_place = df_bam['Montant_Credits'].sum()
         villes_bam = set(df_bam['Localite'].unique())
-    elif hasattr(st.session_state, 'total_depots_bam') and st.session_state.total_depots_bam is not None:
-        total_depots_place = st.session_state.total_depots_bam
-        total_credits_place = st.session_state.total_credits_bam
-        villes_bam = set()
     else:
-        st.warning("⚠️ Données BAM non disponibles. Importez d'abord les données BAM.")
-        st.info("Pour utiliser ce dashboard, allez dans 'Import & Traitement' → Onglet 'Import BAM'")
-        return
+        villes_bam = set()
     
-    st.divider()
+    # Villes Saham
+    villes_saham = set(df_saham['Localite'].unique())
+    villes_absentes = villes_bam - villes_saham if villes_bam else set()
+    
+    # Top 25 et tranches PDM (déjà présentes si `df_saham` vient du dashboard)
+    if 'Tranche_PDM' not in df_saham.columns:
+        df_saham = get_saham_classification(df_saham, 25, source='structure')
     
     # ==================================================================
-    # SAISIE DU TARGET PDM
+    # SECTION 1 : CALCUL CATÉGORIE - SAHAM PRÉSENT / ABSENT
     # ==================================================================
     
-    st.subheader("🎯 Définir le Target PDM")
+    st.header("1️⃣ Calcul Catégorie : Saham Présent / Absent")
+    
+    col1, col2, col3 = st.columns(3)
     
-    col1, col2, col3 = st.columns([2, 1, 1])
+    # Saham Présent
+    nb_saham_present = len(villes_saham)
+    depots_saham_present = df_saham['Depots'].sum()
+    credits_saham_present = df_saham['Credits'].sum()
+    pdm_saham_present = (depots_saham_present / total_depots_bam) * 100 if total_depots_bam > 0 else 0
     
     with col1:
-        target_pdm = st.slider(
-            "Target PDM Souhaité (%)",
-            min_value=1.0,
-            max_value=20.0,
-            value=8.0,
-            step=0.5,
-            help="Pourcentage de part de marché souhaité"
-        )
+        st.markdown("### ✅ Saham Présent")
+        st.metric("Nombre de villes", nb_saham_present)
+        st.metric("Dépôts", f"{depots_saham_present/facteur:,.2f} {unite}")
+        st.metric("Crédits", f"{credits_saham_present/facteur:,.2f} {unite}")
+        st.metric("PDM", f"{pdm_saham_present:.2f}%")
+        
+        with st.expander("🔍 Voir le calcul"):
+            st.code(f"""
+Comptage des villes dans Saham :
+Nombre = {nb_saham_present}
+
+Total Dépôts :
+Somme = {depots_saham_present:,.0f}
+
+PDM = (Dépôts / Total Marché) × 100
+PDM = ({depots_saham_present:,.0f} / {total_depots_bam:,.0f}) × 100
+PDM = {pdm_saham_present:.2f}%
+            """)
+    
+    # Saham Absent
+    nb_saham_absent = len(villes_absentes)
     
     with col2:
-        st.metric("Target PDM", f"{target_pdm:.1f}%")
-    
-    with col3:
-        # Option pour afficher en millions
-        afficher_millions = True  # Toujours en Milliards (Md)
-    
-    st.divider()
-    
-    # ==================================================================
-    # FILTRAGE PAR PÉRIODE
-    # ==================================================================
-    
-    if 'Periode' in df_saham.columns:
-        periodes = sorted(df_saham['Periode'].unique())
-        periode_selectionnee = st.selectbox(
-            "📅 Période d'analyse",
-            options=periodes,
-            format_func=lambda x: str(x)
-        )
-        df_filtered = df_saham[df_saham['Periode'] == periode_selectionnee].copy()
-    else:
-        df_filtered = df_saham.copy()
-    
-    # ==================================================================
-    # 1. CALCUL CATÉGORIE : SAHAM PRÉSENT / ABSENT
-    # ==================================================================
-    
-    # Villes Saham Présent
-    villes_saham = set(df_filtered['Localite'].unique())
-    
-    # Villes Saham Absent (dans BAM mais pas dans Saham)
-    if len(villes_bam) > 0:
-        villes_absentes = villes_bam - villes_saham
-        nb_villes_absentes = len(villes_absentes)
-    else:
-        nb_villes_absentes = 0
-        villes_absentes = set()
-    
-    # Marquer les villes présentes
-    df_filtered['Categorie'] = 'Saham Présent'
-    
-    # ==================================================================
-    # 2. CALCUL TOP : TOP 25 / AUTRES
-    # ==================================================================
-    
-    # Trier par dépôts et prendre le Top 25
-    df_sorted = df_filtered.sort_values('Depots', ascending=False)
-    top_25_villes = df_sorted.head(25)['Localite'].tolist()
-    
-    df_filtered['Top'] = df_filtered['Localite'].apply(
-        lambda x: 'Top 25' if x in top_25_villes else 'Autres'
-    )
-    
-    # ==================================================================
-    # 3. PDM SAHAM (TRANCHES)
-    # ==================================================================
-    
-    def get_tranche_pdm(pdm):
-        if pdm >= 10:
-            return 'Sup >10%'
-        elif pdm >= 7:
-            return 'Sup 7-10%'
-        elif pdm >= 5:
-            return 'Inf 5-7%'
-        else:
-            return 'Inf <5%'
-    
-    df_filtered['Tranche_PDM'] = df_filtered['PDM'].apply(get_tranche_pdm)
-    
-    # ==================================================================
-    # 4. TARGETS DÉPÔTS / CRÉDITS
-    # ==================================================================
-    
-    # Target basé sur le total marché BAM
-    target_depots_global = total_depots_place * (target_pdm / 100)
-    target_credits_global = total_credits_place * (target_pdm / 100)
-    
-    # Pour chaque ville : Target proportionnel au poids dans le marché
-    # Simplification : même target PDM pour toutes les villes
-    df_filtered['Target_Depots'] = total_depots_place * (target_pdm / 100) / len(df_filtered)
-    df_filtered['Target_Credits'] = total_credits_place * (target_pdm / 100) / len(df_filtered)
-    
-    # ==================================================================
-    # 5. EVOLUTION (TARGET - MONTANT)
-    # ==================================================================
-    
-    df_filtered['Evolution_Depots'] = df_filtered['Target_Depots'] - df_filtered['Depots']
-    df_filtered['Evolution_Credits'] = df_filtered['Target_Credits'] - df_filtered['Credits']
-    
-    # ==================================================================
-    # MÉTRIQUES GLOBALES
-    # ==================================================================
-    
-    st.subheader("📊 Vue d'Ensemble")
-    
-    total_depots_saham = df_filtered['Depots'].sum()
-    total_credits_saham = df_filtered['Credits'].sum()
-    pdm_actuelle_depots = (total_depots_saham / total_depots_place) * 100
-    pdm_actuelle_credits = (total_credits_saham / total_credits_place) * 100
-    
-    # Facteur d'affichage
-    facteur = 1e6  # milliers DH ÷ 1 000 000 = Md
-    unite = "Md"
-    
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.metric(
-            "Dépôts Saham",
-            f"{total_depots_saham/facteur:,.2f} {unite}",
-            help="Total des dépôts Saham Bank"
-        )
-    
-    with col2:
-        st.metric(
-            "Dépôts Place (BAM)",
-            f"{total_depots_place/facteur:,.2f} {unite}",
-            help="Total du marché"
-        )
-    
-    with col3:
-        st.metric(
-            "PDM Actuelle",
-            f"{pdm_actuelle_depots:.2f}%",
-            delta=f"{target_pdm - pdm_actuelle_depots:.2f}%",
-            help="Part de marché actuelle vs target"
-        )
-    
-    with col4:
-        gap_global = target_depots_global - total_depots_saham
-        st.metric(
-            "Gap Global",
-            f"{gap_global/facteur:,.2f} {unite}",
-            delta_color="inverse",
-            help="Montant à combler pour atteindre le target"
-        )
-    
-    st.divider()
-    
-    # ==================================================================
-    
-    # ==================================================================
-    # DASHBOARD STRUCTURÉ - 5 SECTIONS
-    # ==================================================================
-    
-    st.divider()
-    st.title("📊 Dashboard Détaillé")
-    
-    # Appeler la fonction de dashboard structuré
-    create_dashboard_structure_saham(
-        df_filtered,
-        st.session_state.combined_data_bam if st.session_state.combined_data_bam is not None else None,
-        total_depots_place,
-        total_credits_place,
-        target_pdm,
-        afficher_millions
-    )
-    
-    st.divider()
-    
-    # TABLEAU RÉCAPITULATIF - COMME DANS L'IMAGE
-    # ==================================================================
-    
-    st.subheader("📋 Tableau Récapitulatif")
-    
-    # Toggle pour choisir entre vue normale et interactive
-    col_toggle1, col_toggle2 = st.columns([3, 1])
-    
-    with col_toggle2:
-        mode_interactif = st.checkbox(
-            "🔍 Mode Interactif", 
-            value=False,
-            help="Activez pour voir les détails de calcul de chaque ligne en cliquant dessus"
-        )
-    
-    if mode_interactif:
-        # AFFICHER VERSION INTERACTIVE
-        tableau_recapitulatif_interactif(
-            df_filtered, 
-            total_depots_place, 
-            total_credits_place, 
-            target_pdm, 
-            afficher_millions,
-            nb_villes_absentes
-        )
-    else:
-        # AFFICHER VERSION NORMALE (tableau statique)
-    
-        # Créer les lignes du tableau
-        tableau_data = []
-    
-        # TOP 25 avec tranches PDM
-        for tranche in ['Sup >10%', 'Sup 7-10%', 'Inf 5-7%', 'Inf <5%']:
-            df_ligne = df_filtered[
-                (df_filtered['Top'] == 'Top 25') & 
-                (df_filtered['Tranche_PDM'] == tranche)
-            ]
-        
-            if len(df_ligne) > 0:
-                tableau_data.append({
-                    'Catégorie': 'Saham Présent',
-                    'Top': 'Top 25',
-                    'PDM Saham': tranche,
-                    'Nombre de VILLE': len(df_ligne),
-                    'Somme DEPOTS SAHAM BANK': df_ligne['Depots'].sum(),
-                    'Somme DEPOTS PLACE': total_depots_place,
-                    'Somme PDM': (df_ligne['Depots'].sum() / total_depots_place) * 100,
-                    'Somme Depots Target': df_ligne['Target_Depots'].sum(),
-                    'Evolution': df_ligne['Evolution_Depots'].sum()
-                })
-    
-        # Total Top 25
-        df_top25 = df_filtered[df_filtered['Top'] == 'Top 25']
-        if len(df_top25) > 0:
-            tableau_data.append({
-                'Catégorie': 'Total Top 25',
-                'Top': '',
-                'PDM Saham': 'Autres',
-                'Nombre de VILLE': len(df_top25),
-                'Somme DEPOTS SAHAM BANK': df_top25['Depots'].sum(),
-                'Somme DEPOTS PLACE': total_depots_place,
-                'Somme PDM': (df_top25['Depots'].sum() / total_depots_place) * 100,
-                'Somme Depots Target': df_top25['Target_Depots'].sum(),
-                'Evolution': df_top25['Evolution_Depots'].sum()
-            })
-    
-        # Total Saham Présent (Autres)
-        df_autres = df_filtered[df_filtered['Top'] == 'Autres']
-        if len(df_autres) > 0:
-            tableau_data.append({
-                'Catégorie': 'Total Saham Présent',
-                'Top': '',
-                'PDM Saham': 'Autres',
-                'Nombre de VILLE': len(df_filtered),
-                'Somme DEPOTS SAHAM BANK': df_filtered['Depots'].sum(),
-                'Somme DEPOTS PLACE': total_depots_place,
-                'Somme PDM': (df_filtered['Depots'].sum() / total_depots_place) * 100,
-                'Somme Depots Target': df_filtered['Target_Depots'].sum(),
-                'Evolution': df_filtered['Evolution_Depots'].sum()
-            })
-    
-        # Saham Absent
-        if nb_villes_absentes > 0:
-            tableau_data.append({
-                'Catégorie': 'Total Saham Absent',
-                'Top': '',
-                'PDM Saham': 'Autres',
-                'Nombre de VILLE': nb_villes_absentes,
-                'Somme DEPOTS SAHAM BANK': 0,
-                'Somme DEPOTS PLACE': total_depots_place,
-                'Somme PDM': 0.0,
-                'Somme Depots Target': 0,
-                'Evolution': 0
-            })
-    
-        # Total Général
-        tableau_data.append({
-            'Catégorie': 'Total général',
-            'Top': '',
-            'PDM Saham': '',
-            'Nombre de VILLE': len(df_filtered) + nb_villes_absentes,
-            'Somme DEPOTS SAHAM BANK': df_filtered['Depots'].sum(),
-            'Somme DEPOTS PLACE': total_depots_place,
-            'Somme PDM': (df_filtered['Depots'].sum() / total_depots_place) * 100,
-            'Somme Depots Target': target_depots_global,
-            'Evolution': target_depots_global - df_filtered['Depots'].sum()
-        })
-    
-        # Créer le DataFrame
-        df_tableau = pd.DataFrame(tableau_data)
-    
-        # Formater pour affichage
-        df_display = df_tableau.copy()
-    
-        df_display['Somme DEPOTS SAHAM BANK'] = df_display['Somme DEPOTS SAHAM BANK'].apply(
-            lambda x: f"{x/facteur:,.2f}" if afficher_millions else f"{x:,.0f}"
-        )
-        df_display['Somme DEPOTS PLACE'] = df_display['Somme DEPOTS PLACE'].apply(
-            lambda x: f"{x/facteur:,.2f}" if afficher_millions else f"{x:,.0f}"
-        )
-        df_display['Somme PDM'] = df_display['Somme PDM'].apply(lambda x: f"{x:.1f}%")
-        df_display['Somme Depots Target'] = df_display['Somme Depots Target'].apply(
-            lambda x: f"{x/facteur:,.2f}" if afficher_millions else f"{x:,.0f}"
-        )
-        df_display['Evolution'] = df_display['Evolution'].apply(
-            lambda x: f"{x/facteur:,.2f}" if afficher_millions else f"{x:,.0f}"
-        )
-    
-        # Afficher le tableau
-    st.dataframe(df_display, use_container_width=True, hide_index=True)
-    
-    # ==================================================================
-    # RÉSULTATS ATTENDUS
-    # ==================================================================
-    
-    st.divider()
-    st.subheader("✅ Résultats avec vos Données")
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("**📊 Statistiques :**")
-        st.write(f"- Villes Saham Présent : **{len(df_filtered)}**")
-        st.write(f"- Villes Saham Absent : **{nb_villes_absentes}**")
-        st.write(f"- Total Général : **{len(df_filtered) + nb_villes_absentes}**")
-        st.write(f"- Villes Top 25 : **{len(df_top25)}**")
-    
-    with col2:
-        st.markdown("**💰 Montants :**")
-        st.write(f"- Total Dépôts Saham : **{total_depots_saham/facteur:,.2f} {unite}**")
-        st.write(f"- Total Dépôts Place : **{total_depots_place/facteur:,.2f} {unite}**")
-        st.write(f"- PDM Actuelle : **{pdm_actuelle_depots:.2f}%**")
-        st.write(f"- Target PDM : **{target_pdm:.1f}%**")
-    
-    # ==================================================================
-    # DÉTAILS PAR VILLE
-    # ==================================================================
-    
-    st.divider()
-    st.subheader("🏙️ Détails par Ville")
-    
-    # Préparer l'affichage
-    df_detail = df_filtered[[
-        'Localite', 'Top', 'Tranche_PDM', 'Depots', 'Credits',
-        'PDM', 'Target_Depots', 'Evolution_Depots'
-    ]].copy()
-    
-    df_detail = df_detail.sort_values('Depots', ascending=False)
-    
-    df_detail.columns = [
-        'Ville', 'Catégorie', 'Tranche PDM', 'Dépôts', 'Crédits',
-        'PDM (%)', 'Target Dépôts', 'Evolution'
-    ]
-    
-    # Formater
-    df_detail['Dépôts'] = df_detail['Dépôts'].apply(
-        lambda x: f"{x/facteur:,.2f}" if afficher_millions else f"{x:,.0f}"
-    )
-    df_detail['Crédits'] = df_detail['Crédits'].apply(
-        lambda x: f"{x/facteur:,.2f}" if afficher_millions else f"{x:,.0f}"
-    )
-    df_detail['PDM (%)'] = df_detail['PDM (%)'].apply(lambda x: f"{x:.2f}%")
-    df_detail['Target Dépôts'] = df_detail['Target Dépôts'].apply(
-        lambda x: f"{x/facteur:,.2f}" if afficher_millions else f"{x:,.0f}"
-    )
-    df_detail['Evolution'] = df_detail['Evolution'].apply(
-        lambda x: f"{x/facteur:,.2f}" if afficher_millions else f"{x:,.0f}"
-    )
-    
-    st.dataframe(df_detail, use_container_width=True, hide_index=True, height=400)
-
-    
-    # ==================================================================
-    # VERSION INTERACTIVE - DÉTAILS PAR VILLE
-    # ==================================================================
-    
-    st.divider()
-    
-    # Reconstruire df_joined pour avoir les détails par agence
-    if st.session_state.saham_financial is not None and st.session_state.saham_referentiel is not None:
-        
-        # Normaliser et joindre
-        df_fin_temp = normalize_financial_columns(st.session_state.saham_financial.copy())
-        df_ref_temp = normalize_referentiel_columns(st.session_state.saham_referentiel.copy())
-        
-        df_fin_temp = clean_numeric_saham(df_fin_temp, ['Depots', 'Credits'])
-        df_fin_temp['Code_Agence'] = df_fin_temp['Code_Agence'].astype(str).str.strip()
-        df_ref_temp['Code_Agence'] = df_ref_temp['Code_Agence'].astype(str).str.strip()
-        
-        df_joined_details = df_fin_temp.merge(
-            df_ref_temp[['Code_Agence', 'Localite']], 
-            on='Code_Agence', 
-            how='left'
-        )
-        
-        # Filtrer par période si nécessaire
-        if 'Periode' in df_joined_details.columns and 'Periode' in df_filtered.columns:
-            periode = df_filtered['Periode'].iloc[0]
-            df_joined_details = df_joined_details[df_joined_details['Periode'] == periode]
-        
-        # Appeler la fonction de détails interactifs
-        afficher_details_ville_interactive(
-            df_filtered, 
-            df_joined_details, 
-            total_depots_place, 
-            total_credits_place, 
-            target_pdm, 
-            afficher_millions
-        )
-    else:
-        st.warning("Données détaillées non disponibles. Importez les fichiers Saham Bank pour voir les détails par agence.")
-
-    
-    # ==================================================================
-    # GRAPHIQUES
-    # ==================================================================
-    
-    st.divider()
-    st.subheader("📊 Visualisations")
-    
-    tab1, tab2 = st.tabs(["Répartition par Catégorie", "Top 10 Villes"])
-    
-    with tab1:
-        # Pie chart des catégories
-        fig_pie = go.Figure(data=[go.Pie(
-            labels=['Top 25', 'Autres', 'Saham Absent'],
-            values=[
-                len(df_top25),
-                len(df_autres),
-                nb_villes_absentes
-            ],
-            hole=0.4
-        )])
-        
-        fig_pie.update_layout(
-            title="Répartition des Villes par Catégorie",
-            height=400
-        )
-        
-        st.plotly_chart(fig_pie, use_container_width=True)
-    
-    with tab2:
-        # Top 10 villes
-        df_top10 = df_filtered.nlargest(10, 'Depots')
-        
-        fig_bar = px.bar(
-            df_top10,
-            x='Depots',
-            y='Localite',
-            orientation='h',
-            title="Top 10 Villes par Dépôts",
-            labels={'Depots': f'Dépôts ({unite})', 'Localite': 'Ville'}
-        )
-        
-        fig_bar.update_layout(height=500, yaxis={'categoryorder':'total ascending'})
-        
-        st.plotly_chart(fig_bar, use_container_width=True)
-
-def create_dashboard_structure_saham(df_saham, df_bam, total_depots_bam, total_credits_bam, target_pdm, afficher_millions=True):
-    """
-    Dashboard structuré avec les 5 sections distinctes :
-    1. Calcul Catégorie (Saham Présent / Absent)
-    2. Calcul Top (Top 25 / Autres)
-    3. PDM Saham
-    4. Targets Dépôts / Crédits
-    5. Evolution
-    """
-    
-    facteur = 1e6  # milliers DH ÷ 1 000 000 = Md
-    unite = "Md"
-    
-    # Villes BAM
-    if df_bam is not None:
-        villes_bam = set(df_bam['Localite'].unique())
-    else:
-        villes_bam = set()
-    
-    # Villes Saham
-    villes_saham = set(df_saham['Localite'].unique())
-    villes_absentes = villes_bam - villes_saham if villes_bam else set()
-    
-    # Top 25
-    df_sorted = df_saham.sort_values('Depots', ascending=False)
-    top_25_villes = df_sorted.head(25)['Localite'].tolist()
-    
-    df_saham['Top'] = df_saham['Localite'].apply(
-        lambda x: 'Top 25' if x in top_25_villes else 'Autres'
-    )
-    
-    # ==================================================================
-    # SECTION 1 : CALCUL CATÉGORIE - SAHAM PRÉSENT / ABSENT
-    # ==================================================================
-    
-    st.header("1️⃣ Calcul Catégorie : Saham Présent / Absent")
-    
-    col1, col2, col3 = st.columns(3)
-    
-    # Saham Présent
-    nb_saham_present = len(villes_saham)
-    depots_saham_present = df_saham['Depots'].sum()
-    credits_saham_present = df_saham['Credits'].sum()
-    pdm_saham_present = (depots_saham_present / total_depots_bam) * 100 if total_depots_bam > 0 else 0
-    
-    with col1:
-        st.markdown("### ✅ Saham Présent")
-        st.metric("Nombre de villes", nb_saham_present)
-        st.metric("Dépôts", f"{depots_saham_present/facteur:,.2f} {unite}")
-        st.metric("Crédits", f"{credits_saham_present/facteur:,.2f} {unite}")
-        st.metric("PDM", f"{pdm_saham_present:.2f}%")
-        
-        with st.expander("🔍 Voir le calcul"):
-            st.code(f"""
-Comptage des villes dans Saham :
-Nombre = {nb_saham_present}
-
-Total Dépôts :
-Somme = {depots_saham_present:,.0f}
-
-PDM = (Dépôts / Total Marché) × 100
-PDM = ({depots_saham_present:,.0f} / {total_depots_bam:,.0f}) × 100
-PDM = {pdm_saham_present:.2f}%
-            """)
-    
-    # Saham Absent
-    nb_saham_absent = len(villes_absentes)
-    
-    with col2:
-        st.markdown("### ❌ Saham Absent")
-        st.metric("Nombre de villes", nb_saham_absent)
-        st.metric("Dépôts", "0")
-        st.metric("Crédits", "0")
-        st.metric("PDM", "0%")
-        
-        if nb_saham_absent > 0:
-            with st.expander("📋 Liste des villes absentes"):
-                for ville in sorted(villes_absentes):
-                    st.write(f"- {ville}")
+        st.markdown("### ❌ Saham Absent")
+        st.metric("Nombre de villes", nb_saham_absent)
+        st.metric("Dépôts", "0")
+        st.metric("Crédits", "0")
+        st.metric("PDM", "0%")
+        
+        if nb_saham_absent > 0:
+            with st.expander("📋 Liste des villes absentes"):
+                for ville in sorted(villes_absentes):
+                    st.write(f"- {ville}")
     
     # Total
     nb_total = nb_saham_present + nb_saham_absent
@@ -1877,18 +2049,7 @@ Dépôts Total Saham = {depots_saham_present:,.0f}
     
     st.markdown("### Part De Marché par Tranche")
     
-    # Définir les tranches
-    def get_tranche_pdm(pdm):
-        if pdm >= 10:
-            return 'Sup >10%'
-        elif pdm >= 7:
-            return 'Sup 7-10%'
-        elif pdm >= 5:
-            return 'Inf 5-7%'
-        else:
-            return 'Inf <5%'
-    
-    df_saham['Tranche_PDM'] = df_saham['PDM'].apply(get_tranche_pdm)
+    # Tranches (colonne Tranche_PDM de get_saham_classification)
     
     # Calculer par tranche
     tranches_data = []
@@ -2098,6 +2259,30 @@ Statut : {"À COMBLER" if evolution_credits > 0 else "TARGET DÉPASSÉ ✅"}
     st.plotly_chart(fig_evolution, use_container_width=True)
 
 
+def summarize_saham_categories(df_classe, total_depots_place, target_pdm):
+    """
+    Agrégation unique du tableau récapitulatif par (Categorie, Top,
+    Tranche_PDM) : nombre de villes, dépôts, crédits, puis PDM, target
+    (proportionnel au nombre de villes) et évolution en colonnes.
+    
+    Renvoie (resume, positions) où positions associe à chaque groupe les
+    positions de ses villes dans `df_classe` (détail d'une catégorie).
+    """
+    if 'Categorie' not in df_classe.columns:
+        df_classe = df_classe.assign(Categorie='Saham Présent')
+    
+    groupes = df_classe.groupby(['Categorie', 'Top', 'Tranche_PDM'], sort=False)
+    resume = groupes.agg(
+        nb_villes=('Localite', 'size'),
+        depots=('Depots', 'sum'),
+        credits=('Credits', 'sum')
+    )
+    resume['pdm'] = resume['depots'] / total_depots_place * 100
+    resume['target'] = total_depots_place * (target_pdm / 100) * resume['nb_villes'] / max(len(df_classe), 1)
+    resume['evolution'] = resume['target'] - resume['depots']
+    return resume, groupes.indices
+
+
 def tableau_recapitulatif_interactif(df_filtered, total_depots_place, total_credits_place, target_pdm, afficher_millions=True, nb_villes_absentes=0):
     """
     Tableau récapitulatif INTERACTIF avec détails de calcul cliquables
@@ -2110,107 +2295,52 @@ def tableau_recapitulatif_interactif(df_filtered, total_depots_place, total_cred
     facteur = 1e6  # milliers DH ÷ 1 000 000 = Md
     unite = "Md"
     
-    # Trier et prendre Top 25
-    df_sorted = df_filtered.sort_values('Depots', ascending=False)
-    top_25_villes = df_sorted.head(25)['Localite'].tolist()
-    
-    df_filtered['Top'] = df_filtered['Localite'].apply(
-        lambda x: 'Top 25' if x in top_25_villes else 'Autres'
-    )
-    
-    # Fonction pour tranche PDM
-    def get_tranche_pdm(pdm):
-        if pdm >= 10:
-            return 'Sup >10%'
-        elif pdm >= 7:
-            return 'Sup 7-10%'
-        elif pdm >= 5:
-            return 'Inf 5-7%'
-        else:
-            return 'Inf <5%'
-    
-    df_filtered['Tranche_PDM'] = df_filtered['PDM'].apply(get_tranche_pdm)
+    # Top 25 et tranches PDM (déjà présentes si `df_filtered` vient du dashboard)
+    if 'Tranche_PDM' not in df_filtered.columns:
+        df_filtered = get_saham_classification(df_filtered, 25, source='recap')
     
     # ==================================================================
-    # CRÉER LES CATÉGORIES INTERACTIVES
+    # CRÉER LES CATÉGORIES INTERACTIVES (une seule agrégation groupée)
     # ==================================================================
     
+    resume, positions = summarize_saham_categories(df_filtered, total_depots_place, target_pdm)
+    localites = df_filtered['Localite'].to_numpy()
+    
+    def categorie_recap(label, categorie, top, tranche, groupes):
+        lignes = resume.loc[groupes]
+        return {
+            'label': label,
+            'categorie': categorie,
+            'top': top,
+            'tranche': tranche,
+            'nb_villes': int(lignes['nb_villes'].sum()),
+            'depots': lignes['depots'].sum(),
+            'credits': lignes['credits'].sum(),
+            'depots_place': total_depots_place,
+            'pdm': lignes['pdm'].sum(),
+            'target': lignes['target'].sum(),
+            'evolution': lignes['evolution'].sum(),
+            'groupes': groupes
+        }
+    
     categories = []
+    groupes_top25 = [cle for cle in resume.index if cle[1] == 'Top 25']
     
     # TOP 25 avec tranches PDM
     for tranche in ['Sup >10%', 'Sup 7-10%', 'Inf 5-7%', 'Inf <5%']:
-        df_ligne = df_filtered[
-            (df_filtered['Top'] == 'Top 25') & 
-            (df_filtered['Tranche_PDM'] == tranche)
-        ]
-        
-        if len(df_ligne) > 0:
-            depots_total = df_ligne['Depots'].sum()
-            credits_total = df_ligne['Credits'].sum()
-            pdm_total = (depots_total / total_depots_place) * 100
-            target_total = total_depots_place * (target_pdm / 100) * (len(df_ligne) / len(df_filtered))
-            evolution = target_total - depots_total
-            
-            categories.append({
-                'label': f"Saham Présent | Top 25 | {tranche}",
-                'categorie': 'Saham Présent',
-                'top': 'Top 25',
-                'tranche': tranche,
-                'nb_villes': len(df_ligne),
-                'depots': depots_total,
-                'credits': credits_total,
-                'depots_place': total_depots_place,
-                'pdm': pdm_total,
-                'target': target_total,
-                'evolution': evolution,
-                'villes': df_ligne['Localite'].tolist()
-            })
+        groupes = [cle for cle in groupes_top25 if cle[2] == tranche]
+        if groupes:
+            categories.append(categorie_recap(f"Saham Présent | Top 25 | {tranche}", 'Saham Présent', 'Top 25', tranche, groupes))
     
     # Total Top 25
-    df_top25 = df_filtered[df_filtered['Top'] == 'Top 25']
-    if len(df_top25) > 0:
-        depots_total = df_top25['Depots'].sum()
-        credits_total = df_top25['Credits'].sum()
-        pdm_total = (depots_total / total_depots_place) * 100
-        target_total = total_depots_place * (target_pdm / 100) * (len(df_top25) / len(df_filtered))
-        evolution = target_total - depots_total
-        
-        categories.append({
-            'label': "Total Top 25",
-            'categorie': 'Total Top 25',
-            'top': '',
-            'tranche': 'Autres',
-            'nb_villes': len(df_top25),
-            'depots': depots_total,
-            'credits': credits_total,
-            'depots_place': total_depots_place,
-            'pdm': pdm_total,
-            'target': target_total,
-            'evolution': evolution,
-            'villes': df_top25['Localite'].tolist()
-        })
+    if groupes_top25:
+        categories.append(categorie_recap("Total Top 25", 'Total Top 25', '', 'Autres', groupes_top25))
     
-    # Total Saham Présent
-    depots_total = df_filtered['Depots'].sum()
-    credits_total = df_filtered['Credits'].sum()
-    pdm_total = (depots_total / total_depots_place) * 100
-    target_total = total_depots_place * (target_pdm / 100)
-    evolution = target_total - depots_total
-    
-    categories.append({
-        'label': "Total Saham Présent",
-        'categorie': 'Total Saham Présent',
-        'top': '',
-        'tranche': 'Autres',
-        'nb_villes': len(df_filtered),
-        'depots': depots_total,
-        'credits': credits_total,
-        'depots_place': total_depots_place,
-        'pdm': pdm_total,
-        'target': target_total,
-        'evolution': evolution,
-        'villes': df_filtered['Localite'].tolist()
-    })
+    # Total Saham Présent (target global, non proportionnel)
+    total_present = categorie_recap("Total Saham Présent", 'Total Saham Présent', '', 'Autres', list(resume.index))
+    total_present['target'] = total_depots_place * (target_pdm / 100)
+    total_present['evolution'] = total_present['target'] - total_present['depots']
+    categories.append(total_present)
     
     # Saham Absent
     if nb_villes_absentes > 0:
@@ -2226,24 +2356,17 @@ def tableau_recapitulatif_interactif(df_filtered, total_depots_place, total_cred
             'pdm': 0.0,
             'target': 0,
             'evolution': 0,
-            'villes': []
+            'groupes': []
         })
     
     # Total Général
-    categories.append({
-        'label': "Total Général",
-        'categorie': 'Total Général',
-        'top': '',
-        'tranche': '',
-        'nb_villes': len(df_filtered) + nb_villes_absentes,
-        'depots': df_filtered['Depots'].sum(),
-        'credits': df_filtered['Credits'].sum(),
-        'depots_place': total_depots_place,
-        'pdm': (df_filtered['Depots'].sum() / total_depots_place) * 100,
-        'target': target_total,
-        'evolution': evolution,
-        'villes': df_filtered['Localite'].tolist()
-    })
+    categories.append(dict(
+        total_present,
+        label="Total Général",
+        categorie='Total Général',
+        tranche='',
+        nb_villes=total_present['nb_villes'] + nb_villes_absentes
+    ))
     
     # ==================================================================
     # AFFICHER CHAQUE CATÉGORIE COMME EXPANDER CLIQUABLE
@@ -2277,9 +2400,11 @@ cette catégorie
 Résultat = {cat['nb_villes']}
                 """)
                 
-                if len(cat['villes']) > 0 and cat['nb_villes'] <= 10:
+                if cat['groupes'] and cat['nb_villes'] <= 10:
+                    # Villes lues via l'index des groupes (sans re-filtrer les données)
+                    lignes_villes = np.sort(np.concatenate([positions[cle] for cle in cat['groupes']]))
                     st.markdown("**Liste :**")
-                    for ville in cat['villes']:
+                    for ville in localites[lignes_villes]:
                         st.write(f"- {ville}")
             
             # COLONNE 2 : DÉPÔTS SAHAM
@@ -2386,138 +2511,203 @@ Statut : {statut}
                     st.write(f"**Dépassement :** {abs(cat['evolution'])/facteur:,.2f} {unite}")
 
 
-def afficher_details_ville_interactive(df_saham, df_joined, total_depots_place, total_credits_place, target_pdm, afficher_millions=True):
+# Nombre de villes par page dans le détail par ville
+VILLES_PAR_PAGE = 20
+
+def build_saham_joined_details(df_financial, df_referentiel):
+    """Données financières Saham par agence, jointes à leur localité (sans agrégation)."""
+    df_joined, _ = join_saham_agences(df_financial, build_agence_index(df_referentiel))
+    return df_joined
+
+
+def get_agences_index(df_joined, par_periode=False):
     """
-    Tableau détaillé interactif avec possibilité de voir le détail des calculs
+    Index des agences par localité (ou par (Periode, Localite)) :
+    {clé: positions des lignes dans df_joined}, construit une fois par
+    version des données jointes.
+    """
+    cles = ['Periode', 'Localite'] if par_periode else 'Localite'
+    return memo_view(
+        f'saham_agences_index_{par_periode}', (df_joined,),
+        lambda: df_joined.groupby(cles, sort=False, dropna=False).indices
+    )
+
+
+def afficher_details_ville_interactive(df_saham, df_joined, total_depots_place, total_credits_place, target_pdm, afficher_millions=True, periode=None):
+    """
+    Tableau détaillé interactif avec possibilité de voir le détail des calculs.
+    Les villes sont listées par page ; seul le détail de la ville choisie est
+    calculé, ses agences étant lues dans l'index par localité.
     """
     
     st.subheader("🏙️ Détails par Ville - Interactif")
     
-    st.info("👆 Cliquez sur une ville pour voir le détail des calculs et la provenance des montants")
+    st.info("👆 Choisissez une ville pour voir le détail des calculs et la provenance des montants")
     
     facteur = 1e6  # milliers DH ÷ 1 000 000 = Md
     unite = "Md"
     
-    # Trier par dépôts
-    df_sorted = df_saham.sort_values('Depots', ascending=False).reset_index(drop=True)
+    # Trier par dépôts (l'index donne le rang)
+    ordre = np.argsort(-df_saham['Depots'].to_numpy(dtype=np.float64), kind='stable')
+    df_sorted = df_saham.iloc[ordre].reset_index(drop=True)
+    index_agences = get_agences_index(df_joined, par_periode=periode is not None)
+    
+    # ===== LISTE PAGINÉE DES VILLES =====
+    col_r, col_p = st.columns([3, 1])
+    with col_r:
+        recherche = st.text_input("🔍 Rechercher une ville", key="recherche_ville_details")
+    
+    df_liste = df_sorted
+    if recherche:
+        df_liste = df_sorted[df_sorted['Localite'].astype(str).str.contains(recherche, case=False, regex=False, na=False)]
+    
+    nb_pages = max(1, -(-len(df_liste) // VILLES_PAR_PAGE))
+    with col_p:
+        page = st.number_input("Page", min_value=1, max_value=nb_pages, value=1, step=1, key="page_villes_details")
+    page = min(int(page), nb_pages)
+    df_page = df_liste.iloc[(page - 1) * VILLES_PAR_PAGE:page * VILLES_PAR_PAGE]
     
-    # Pour chaque ville, créer un expander
-    for idx, row in df_sorted.iterrows():
-        ville = row['Localite']
-        depots = row['Depots']
-        credits = row['Credits']
-        pdm = row['PDM']
+    if len(df_page) == 0:
+        st.warning("Aucune ville ne correspond à la recherche")
+        return
+    
+    st.dataframe(
+        pd.DataFrame({
+            'Rang': df_page.index + 1,
+            'Ville': df_page['Localite'],
+            f'Dépôts ({unite})': (df_page['Depots'] / facteur).round(2),
+            f'Crédits ({unite})': (df_page['Credits'] / facteur).round(2),
+            'PDM (%)': df_page['PDM'].round(2)
+        }),
+        hide_index=True,
+        use_container_width=True
+    )
+    st.caption(f"Page {page}/{nb_pages} — {len(df_liste)} ville(s)")
+    
+    rang = st.selectbox(
+        "🏙️ Ville à détailler",
+        options=df_page.index.tolist(),
+        format_func=lambda i: f"{i+1}. {df_sorted.at[i, 'Localite']}",
+        key="ville_details"
+    )
+    
+    # ===== DÉTAIL DE LA VILLE CHOISIE (seul calculé) =====
+    row = df_sorted.loc[rang]
+    ville = row['Localite']
+    depots = row['Depots']
+    credits = row['Credits']
+    pdm = row['PDM']
+    
+    st.markdown(f"### 🏙️ {rang+1}. {ville} - Dépôts: {depots/facteur:,.2f} {unite} | PDM: {pdm:.2f}%")
+    
+    # Agences de cette ville (index par localité, sans filtrer df_joined)
+    cle = (periode, ville) if periode is not None else ville
+    agences_ville = df_joined.iloc[index_agences.get(cle, [])]
+    
+    # Créer 3 colonnes pour les 3 types de détails
+    col1, col2, col3 = st.columns(3)
+    
+    # ===== COLONNE 1 : DÉTAILS DÉPÔTS =====
+    with col1:
+        st.markdown("### 💰 Dépôts")
+        st.metric("Total", f"{depots/facteur:,.2f} {unite}")
+        
+        st.markdown("**Provenance :**")
+        st.markdown(f"*{len(agences_ville)} agence(s)*")
         
-        # Créer un expander pour chaque ville
-        with st.expander(f"🏙️ {idx+1}. {ville} - Dépôts: {depots/facteur:,.2f} {unite} | PDM: {pdm:.2f}%"):
+        # Tableau des agences
+        if len(agences_ville) > 0:
+            agences_detail = agences_ville[['Code_Agence', 'Depots']].copy()
+            agences_detail['Depots'] = agences_detail['Depots'].apply(
+                lambda x: f"{x/facteur:,.2f} {unite}"
+            )
+            agences_detail.columns = ['Agence', 'Dépôts']
             
-            # Récupérer les agences de cette ville
-            agences_ville = df_joined[df_joined['Localite'] == ville]
+            st.dataframe(agences_detail, hide_index=True, use_container_width=True)
             
-            # Créer 3 colonnes pour les 3 types de détails
-            col1, col2, col3 = st.columns(3)
+            # Vérification du total
+            total_calcule = agences_ville['Depots'].sum()
+            st.success(f"✅ Total vérifié : {total_calcule/facteur:,.2f} {unite}")
+    
+    # ===== COLONNE 2 : DÉTAILS CRÉDITS =====
+    with col2:
+        st.markdown("### 💳 Crédits")
+        st.metric("Total", f"{credits/facteur:,.2f} {unite}")
+        
+        st.markdown("**Provenance :**")
+        st.markdown(f"*{len(agences_ville)} agence(s)*")
+        
+        # Tableau des agences
+        if len(agences_ville) > 0:
+            agences_detail_credits = agences_ville[['Code_Agence', 'Credits']].copy()
+            agences_detail_credits['Credits'] = agences_detail_credits['Credits'].apply(
+                lambda x: f"{x/facteur:,.2f} {unite}"
+            )
+            agences_detail_credits.columns = ['Agence', 'Crédits']
             
-            # ===== COLONNE 1 : DÉTAILS DÉPÔTS =====
-            with col1:
-                st.markdown("### 💰 Dépôts")
-                st.metric("Total", f"{depots/facteur:,.2f} {unite}")
-                
-                st.markdown("**Provenance :**")
-                st.markdown(f"*{len(agences_ville)} agence(s)*")
-                
-                # Tableau des agences
-                if len(agences_ville) > 0:
-                    agences_detail = agences_ville[['Code Agence', 'Depots']].copy()
-                    agences_detail['Depots'] = agences_detail['Depots'].apply(
-                        lambda x: f"{x/facteur:,.2f} {unite}"
-                    )
-                    agences_detail.columns = ['Agence', 'Dépôts']
-                    
-                    st.dataframe(agences_detail, hide_index=True, use_container_width=True)
-                    
-                    # Vérification du total
-                    total_calcule = agences_ville['Depots'].sum()
-                    st.success(f"✅ Total vérifié : {total_calcule/facteur:,.2f} {unite}")
+            st.dataframe(agences_detail_credits, hide_index=True, use_container_width=True)
             
-            # ===== COLONNE 2 : DÉTAILS CRÉDITS =====
-            with col2:
-                st.markdown("### 💳 Crédits")
-                st.metric("Total", f"{credits/facteur:,.2f} {unite}")
-                
-                st.markdown("**Provenance :**")
-                st.markdown(f"*{len(agences_ville)} agence(s)*")
-                
-                # Tableau des agences
-                if len(agences_ville) > 0:
-                    agences_detail_credits = agences_ville[['Code Agence', 'Crédits']].copy()
-                    agences_detail_credits['Crédits'] = agences_detail_credits['Crédits'].apply(
-                        lambda x: f"{x/facteur:,.2f} {unite}"
-                    )
-                    agences_detail_credits.columns = ['Agence', 'Crédits']
-                    
-                    st.dataframe(agences_detail_credits, hide_index=True, use_container_width=True)
-                    
-                    # Vérification du total
-                    total_calcule_credits = agences_ville['Crédits'].sum()
-                    st.success(f"✅ Total vérifié : {total_calcule_credits/facteur:,.2f} {unite}")
-            
-            # ===== COLONNE 3 : DÉTAILS PDM ET TARGET =====
-            with col3:
-                st.markdown("### 📊 Calculs")
-                
-                # PDM
-                st.markdown("**Part de Marché (PDM) :**")
-                st.code(f"""
+            # Vérification du total
+            total_calcule_credits = agences_ville['Credits'].sum()
+            st.success(f"✅ Total vérifié : {total_calcule_credits/facteur:,.2f} {unite}")
+    
+    # ===== COLONNE 3 : DÉTAILS PDM ET TARGET =====
+    with col3:
+        st.markdown("### 📊 Calculs")
+        
+        # PDM
+        st.markdown("**Part de Marché (PDM) :**")
+        st.code(f"""
 PDM = (Dépôts Ville / Total Marché) × 100
 
 PDM = ({depots:,.0f} / {total_depots_place:,.0f}) × 100
 
 PDM = {pdm:.4f}%
-                """)
-                
-                st.markdown("---")
-                
-                # Target
-                target_depots = total_depots_place * (target_pdm / 100) / len(df_saham)
-                evolution = target_depots - depots
-                
-                st.markdown("**Target Dépôts :**")
-                st.code(f"""
-Target = Total Marché × Target PDM / Nb Villes
-
-Target = {total_depots_place:,.0f} × {target_pdm}% / {len(df_saham)}
-
-Target = {target_depots:,.2f}
-                """)
-                
-                st.markdown("---")
-                
-                st.markdown("**Évolution :**")
-                if evolution > 0:
-                    st.error(f"Gap à combler : +{evolution/facteur:,.2f} {unite}")
-                else:
-                    st.success(f"Target dépassé : {evolution/facteur:,.2f} {unite}")
-            
-            # ===== RÉSUMÉ =====
-            st.divider()
-            st.markdown("### 📋 Résumé")
-            
-            resume_col1, resume_col2, resume_col3, resume_col4 = st.columns(4)
-            
-            with resume_col1:
-                st.metric("Agences", len(agences_ville))
-            
-            with resume_col2:
-                st.metric("Dépôts", f"{depots/facteur:,.2f} {unite}")
-            
-            with resume_col3:
-                st.metric("PDM", f"{pdm:.2f}%")
-            
-            with resume_col4:
-                if evolution > 0:
-                    st.metric("Gap", f"+{evolution/facteur:,.2f} {unite}", delta_color="inverse")
-                else:
-                    st.metric("Dépassement", f"{abs(evolution)/facteur:,.2f} {unite}", delta_color="normal")
+        """)
+        
+        st.markdown("---")
+        
+        # Target
+        target_depots = total_depots_place * (target_pdm / 100) / len(df_saham)
+        evolution = target_depots - depots
+        
+        st.markdown("**Target Dépôts :**")
+        st.code(f"""
+Target = Total Marché × Target PDM / Nb Villes
+
+Target = {total_depots_place:,.0f} × {target_pdm}% / {len(df_saham)}
+
+Target = {target_depots:,.2f}
+        """)
+        
+        st.markdown("---")
+        
+        st.markdown("**Évolution :**")
+        if evolution > 0:
+            st.error(f"Gap à combler : +{evolution/facteur:,.2f} {unite}")
+        else:
+            st.success(f"Target dépassé : {evolution/facteur:,.2f} {unite}")
+    
+    # ===== RÉSUMÉ =====
+    st.divider()
+    st.markdown("### 📋 Résumé")
+    
+    resume_col1, resume_col2, resume_col3, resume_col4 = st.columns(4)
+    
+    with resume_col1:
+        st.metric("Agences", len(agences_ville))
+    
+    with resume_col2:
+        st.metric("Dépôts", f"{depots/facteur:,.2f} {unite}")
+    
+    with resume_col3:
+        st.metric("PDM", f"{pdm:.2f}%")
+    
+    with resume_col4:
+        if evolution > 0:
+            st.metric("Gap", f"+{evolution/facteur:,.2f} {unite}", delta_color="inverse")
+        else:
+            st.metric("Dépassement", f"{abs(evolution)/facteur:,.2f} {unite}", delta_color="normal")
 
 
 
@@ -2630,13 +2820,8 @@ def viz_top_saham_pro(df_saham, total_depots_bam):
     
     st.divider()
     
-    # Calculer Top N
-    df_sorted = df_saham.sort_values('Depots', ascending=False)
-    top_n_villes = df_sorted.head(top_n)['Localite'].tolist()
-    
-    df_saham['Top'] = df_saham['Localite'].apply(
-        lambda x: f'Top {top_n}' if x in top_n_villes else 'Autres'
-    )
+    # Calculer Top N (classification mémorisée par N)
+    df_saham = get_saham_classification(df_saham, top_n, source='top')
     
     df_top = df_saham[df_saham['Top'] == f'Top {top_n}']
     df_autres = df_saham[df_saham['Top'] == 'Autres']
@@ -2672,8 +2857,8 @@ Total Saham = {depots_saham_total:,.0f}
         
         # Liste des villes du Top N
         with st.expander(f"Liste des {top_n} villes"):
-            for idx, ville in enumerate(top_n_villes, 1):
-                depots_ville = df_saham[df_saham['Localite'] == ville]['Depots'].values[0]
+            df_top_n = top_k_rows(df_saham, 'Depots', top_n)
+            for idx, (ville, depots_ville) in enumerate(zip(df_top_n['Localite'], df_top_n['Depots']), 1):
                 st.write(f"{idx}. {ville} : {depots_ville/1e6:.2f} Md")
     
     with col2:
@@ -2736,18 +2921,8 @@ def viz_pdm_saham_pro(df_saham):
     
     st.header("Part De Marché par Tranche")
     
-    # Définir les tranches
-    def get_tranche_pdm(pdm):
-        if pdm >= 10:
-            return 'Sup >10%'
-        elif pdm >= 7:
-            return 'Sup 7-10%'
-        elif pdm >= 5:
-            return 'Inf 5-7%'
-        else:
-            return 'Inf <5%'
-    
-    df_saham['Tranche_PDM'] = df_saham['PDM'].apply(get_tranche_pdm)
+    # Tranches PDM (classification mémorisée)
+    df_saham = get_saham_classification(df_saham, source='pdm')
     
     # FILTRE : Sélection de la tranche
     tranches_disponibles = df_saham['Tranche_PDM'].value_counts().index.tolist()
@@ -3087,169 +3262,965 @@ Statut : {statut}
         xaxis_title=""
     )
     
-    # Ligne à 0
-    fig_evolution.add_hline(y=0, line_dash="dash", line_color="gray", line_width=1)
-    
-    st.plotly_chart(fig_evolution, use_container_width=True)
-    
-    # Légende
-    col_leg1, col_leg2 = st.columns(2)
-    with col_leg1:
-        st.caption("Rouge : Gap à combler (positif)")
-    with col_leg2:
-        st.caption("Vert : Target dépassé (négatif)")
+    # Ligne à 0
+    fig_evolution.add_hline(y=0, line_dash="dash", line_color="gray", line_width=1)
+    
+    st.plotly_chart(fig_evolution, use_container_width=True)
+    
+    # Légende
+    col_leg1, col_leg2 = st.columns(2)
+    with col_leg1:
+        st.caption("Rouge : Gap à combler (positif)")
+    with col_leg2:
+        st.caption("Vert : Target dépassé (négatif)")
+
+
+def create_saham_visualizations():
+    """Page principale Visualisations Saham Bank"""
+    
+    st.header("Visualisations Saham Bank")
+    
+    st.markdown("""
+    Cette page permet d'analyser les données Saham Bank par **localité** avec calcul de la **PDM** (Part De Marché).
+    
+    **Vous devez fournir 2 fichiers Excel :**
+    1. **Référentiel agences** (Code Agence, Code Localité, Localité)
+    2. **Données financières** (Période, Code Agence, Dépôts, Crédits)
+    """)
+    
+    st.divider()
+    
+    # Upload des fichiers
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("1️⃣ Référentiel Agences")
+        ref_file = st.file_uploader(
+            "Fichier Excel",
+            type=['xlsx', 'xls'],
+            key="ref_file",
+            help="Colonnes attendues : Code Agence, Code Localité, Localité"
+        )
+        
+        if ref_file:
+            try:
+                df_ref = share_upload(
+                    'saham_referentiel', ref_file,
+                    lambda fichier: read_excel_fast(fichier, lambda nom: referentiel_column_target(nom) is not None)
+                )
+                st.success(f"✅ {len(df_ref)} agences chargées")
+                st.session_state.saham_referentiel = df_ref
+                
+                with st.expander("Aperçu du référentiel"):
+                    st.dataframe(df_ref.head(10))
+            except Exception as e:
+                st.error(f"Erreur : {str(e)}")
+    
+    with col2:
+        st.subheader("2️⃣ Données Financières")
+        fin_file = st.file_uploader(
+            "Fichier Excel",
+            type=['xlsx', 'xls'],
+            key="fin_file",
+            help="Colonnes attendues : Période, Code Agence, Dépôts, Crédits"
+        )
+        
+        if fin_file:
+            try:
+                df_fin = share_upload(
+                    'saham_financial', fin_file,
+                    lambda fichier: read_excel_fast(fichier, lambda nom: financial_column_target(nom) is not None)
+                )
+                st.success(f"✅ {len(df_fin)} lignes chargées")
+                st.session_state.saham_financial = df_fin
+                
+                with st.expander("Aperçu des données"):
+                    st.dataframe(df_fin.head(10))
+            except Exception as e:
+                st.error(f"Erreur : {str(e)}")
+    
+    st.divider()
+    
+    # Bouton de traitement
+    if st.session_state.saham_referentiel is not None and st.session_state.saham_financial is not None:
+        
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col2:
+            if st.button("🔄 Traiter et Agréger", type="primary", use_container_width=True):
+                with st.spinner("Jointure et agrégation en cours..."):
+                    try:
+                        # Jointure et agrégation
+                        df_agg, rapport = aggregate_saham(
+                            st.session_state.saham_financial,
+                            st.session_state.saham_referentiel
+                        )
+                        
+                        st.session_state.saham_aggregated = df_agg
+                        st.session_state.saham_join_report = rapport
+                        
+                        st.success(f"✅ Données agrégées : {len(df_agg)} localités")
+                        st.rerun()
+                        
+                    except Exception as e:
+                        st.error(f"Erreur lors du traitement : {str(e)}")
+                        st.exception(e)
+    
+    # Afficher les visualisations si données traitées
+    if st.session_state.saham_aggregated is not None:
+        
+        st.divider()
+        st.success("✅ Données prêtes pour l'analyse")
+        show_saham_join_report()
+        
+        # Navigation entre les 5 visualisations (seule la vue choisie est calculée)
+        vues = [
+            "Catégorie", 
+            "Top", 
+            "PDM", 
+            "Targets", 
+            "Evolution"
+        ]
+        vue = select_view(vues, key="saham_vue")
+        
+        # Récupérer les totaux BAM (session ou stockage local) : totaux de
+        # place des périodes BAM associées aux périodes Saham, à défaut
+        # totaux de tout le jeu BAM
+        if load_bam_data() is not None:
+            df_saham = get_saham_pdm(st.session_state.saham_aggregated)
+            show_saham_pdm_warning(df_saham)
+            totaux = saham_market_totals(df_saham)
+            if totaux is not None:
+                total_depots_bam, total_credits_bam = totaux
+            else:
+                total_depots_bam = st.session_state.total_depots_bam
+                total_credits_bam = st.session_state.total_credits_bam
+            df_bam = st.session_state.combined_data_bam
+        else:
+            df_saham = st.session_state.saham_aggregated
+            total_depots_bam = 11_497_995_536  # Valeur par défaut
+            total_credits_bam = 11_250_000_000  # Valeur par défaut
+            df_bam = None
+        
+        _render_saham_view(vue, vues, df_saham, df_bam, total_depots_bam, total_credits_bam)
+    
+    else:
+        if st.session_state.saham_referentiel is None or st.session_state.saham_financial is None:
+            st.info("👆 Veuillez charger les 2 fichiers Excel ci-dessus")
+
+@st.fragment
+def _render_saham_view(vue, vues, df_saham, df_bam, total_depots_bam, total_credits_bam):
+    """
+    Vue active des visualisations Saham. Fragment : le Target PDM et les
+    filtres des vues ne relancent que cette vue (jointure et agrégation
+    Saham restent en cache dans la session).
+    """
+    if vue in (vues[3], vues[4]):
+        # Target PDM (partagé par les vues Targets et Evolution)
+        target_pdm = st.slider("🎯 Target PDM (%)", 1.0, 20.0, 8.0, 0.5, key="saham_target_pdm")
+    
+    if vue == vues[0]:
+        viz_categorie_saham_pro(
+            df_saham, 
+            df_bam,
+            total_depots_bam,
+            total_credits_bam
+        )
+    
+    if vue == vues[1]:
+        viz_top_saham_pro(df_saham, total_depots_bam)
+    
+    if vue == vues[2]:
+        viz_pdm_saham_pro(df_saham)
+    
+    if vue == vues[3]:
+        viz_targets_saham_pro(
+            df_saham,
+            total_depots_bam,
+            total_credits_bam,
+            target_pdm
+        )
+    
+    if vue == vues[4]:
+        viz_evolution_saham_pro(
+            df_saham,
+            total_depots_bam,
+            total_credits_bam,
+            target_pdm
+        )
+
+
+# ============================================================================
+# MODULE BAM
+# ============================================================================
+
+# Module BAM
+# ============================================================================
+# STOCKAGE BAM PERSISTANT (PARQUET, PARTITIONNÉ PAR ANNÉE / MOIS)
+# ============================================================================
+
+# Répertoire du stockage local : une partition Parquet par (Annee, mois)
+BAM_STORE_DIR = os.environ.get('BAM_STORE_DIR', 'bam_store')
+
+# Colonnes texte répétitives, encodées en catégories (une table de catégories
+# commune en mémoire, dictionnaire Parquet sur disque)
+BAM_CATEGORY_COLUMNS = ['Localite', 'Direction_Regionale', 'DirectionRegionale', 'Code_Localite']
+
+# Colonnes entières réduites au plus petit type possible
+BAM_INTEGER_COLUMNS = ['Annee', 'mois', 'Nombre_Guichets']
+
+
+def _bam_text_columns(df):
+    """Colonnes texte (ou déjà catégorielles) de BAM_CATEGORY_COLUMNS présentes dans df."""
+    return [
+        col for col in BAM_CATEGORY_COLUMNS
+        if col in df.columns and (df[col].dtype == object or isinstance(df[col].dtype, pd.CategoricalDtype))
+    ]
+
+
+def bam_text_dtypes(frames):
+    """
+    Types catégoriels des colonnes texte BAM des DataFrames donnés : une
+    table de catégories par colonne (triée si possible), commune à tous les
+    DataFrames pour que leur concaténation reste catégorielle.
+    """
+    valeurs = {}
+    for df in frames:
+        for col in _bam_text_columns(df):
+            serie = df[col]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                valeurs.setdefault(col, []).append(serie.cat.categories.to_numpy())
+            else:
+                valeurs.setdefault(col, []).append(pd.unique(serie.dropna().to_numpy()))
+    
+    text_dtypes = {}
+    for col, tables in valeurs.items():
+        categories = pd.unique(np.concatenate(tables))
+        try:
+            categories = sorted(categories)
+        except TypeError:
+            # Codes numériques et texte mélangés : ordre d'apparition
+            pass
+        text_dtypes[col] = pd.CategoricalDtype(categories=pd.Index(categories, dtype=object))
+    return text_dtypes
+
+
+def compact_bam_frame(df, text_dtypes=None):
+    """
+    Compacte un DataFrame BAM : colonnes texte en catégories, une table par
+    colonne (`text_dtypes`, calculés si absents), colonnes entières
+    réduites (int8/int16...). Le DataFrame d'origine n'est pas modifié.
+    
+    Les regroupements sur ces colonnes doivent passer observed=True (sinon
+    toutes les catégories, même absentes de la sélection, sont listées).
+    """
+    if text_dtypes is None:
+        text_dtypes = bam_text_dtypes([df])
+    
+    df_compact = df.copy(deep=False)
+    for col in _bam_text_columns(df_compact):
+        if col in text_dtypes and df_compact[col].dtype != text_dtypes[col]:
+            df_compact[col] = df_compact[col].astype(text_dtypes[col])
+    for col in BAM_INTEGER_COLUMNS:
+        if col in df_compact.columns and pd.api.types.is_numeric_dtype(df_compact[col]):
+            df_compact[col] = pd.to_numeric(df_compact[col], downcast='integer')
+    return df_compact
+
+
+def _bam_partition_path(annee, mois):
+    """Chemin de la partition Parquet d'un (Annee, mois)."""
+    return os.path.join(BAM_STORE_DIR, f"Annee={int(annee)}", f"mois={int(mois):02d}.parquet")
+
+
+def _list_bam_partitions():
+    """Partitions présentes dans le stockage, triées par (Annee, mois)."""
+    partitions = []
+    if not os.path.isdir(BAM_STORE_DIR):
+        return partitions
+    for dossier in sorted(os.listdir(BAM_STORE_DIR)):
+        chemin_dossier = os.path.join(BAM_STORE_DIR, dossier)
+        if not dossier.startswith('Annee=') or not os.path.isdir(chemin_dossier):
+            continue
+        for fichier in sorted(os.listdir(chemin_dossier)):
+            if fichier.startswith('mois=') and fichier.endswith('.parquet'):
+                partitions.append(os.path.join(chemin_dossier, fichier))
+    return partitions
+
+
+def write_bam_store(df, remplacer=False):
+    """
+    Écrit les données BAM dans le stockage local, une partition par
+    (Annee, mois), compressée (zstd) avec les colonnes texte en catégories.
+    
+    Le stockage est commun à toutes les sessions : seules les partitions des
+    périodes de `df` sont remplacées. Avec `remplacer=True` (choix explicite
+    de l'utilisateur), les partitions absentes de `df` sont supprimées.
+    Renvoie (partitions écrites, lignes ignorées faute d'Annee ou de mois) ;
+    (0, 0) si Parquet est indisponible.
+    """
+    if not PARQUET_DISPONIBLE or 'Annee' not in df.columns or 'mois' not in df.columns:
+        return 0, 0
+    
+    # Lignes sans période : aucune partition possible
+    sans_periode = int(df[['Annee', 'mois']].isna().any(axis=1).sum())
+    
+    ecrites = set()
+    for (annee, mois), partition in df.groupby(['Annee', 'mois'], sort=True):
+        partition = partition.reset_index(drop=True)
+        for col in BAM_CATEGORY_COLUMNS:
+            if col in partition.columns:
+                partition[col] = partition[col].astype('category')
+        
+        chemin = _bam_partition_path(annee, mois)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        # Écriture dans un fichier temporaire propre à cet appel (deux sessions
+        # peuvent écrire la même partition) puis remplacement atomique
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(chemin), suffix='.tmp', delete=False) as temporaire:
+            try:
+                partition.to_parquet(temporaire, index=False, compression='zstd')
+            except BaseException:
+                temporaire.close()
+                os.remove(temporaire.name)
+                raise
+        os.replace(temporaire.name, chemin)
+        ecrites.add(os.path.abspath(chemin))
+    
+    if remplacer:
+        for chemin in _list_bam_partitions():
+            if os.path.abspath(chemin) not in ecrites:
+                os.remove(chemin)
+    
+    return len(ecrites), sans_periode
+
+
+def read_bam_store():
+    """
+    Relit tout le stockage BAM (ordre Annee, mois). Renvoie None si le
+    stockage est vide ou si Parquet est indisponible.
+    """
+    if not PARQUET_DISPONIBLE:
+        return None
+    partitions = _list_bam_partitions()
+    if not partitions:
+        return None
+    
+    frames = [pd.read_parquet(chemin) for chemin in partitions]
+    # Tables de catégories communes aux partitions : la concaténation reste catégorielle
+    text_dtypes = bam_text_dtypes(frames)
+    frames = [compact_bam_frame(frame, text_dtypes) for frame in frames]
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def load_bam_data():
+    """
+    Données BAM combinées de la session ; à défaut, rechargées depuis le
+    stockage local (avec les totaux globaux). Renvoie None si aucune donnée.
+    """
+    if st.session_state.combined_data_bam is None:
+        df = read_bam_store()
+        if df is not None:
+            set_bam_data(df)
+            st.session_state.bam_loaded_from_store = True
+    return st.session_state.combined_data_bam
+
+
+def set_bam_data(df):
+    """
+    Enregistre le jeu de données BAM combiné de la session (stocké une
+    seule fois) : DataFrame compacté (mémoire avant/après dans
+    bam_memory_report) et trié par (Annee, mois), totaux globaux
+    recalculés, cube et instantanés invalidés. Renvoie le DataFrame
+    enregistré.
+    """
+    memoire_avant = df.memory_usage(deep=True).sum()
+    df = compact_bam_frame(df)
+    st.session_state.bam_memory_report = {
+        'avant': memoire_avant,
+        'apres': df.memory_usage(deep=True).sum()
+    }
+    
+    df = _index_bam_dataset(df)
+    st.session_state.total_depots_bam = df['Montant_Depots'].sum()
+    st.session_state.total_credits_bam = df['Montant_Credits'].sum()
+    return st.session_state.combined_data_bam
+
+
+def _index_bam_dataset(df):
+    """
+    Trie (si besoin) le jeu BAM par (Annee, mois), calcule les bornes de
+    chaque période et l'enregistre comme unique copie des données
+    (_register_bam_dataset). Les lignes sans Annee ou sans mois
+    n'appartiennent à aucune période : elles sont écartées et comptées dans
+    bam_rows_without_period. Renvoie le DataFrame enregistré.
+    """
+    st.session_state.bam_rows_without_period = 0
+    if 'Annee' in df.columns and 'mois' in df.columns and len(df) > 0:
+        sans_periode = df['Annee'].isna() | df['mois'].isna()
+        if sans_periode.any():
+            st.session_state.bam_rows_without_period = int(sans_periode.sum())
+            df = df[~sans_periode].reset_index(drop=True)
+            df = df.assign(
+                Annee=pd.to_numeric(df['Annee'], downcast='integer'),
+                mois=pd.to_numeric(df['mois'], downcast='integer')
+            )
+        
+        cle = df['Annee'].to_numpy(dtype=np.int64) * 100 + df['mois'].to_numpy(dtype=np.int64)
+        if (np.diff(cle) < 0).any():
+            ordre = np.argsort(cle, kind='stable')
+            df = df.take(ordre).reset_index(drop=True)
+            cle = cle[ordre]
+        periodes = _period_offsets(cle)
+    else:
+        periodes = {}
+    
+    return _register_bam_dataset(df, periodes)
+
+
+def _register_bam_dataset(df, periodes, digest=None):
+    """
+    Enregistre `df` (trié par Annee, mois ; bornes `periodes` déjà connues)
+    comme jeu BAM combiné de la session, partagé entre sessions via
+    share_dataset (`digest` : empreinte déjà connue du contenu). Le cube,
+    ses instantanés et les totaux de place sont invalidés. Les données par
+    année du mode mensuel deviennent des vues (tranches) de ce DataFrame :
+    aucune donnée n'est dupliquée.
+    """
+    # Une seule instance par contenu pour tout le serveur
+    df = share_dataset('bam', df, digest)
+    
+    st.session_state.combined_data_bam = df
+    st.session_state.bam_period_bounds = periodes
+    st.session_state.bam_year_bounds = _year_offsets(periodes)
+    st.session_state.bam_cube = None
+    st.session_state.bam_cube_year_end = {}
+    st.session_state.bam_cube_periods = {}
+    st.session_state.bam_market_totals = {}
+    if st.session_state.get('bam_final_combined') is not None:
+        st.session_state.bam_final_combined = df
+    
+    # Données par année du mode mensuel : vues sur le jeu combiné
+    for annee, info in st.session_state.get('bam_years_data', {}).items():
+        if annee in st.session_state.bam_year_bounds:
+            info['data'] = get_bam_year(annee)
+    return df
+
+
+def _period_offsets(cle):
+    """
+    Bornes {(annee, mois): (début, fin)} des périodes d'une clé triée
+    Annee*100 + mois (une entrée par période, dans l'ordre chronologique).
+    """
+    if len(cle) == 0:
+        return {}
+    debuts = np.flatnonzero(np.r_[True, cle[1:] != cle[:-1]])
+    fins = np.r_[debuts[1:], len(cle)]
+    return {divmod(int(cle[d]), 100): (int(d), int(f)) for d, f in zip(debuts, fins)}
+
+
+def _year_offsets(periodes):
+    """Bornes {annee: (début, fin)} de chaque année, déduites des bornes des périodes."""
+    bornes = {}
+    for (annee, _), (debut, fin) in periodes.items():
+        bornes[annee] = (bornes.get(annee, (debut, fin))[0], fin)
+    return bornes
+
+
+def _splice_period_offsets(periodes, periode, longueur):
+    """
+    Bornes des périodes après remplacement (ou insertion) de la partition
+    `periode` par `longueur` lignes : les périodes suivantes sont décalées.
+    Renvoie (bornes, (début, fin) de l'ancienne partition, vide si absente).
+    """
+    avant = [fin for cle, (_, fin) in periodes.items() if cle < periode]
+    debut, fin = periodes.get(periode, (avant[-1] if avant else 0,) * 2)
+    decalage = longueur - (fin - debut)
+    
+    bornes = {}
+    for cle, (d, f) in periodes.items():
+        if cle < periode:
+            bornes[cle] = (d, f)
+        elif cle > periode:
+            if periode not in bornes and longueur:
+                bornes[periode] = (debut, debut + longueur)
+            bornes[cle] = (d + decalage, f + decalage)
+    if periode not in bornes and longueur:
+        bornes[periode] = (debut, debut + longueur)
+    return bornes, (debut, fin)
+
+
+def get_bam_year(annee):
+    """Partition d'une année : vue (sans copie, à ne pas modifier) sur le jeu BAM combiné."""
+    debut, fin = st.session_state.bam_year_bounds[annee]
+    return st.session_state.combined_data_bam.iloc[debut:fin]
+
+
+def get_bam_period(annee, mois):
+    """
+    Partition d'une période (Annee, mois) : vue contiguë (sans copie ni
+    parcours) sur le jeu BAM combiné ; vide si la période est absente.
+    """
+    debut, fin = st.session_state.bam_period_bounds.get((annee, mois), (0, 0))
+    return st.session_state.combined_data_bam.iloc[debut:fin]
+
+
+def show_bam_memory_report():
+    """
+    Affiche la mémoire occupée par les données BAM avant/après compactage
+    et signale les lignes écartées faute d'Annee ou de mois.
+    """
+    rapport = st.session_state.get('bam_memory_report')
+    if rapport:
+        st.caption(
+            f"🗜️ Mémoire des données BAM : {rapport['avant']/1e6:.1f} Mo → {rapport['apres']/1e6:.1f} Mo "
+            f"(compactage catégories / entiers)"
+        )
+    if st.session_state.bam_rows_without_period:
+        st.warning(
+            f"⚠️ {st.session_state.bam_rows_without_period} ligne(s) BAM sans Annee ou mois "
+            f"écartée(s) des données combinées"
+        )
+
+
+def get_dernier_mois_par_annee(df, mois_fixe=None):
+    """
+    Retourne uniquement le dernier mois de chaque année (un seul groupby),
+    ou, si `mois_fixe` est donné, ce même mois pour toutes les années
+    (comparaison à périmètre constant ; les années sans ce mois sont absentes).
+    """
+    if mois_fixe is None:
+        masque = df['mois'] == df.groupby('Annee', observed=True, sort=False)['mois'].transform('max')
+    else:
+        masque = df['mois'] == mois_fixe
+    return df[masque].reset_index(drop=True)
+
+
+def _bam_year_end_key(mois_fixe):
+    return 'dernier' if mois_fixe is None else int(mois_fixe)
+
+
+def get_bam_common_months():
+    """Mois présents dans toutes les années du jeu BAM (pour le mode mois fixe)."""
+    mois_par_annee = {}
+    for annee, mois in st.session_state.bam_period_bounds:
+        mois_par_annee.setdefault(annee, set()).add(mois)
+    if not mois_par_annee:
+        return []
+    return sorted(set.intersection(*mois_par_annee.values()))
+
+
+# Mesures additionnées dans le cube BAM
+BAM_CUBE_MEASURES = ['Montant_Depots', 'Montant_Credits', 'Nombre_Guichets']
+
+def build_bam_cube(df):
+    """
+    Pré-agrège le jeu BAM au grain (Annee, mois, Direction_Regionale,
+    Localite) : sommes des dépôts, crédits et guichets, et nombre de lignes
+    d'origine (Nb_Lignes). La Direction Régionale est lue dans
+    'Direction_Regionale' ou, à défaut, 'DirectionRegionale'.
+    """
+    region = next((col for col in ('Direction_Regionale', 'DirectionRegionale') if col in df.columns), None)
+    cles = ['Annee', 'mois'] + ([region] if region else []) + ['Localite']
+    mesures = [col for col in BAM_CUBE_MEASURES if col in df.columns]
+    
+    groupes = df.groupby(cles, observed=True, sort=True, dropna=False)
+    cube = groupes[mesures].sum()
+    cube['Nb_Lignes'] = groupes.size()
+    cube = cube.reset_index()
+    
+    if region and region != 'Direction_Regionale':
+        cube = cube.rename(columns={region: 'Direction_Regionale'})
+    return cube
+
+
+def get_bam_cube():
+    """
+    Cube BAM de la session, construit une fois par version des données,
+    avec les bornes de chaque période (le cube est trié par Annee, mois).
+    """
+    if st.session_state.bam_cube is None and st.session_state.combined_data_bam is not None:
+        cube = build_bam_cube(st.session_state.combined_data_bam)
+        st.session_state.bam_cube = cube
+        st.session_state.bam_cube_periods = _period_offsets(
+            cube['Annee'].to_numpy(dtype=np.int64) * 100 + cube['mois'].to_numpy(dtype=np.int64)
+        )
+    return st.session_state.bam_cube
+
+
+def get_bam_cube_period(annee, mois):
+    """Tranche du cube pour une période (Annee, mois) : vue contiguë, vide si absente."""
+    cube = get_bam_cube()
+    debut, fin = st.session_state.bam_cube_periods.get((annee, mois), (0, 0))
+    return cube.iloc[debut:fin]
+
+
+def get_bam_cube_year(annee):
+    """Tranche du cube pour une année (toutes ses périodes) : vue contiguë."""
+    cube = get_bam_cube()
+    bornes = [b for (a, _), b in st.session_state.bam_cube_periods.items() if a == annee]
+    if not bornes:
+        return cube.iloc[0:0]
+    return cube.iloc[bornes[0][0]:bornes[-1][1]]
+
+
+def get_bam_months(annee):
+    """Mois disponibles pour une année (lus dans l'index des périodes)."""
+    return [m for (a, m) in st.session_state.bam_period_bounds if a == annee]
+
+
+def get_bam_market_totals(par_localite=False):
+    """
+    Totaux de place BAM (dépôts et crédits) indexés par (Annee, mois) ou,
+    avec `par_localite`, par (Annee, mois, Localite). Lus dans le cube et
+    calculés une fois par version des données ; None sans données BAM.
+    """
+    cle = 'localite' if par_localite else 'periode'
+    totaux = st.session_state.bam_market_totals
+    if cle not in totaux:
+        cube = get_bam_cube()
+        if cube is None:
+            return None
+        niveaux = ['Annee', 'mois'] + (['Localite'] if par_localite else [])
+        totaux[cle] = cube.groupby(niveaux, observed=True, sort=True)[list(BAM_CONTRIBUTION_MEASURES)].sum()
+    return totaux[cle]
+
+
+def _saham_period_key(valeur):
+    """
+    (Annee, mois) d'une Periode Saham : date, AAAAMM, 'AAAA-MM', 'MM/AAAA'
+    ou date en texte ; (Annee, None) pour une année seule ; None si illisible.
+    """
+    if hasattr(valeur, 'year') and hasattr(valeur, 'month'):
+        return (valeur.year, valeur.month)
+    texte = str(valeur).strip()
+    if texte.endswith('.0'):
+        texte = texte[:-2]
+    if texte.isdigit() and len(texte) == 4:
+        return (int(texte), None)
+    if texte.isdigit() and len(texte) == 6:
+        annee, mois = divmod(int(texte), 100)
+        return (annee, mois) if 1 <= mois <= 12 else None
+    for separateur in ('-', '/', '.'):
+        parties = texte.split(separateur)
+        if len(parties) == 2 and all(partie.isdigit() for partie in parties):
+            annee, mois = (parties[0], parties[1]) if len(parties[0]) == 4 else (parties[1], parties[0])
+            return (int(annee), int(mois)) if len(annee) == 4 and 1 <= int(mois) <= 12 else None
+    # Jour en tête sauf pour les dates ISO (AAAA-MM-JJ)
+    date = pd.to_datetime(texte, errors='coerce', dayfirst=not texte[:4].isdigit())
+    return None if pd.isna(date) else (date.year, date.month)
+
+
+def match_saham_periods(periodes):
+    """
+    Période BAM (Annee, mois) associée à chaque Periode Saham distincte de
+    `periodes` (valeurs uniques, p. ex. issues de pd.factorize) : le même
+    mois uniquement s'il est chargé (une année seule correspond à son mois
+    de décembre). Renvoie une liste alignée sur `periodes` de (annee, mois)
+    ou None : aucune substitution par un autre mois.
+    """
+    cles_bam = set(st.session_state.bam_period_bounds)
+    correspondances = []
+    for periode in periodes:
+        cle = _saham_period_key(periode)
+        if cle is not None:
+            cle = (cle[0], cle[1] or 12)
+        correspondances.append(cle if cle in cles_bam else None)
+    return correspondances
+
+
+def compute_saham_pdm(df_saham):
+    """
+    PDM de toutes les (Periode, Localite) Saham en une jointure vectorisée
+    sur l'index des totaux de place : chaque Periode est associée à sa
+    période BAM (Annee_BAM, Mois_BAM), puis
+    PDM = Depots / total dépôts BAM de la période × 100 (Total_Global_Depots,
+    Total_Global_Credits = totaux de place) et
+    PDM_Localite = Depots / dépôts BAM de la localité sur la période × 100.
+    Une période sans correspondance BAM n'a pas de PDM (NaN, colonnes de
+    place vides) : voir show_saham_pdm_warning.
+    """
+    totaux = get_bam_market_totals()
+    totaux_localites = get_bam_market_totals(par_localite=True)
+    
+    # Une recherche par période distincte, puis diffusion aux lignes
+    codes, periodes = pd.factorize(df_saham['Periode'])
+    cles = [cle or (-1, -1) for cle in match_saham_periods(periodes)]
+    annees = np.array([cle[0] for cle in cles] + [-1], dtype=np.int64)[codes]
+    mois = np.array([cle[1] for cle in cles] + [-1], dtype=np.int64)[codes]
+    
+    positions = totaux.index.get_indexer(pd.MultiIndex.from_arrays([annees, mois]))
+    trouve = positions >= 0
+    depots_place = pd.api.extensions.take(totaux['Montant_Depots'].to_numpy(dtype=float), positions, allow_fill=True)
+    credits_place = pd.api.extensions.take(totaux['Montant_Credits'].to_numpy(dtype=float), positions, allow_fill=True)
+    
+    positions_localites = totaux_localites.index.get_indexer(
+        pd.MultiIndex.from_arrays([annees, mois, df_saham['Localite'].to_numpy()])
+    )
+    depots_localites = pd.api.extensions.take(
+        totaux_localites['Montant_Depots'].to_numpy(dtype=float), positions_localites, allow_fill=True
+    )
+    
+    depots = df_saham['Depots'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return df_saham.assign(
+            Annee_BAM=pd.arrays.IntegerArray(annees, ~trouve),
+            Mois_BAM=pd.arrays.IntegerArray(mois, ~trouve),
+            Total_Global_Depots=depots_place,
+            Total_Global_Credits=credits_place,
+            PDM=depots / depots_place * 100,
+            PDM_Localite=depots / depots_localites * 100
+        )
 
 
-def create_saham_visualizations():
-    """Page principale Visualisations Saham Bank"""
-    
-    st.header("Visualisations Saham Bank")
-    
-    st.markdown("""
-    Cette page permet d'analyser les données Saham Bank par **localité** avec calcul de la **PDM** (Part De Marché).
-    
-    **Vous devez fournir 2 fichiers Excel :**
-    1. **Référentiel agences** (Code Agence, Code Localité, Localité)
-    2. **Données financières** (Période, Code Agence, Dépôts, Crédits)
-    """)
-    
-    st.divider()
-    
-    # Upload des fichiers
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.subheader("1️⃣ Référentiel Agences")
-        ref_file = st.file_uploader(
-            "Fichier Excel",
-            type=['xlsx', 'xls'],
-            key="ref_file",
-            help="Colonnes attendues : Code Agence, Code Localité, Localité"
+def show_saham_pdm_warning(df_saham):
+    """
+    Signale les périodes Saham dont le mois n'est pas chargé dans les
+    données BAM (PDM non calculée, aucun autre mois n'est substitué).
+    """
+    if 'Annee_BAM' not in df_saham.columns:
+        return
+    sans_bam = df_saham.loc[df_saham['Annee_BAM'].isna(), 'Periode'].unique()
+    if len(sans_bam):
+        st.warning(
+            f"⚠️ {len(sans_bam)} période(s) Saham dont le mois n'est pas chargé dans BAM "
+            f"(PDM non calculée) : {', '.join(str(periode) for periode in sans_bam[:12])}"
         )
-        
-        if ref_file:
-            try:
-                df_ref = pd.read_excel(ref_file)
-                st.success(f"✅ {len(df_ref)} agences chargées")
-                st.session_state.saham_referentiel = df_ref
-                
-                with st.expander("Aperçu du référentiel"):
-                    st.dataframe(df_ref.head(10))
-            except Exception as e:
-                st.error(f"Erreur : {str(e)}")
-    
-    with col2:
-        st.subheader("2️⃣ Données Financières")
-        fin_file = st.file_uploader(
-            "Fichier Excel",
-            type=['xlsx', 'xls'],
-            key="fin_file",
-            help="Colonnes attendues : Période, Code Agence, Dépôts, Crédits"
+
+
+def get_saham_pdm(df_saham):
+    """
+    compute_saham_pdm mémorisée par version des données Saham et BAM ;
+    `df_saham` inchangé sans données BAM.
+    """
+    df_bam = st.session_state.combined_data_bam
+    if df_bam is None:
+        return df_saham
+    return memo_view('saham_pdm', (df_saham, df_bam), lambda: compute_saham_pdm(df_saham))
+
+
+def saham_market_totals(df_saham, periode=None):
+    """
+    (total dépôts, total crédits) de place des périodes BAM associées aux
+    périodes de `df_saham` (sortie de get_saham_pdm, restreinte à `periode`
+    si donnée), lus dans l'index des totaux ; None si aucune correspondance.
+    """
+    if 'Annee_BAM' not in df_saham.columns:
+        return None
+    if periode is not None:
+        df_saham = df_saham[df_saham['Periode'] == periode]
+    cles = df_saham[['Annee_BAM', 'Mois_BAM']].dropna().drop_duplicates()
+    if cles.empty:
+        return None
+    totaux = get_bam_market_totals().loc[pd.MultiIndex.from_frame(cles.astype(np.int64))]
+    return totaux['Montant_Depots'].sum(), totaux['Montant_Credits'].sum()
+
+
+# Mesures de l'analyse de contribution (colonne du cube -> suffixe des résultats)
+BAM_CONTRIBUTION_MEASURES = {'Montant_Depots': 'Depots', 'Montant_Credits': 'Credits'}
+
+def bam_contributions(periodes):
+    """
+    Contributions des localités sur N périodes (Annee, mois) en une passe
+    vectorisée : les localités de toutes les périodes partagent une même
+    clé (factorisation unique, équivalent d'une jointure externe), puis
+    chaque mesure est ventilée par np.bincount.
+    
+    Renvoie (totaux, DataFrame) :
+    - totaux : {mesure: array des totaux par période} (toutes lignes) ;
+    - DataFrame, une ligne par localité : <mesure>_P1..PN, Variation_<X>
+      et Contribution_<X>_% (dernière période vs première), et Statut
+      ('Entrée', 'Sortie' ou 'Présente').
+    """
+    tranches = [get_bam_cube_period(annee, mois) for annee, mois in periodes]
+    longueurs = [len(t) for t in tranches]
+    codes, localites = pd.factorize(pd.concat([t['Localite'] for t in tranches], ignore_index=True))
+    nb_localites = len(localites)
+    codes_par_periode = np.split(codes, np.cumsum(longueurs)[:-1])
+    
+    resultat = {'Localite': np.asarray(localites)}
+    totaux = {}
+    presence = []
+    for codes_p in codes_par_periode:
+        presence.append(np.bincount(codes_p[codes_p >= 0], minlength=nb_localites) > 0)
+    
+    for mesure, nom in BAM_CONTRIBUTION_MEASURES.items():
+        matrice = np.zeros((len(tranches), nb_localites))
+        for i, (tranche, codes_p) in enumerate(zip(tranches, codes_par_periode)):
+            valeurs = tranche[mesure].to_numpy(dtype=np.float64)
+            valides = codes_p >= 0
+            matrice[i] = np.bincount(codes_p[valides], weights=valeurs[valides], minlength=nb_localites)
+            resultat[f'{mesure}_P{i+1}'] = matrice[i]
+        totaux[mesure] = np.array([t[mesure].sum() for t in tranches])
+        
+        variation = matrice[-1] - matrice[0]
+        variation_totale = totaux[mesure][-1] - totaux[mesure][0]
+        resultat[f'Variation_{nom}'] = variation
+        resultat[f'Contribution_{nom}_%'] = (
+            variation / variation_totale * 100 if variation_totale != 0 else np.zeros(nb_localites)
         )
-        
-        if fin_file:
-            try:
-                df_fin = pd.read_excel(fin_file)
-                st.success(f"✅ {len(df_fin)} lignes chargées")
-                st.session_state.saham_financial = df_fin
-                
-                with st.expander("Aperçu des données"):
-                    st.dataframe(df_fin.head(10))
-            except Exception as e:
-                st.error(f"Erreur : {str(e)}")
     
-    st.divider()
-    
-    # Bouton de traitement
-    if st.session_state.saham_referentiel is not None and st.session_state.saham_financial is not None:
-        
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            if st.button("🔄 Traiter et Agréger", type="primary", use_container_width=True):
-                with st.spinner("Jointure et agrégation en cours..."):
-                    try:
-                        # Jointure et agrégation
-                        df_agg = join_and_aggregate_saham(
-                            st.session_state.saham_financial,
-                            st.session_state.saham_referentiel
-                        )
-                        
-                        st.session_state.saham_aggregated = df_agg
-                        
-                        st.success(f"✅ Données agrégées : {len(df_agg)} localités")
-                        st.rerun()
-                        
-                    except Exception as e:
-                        st.error(f"Erreur lors du traitement : {str(e)}")
-                        st.exception(e)
+    if presence:
+        resultat['Statut'] = np.where(
+            ~presence[0] & presence[-1], 'Entrée',
+            np.where(presence[0] & ~presence[-1], 'Sortie', 'Présente')
+        )
+    return totaux, pd.DataFrame(resultat)
+
+
+def top_k_rows(df, colonne, k, plus_grands=True):
+    """
+    Les k lignes de `df` ayant les plus grandes (ou plus petites) valeurs de
+    `colonne`, triées : sélection partielle (np.argpartition) puis tri des
+    seules k lignes retenues.
+    """
+    valeurs = df[colonne].to_numpy(dtype=np.float64)
+    cles = -valeurs if plus_grands else valeurs
+    k = min(k, len(df))
+    if k <= 0:
+        return df.iloc[0:0]
+    if k < len(df):
+        retenus = np.argpartition(cles, k - 1)[:k]
+    else:
+        retenus = np.arange(len(df))
+    return df.iloc[retenus[np.argsort(cles[retenus], kind='stable')]]
+
+
+def compare_bam_periods(periode_1, periode_2):
+    """
+    Compare deux périodes (Annee, mois) du jeu BAM à partir des tranches du
+    cube (sans parcourir tout le jeu) : totaux dépôts / crédits de chaque
+    période, taux de croissance et contribution de chaque localité à la
+    variation (voir bam_contributions). Renvoie un dict :
+    {'depots': (d1, d2), 'credits': (c1, c2), 'taux_depots', 'taux_credits',
+     'localites': DataFrame des contributions (non trié)}.
+    """
+    totaux, df_compare_loc = bam_contributions([periode_1, periode_2])
+    d1, d2 = totaux['Montant_Depots']
+    c1, c2 = totaux['Montant_Credits']
+    
+    return {
+        'depots': (d1, d2),
+        'credits': (c1, c2),
+        'taux_depots': ((d2 - d1) / d1 * 100) if d1 > 0 else 0,
+        'taux_credits': ((c2 - c1) / c1 * 100) if c1 > 0 else 0,
+        'localites': df_compare_loc
+    }
+
+
+def get_bam_cube_year_end(mois_fixe=None):
+    """
+    Instantané fin d'année lu dans le cube (dernier mois disponible ou mois
+    fixe), calculé une fois par version des données et par référence.
+    """
+    cube = get_bam_cube()
+    if cube is None:
+        return None
+    cle = _bam_year_end_key(mois_fixe)
+    if cle not in st.session_state.bam_cube_year_end:
+        st.session_state.bam_cube_year_end[cle] = get_dernier_mois_par_annee(cube, mois_fixe)
+    return st.session_state.bam_cube_year_end[cle]
+
+
+def prepare_bam_month(df, annee, mois):
+    """
+    Prépare un fichier mensuel BAM comme la combinaison par année :
+    colonnes normalisées, montants nettoyés, Direction Régionale, mois et année.
+    Renvoie (DataFrame, {colonne: valeurs forcées à 0}).
+    """
+    df = normalize_bam_columns(df)
+    df, forcees = clean_numeric_frame(df, BAM_NUMERIC_COLUMNS)
+    df['mois'] = mois
+    df = add_direction_regionale(df)
+    df['Annee'] = annee
+    return df, forcees
+
+
+def _extend_bam_categories(df, df_mois):
+    """
+    Aligne les colonnes texte de `df_mois` sur les types catégoriels de `df`,
+    complétés en fin de table des valeurs nouvelles : les codes des lignes
+    de `df` restent valides (pas de recodage). `df` n'est pas modifié.
+    Renvoie (df, df_mois) de types catégoriels identiques.
+    """
+    df = df.copy(deep=False)
+    df_mois = df_mois.copy(deep=False)
+    for col in _bam_text_columns(df_mois):
+        if col not in df.columns or not isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        valeurs = pd.Index(pd.unique(df_mois[col].dropna().to_numpy()))
+        nouvelles = valeurs[~valeurs.isin(df[col].cat.categories)]
+        if len(nouvelles):
+            df[col] = df[col].cat.add_categories(nouvelles)
+        df_mois[col] = df_mois[col].astype(df[col].dtype)
+    return df, df_mois
+
+
+def append_bam_month(df_mois, annee, mois):
+    """
+    Ajoute (ou remplace) la partition (annee, mois) dans les données BAM
+    combinées. Seule la partition est traitée : les bornes des périodes
+    suivantes sont décalées, les tables de catégories complétées sans
+    recodage, les totaux globaux mis à jour par différence, l'empreinte
+    dérivée de la précédente, le cube (s'il est construit) mis à jour par le
+    cube du seul mois. Les colonnes du jeu combiné sont recopiées une fois
+    (concaténation autour de la partition). La partition est aussi écrite
+    dans le stockage local.
+    
+    `df_mois` doit être préparé par prepare_bam_month. Renvoie True si la
+    partition existait déjà (remplacement).
+    """
+    df = load_bam_data()
     
-    # Afficher les visualisations si données traitées
-    if st.session_state.saham_aggregated is not None:
-        
-        st.divider()
-        st.success("✅ Données prêtes pour l'analyse")
+    if df is None:
+        df_mois = set_bam_data(df_mois.reset_index(drop=True))
+        remplace = False
+    else:
+        # Entiers réduits, colonnes texte sur les tables de catégories du jeu combiné
+        df, df_mois = _extend_bam_categories(df, compact_bam_frame(df_mois, {}))
+        periodes, (debut, fin) = _splice_period_offsets(
+            st.session_state.bam_period_bounds, (annee, mois), len(df_mois)
+        )
+        remplace = fin > debut
+        ancienne = df.iloc[debut:fin]
         
-        # Onglets pour les 5 visualisations
-        tab1, tab2, tab3, tab4, tab5 = st.tabs([
-            "Catégorie", 
-            "Top", 
-            "PDM", 
-            "Targets", 
-            "Evolution"
-        ])
+        combined = pd.concat([df.iloc[:debut], df_mois, df.iloc[fin:]], ignore_index=True, sort=False)
         
-        # Récupérer les totaux BAM
-        if st.session_state.combined_data_bam is not None:
-            total_depots_bam = st.session_state.total_depots_bam
-            total_credits_bam = st.session_state.total_credits_bam
-            df_bam = st.session_state.combined_data_bam
+        # Totaux : retirer l'ancienne partition, ajouter la nouvelle
+        if st.session_state.total_depots_bam is None:
+            st.session_state.total_depots_bam = combined['Montant_Depots'].sum()
+            st.session_state.total_credits_bam = combined['Montant_Credits'].sum()
         else:
-            total_depots_bam = 11_497_995_536  # Valeur par défaut
-            total_credits_bam = 11_250_000_000  # Valeur par défaut
-            df_bam = None
-        
-        # Target PDM (peut être ajusté avec un slider global)
-        target_pdm = st.sidebar.slider("🎯 Target PDM (%)", 1.0, 20.0, 8.0, 0.5)
-        
-        with tab1:
-            viz_categorie_saham_pro(
-                st.session_state.saham_aggregated, 
-                df_bam,
-                total_depots_bam,
-                total_credits_bam
-            )
-        
-        with tab2:
-            viz_top_saham_pro(st.session_state.saham_aggregated, total_depots_bam)
-        
-        with tab3:
-            viz_pdm_saham_pro(st.session_state.saham_aggregated)
-        
-        with tab4:
-            viz_targets_saham_pro(
-                st.session_state.saham_aggregated,
-                total_depots_bam,
-                total_credits_bam,
-                target_pdm
-            )
-        
-        with tab5:
-            viz_evolution_saham_pro(
-                st.session_state.saham_aggregated,
-                total_depots_bam,
-                total_credits_bam,
-                target_pdm
+            st.session_state.total_depots_bam += df_mois['Montant_Depots'].sum() - ancienne['Montant_Depots'].sum()
+            st.session_state.total_credits_bam += df_mois['Montant_Credits'].sum() - ancienne['Montant_Credits'].sum()
+        
+        # Empreinte : version précédente + partition (sans hacher tout le jeu)
+        precedente = st.session_state.get('_dataset_bam')
+        digest = None
+        if precedente:
+            digest = hashlib.sha256(f"{precedente}|{annee}-{mois}|{hash_dataframe(df_mois)}".encode('utf-8')).hexdigest()
+        
+        cube = st.session_state.bam_cube
+        bornes_cube = st.session_state.bam_cube_periods
+        _register_bam_dataset(combined, periodes, digest)
+        
+        # Cube : remplacer les lignes de la période par le cube du mois
+        if cube is not None:
+            cube, cube_mois = _extend_bam_categories(cube, build_bam_cube(df_mois))
+            bornes_cube, (debut, fin) = _splice_period_offsets(bornes_cube, (annee, mois), len(cube_mois))
+            st.session_state.bam_cube = pd.concat(
+                [cube.iloc[:debut], cube_mois, cube.iloc[fin:]], ignore_index=True, sort=False
             )
+            st.session_state.bam_cube_periods = bornes_cube
     
-    else:
-        if st.session_state.saham_referentiel is None or st.session_state.saham_financial is None:
-            st.info("👆 Veuillez charger les 2 fichiers Excel ci-dessus")
+    # Mode mensuel : l'année (vue sur le jeu combiné) inclut le nouveau mois
+    annees = st.session_state.get('bam_years_data', {})
+    if annee in annees:
+        mois_list = sorted(set(annees[annee]['mois_list']) | {mois})
+        annees[annee].update({'nb_mois': len(mois_list), 'mois_list': mois_list})
+    
+    write_bam_store(df_mois)
+    st.session_state.bam_loaded_from_store = False
+    return remplace
 
-# ============================================================================
-# MODULE BAM
-# ============================================================================
 
-# Module BAM
 def import_bam_multi_annees():
     """
     Interface d'import BAM avec gestion multi-années (2016-2025)
@@ -3264,9 +4235,9 @@ def import_bam_multi_annees():
     
     mode_import = st.radio(
         "Choisissez le mode d'import",
-        ["📂 Import mensuel (fichiers séparés)", "⚡ Import fichier combiné (rapide)"],
+        ["📂 Import mensuel (fichiers séparés)", "⚡ Import fichier combiné (rapide)", "➕ Ajout d'un mois"],
         horizontal=True,
-        help="Import mensuel : uploader mois par mois | Import combiné : uploader un seul fichier Excel déjà combiné"
+        help="Import mensuel : uploader mois par mois | Import combiné : uploader un seul fichier Excel déjà combiné | Ajout d'un mois : ajouter ou remplacer un seul mois dans les données déjà chargées"
     )
     
     st.divider()
@@ -3294,71 +4265,184 @@ def import_bam_multi_annees():
             key="fichier_bam_combine"
         )
         
+        # Le stockage local est partagé : sans cette option, seules les
+        # périodes du fichier y sont remplacées
+        remplacer_stockage = st.checkbox(
+            "Remplacer tout le stockage local par ce fichier",
+            value=False,
+            key="bam_store_remplacer",
+            help="Supprime du stockage local (commun à tous les utilisateurs) les périodes absentes de ce fichier"
+        )
+        
         if fichier_combine:
             try:
-                with st.spinner("⏳ Chargement du fichier..."):
-                    df_combine = pd.read_excel(fichier_combine)
-                    
-                    # Normaliser et nettoyer
-                    df_combine = normalize_bam_columns(df_combine)
-                    df_combine = clean_numeric_columns(df_combine)
-                    
-                    # Vérifier les colonnes essentielles
-                    required_cols = ['Annee', 'mois', 'Localite', 'Montant_Depots', 'Montant_Credits']
-                    missing_cols = [col for col in required_cols if col not in df_combine.columns]
-                    
-                    if missing_cols:
-                        st.error(f"❌ Colonnes manquantes : {missing_cols}")
-                        st.info("Colonnes présentes : " + ", ".join(df_combine.columns.tolist()))
-                        return
-                    
-                    # Ajouter Direction_Regionale si absente
-                    if 'Direction_Regionale' not in df_combine.columns:
-                        df_combine = add_direction_regionale(df_combine)
-                    
-                    # Stocker dans session_state
-                    st.session_state.combined_data_bam = df_combine
-                    
-                    st.success(f"✅ Fichier chargé avec succès : **{len(df_combine):,}** lignes")
-                    
-                    # Résumé
-                    col1, col2, col3, col4 = st.columns(4)
-                    with col1:
-                        st.metric("Années", df_combine['Annee'].nunique())
-                    with col2:
-                        nb_mois = df_combine.groupby('Annee')['mois'].nunique().sum()
-                        st.metric("Mois (total)", nb_mois)
-                    with col3:
-                        st.metric("Localités", df_combine['Localite'].nunique())
-                    with col4:
-                        total_depots = df_combine['Montant_Depots'].sum() / 1e6
-                        st.metric("Dépôts totaux", f"{total_depots:.0f} Mrd")
-                    
-                    # Aperçu
-                    with st.expander("🔍 Aperçu des données", expanded=False):
-                        st.dataframe(df_combine.head(20), use_container_width=True)
+                # Lecture une fois par fichier uploadé : aux reruns (ou au retour
+                # sur ce mode), les données de la session sont reprises telles
+                # quelles tant qu'elles n'ont pas été remplacées entre-temps
+                signature = (fichier_combine.file_id, fichier_combine.name, fichier_combine.size)
+                deja_charge = (
+                    st.session_state.combined_data_bam is not None
+                    and st.session_state.get('bam_combine_import') == (signature, st.session_state.get('_dataset_bam'))
+                )
+                
+                if deja_charge:
+                    df_combine = st.session_state.combined_data_bam
+                else:
+                    with st.spinner("⏳ Chargement du fichier..."):
+                        df_combine = read_excel_fast(fichier_combine, bam_column_wanted)
                         
-                        # Résumé par année
-                        st.write("**Résumé par année :**")
-                        summary = df_combine.groupby('Annee').agg({
-                            'mois': 'nunique',
-                            'Localite': 'nunique',
-                            'Montant_Depots': 'sum',
-                            'Montant_Credits': 'sum'
-                        }).reset_index()
-                        summary.columns = ['Année', 'Nb Mois', 'Localités', 'Dépôts', 'Crédits']
-                        summary['Dépôts'] = summary['Dépôts'].apply(lambda x: f"{x/1e6:.2f} Mrd")
-                        summary['Crédits'] = summary['Crédits'].apply(lambda x: f"{x/1e6:.2f} Mrd")
-                        st.dataframe(summary, use_container_width=True, hide_index=True)
-                    
-                    st.info("💡 Les données sont maintenant chargées. Allez sur **'Visualisations BAM'** pour les analyser.")
+                        # Normaliser, relever les valeurs manquantes (avant que le
+                        # nettoyage ne les remplace par 0), puis nettoyer
+                        df_combine = normalize_bam_columns(df_combine)
+                        rapport = detect_missing_values(df_combine, 'BAM')
+                        # Détail matérialisé : le rapport ne retient pas le DataFrame brut
+                        rapport['missing_details'] = list(rapport['missing_details'])
+                        st.session_state.missing_report_bam = rapport
+                        df_combine, forcees = clean_numeric_frame(df_combine, BAM_NUMERIC_COLUMNS)
+                        st.session_state.cleaning_report_bam = forcees
+                        
+                        # Vérifier les colonnes essentielles
+                        required_cols = ['Annee', 'mois', 'Localite', 'Montant_Depots', 'Montant_Credits']
+                        missing_cols = [col for col in required_cols if col not in df_combine.columns]
+                        
+                        if missing_cols:
+                            st.error(f"❌ Colonnes manquantes : {missing_cols}")
+                            st.info("Colonnes présentes : " + ", ".join(df_combine.columns.tolist()))
+                            return
+                        
+                        # Ajouter Direction_Regionale si absente
+                        if 'Direction_Regionale' not in df_combine.columns:
+                            df_combine = add_direction_regionale(df_combine)
+                        
+                        # Stocker dans session_state (DataFrame compacté)
+                        df_combine = set_bam_data(df_combine)
+                        st.session_state.bam_loaded_from_store = False
+                        st.session_state.bam_combine_import = (signature, st.session_state.get('_dataset_bam'))
+                
+                forcees = st.session_state.cleaning_report_bam or {}
+                if sum(forcees.values()):
+                    st.caption(f"ℹ️ {sum(forcees.values()):,} valeur(s) non numérique(s) remplacée(s) par 0".replace(',', ' '))
+                show_missing_values_report(st.session_state.missing_report_bam)
+                show_bam_memory_report()
+                
+                # Enregistrer dans le stockage local (une fois par fichier et par choix de remplacement)
+                signature_stockage = signature + (remplacer_stockage,)
+                if st.session_state.get('bam_store_signature') != signature_stockage:
+                    nb_partitions, sans_periode = write_bam_store(df_combine, remplacer=remplacer_stockage)
+                    st.session_state.bam_store_signature = signature_stockage
+                    if nb_partitions:
+                        st.caption(f"💾 {nb_partitions} partition(s) (année/mois) enregistrée(s) dans {BAM_STORE_DIR}")
+                    if sans_periode:
+                        st.warning(f"⚠️ {sans_periode} ligne(s) sans Annee ou mois non enregistrée(s) dans le stockage local")
+                
+                st.success(f"✅ Fichier chargé avec succès : **{len(df_combine):,}** lignes")
+                
+                # Résumé
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("Années", df_combine['Annee'].nunique())
+                with col2:
+                    nb_mois = df_combine.groupby('Annee')['mois'].nunique().sum()
+                    st.metric("Mois (total)", nb_mois)
+                with col3:
+                    st.metric("Localités", df_combine['Localite'].nunique())
+                with col4:
+                    total_depots = df_combine['Montant_Depots'].sum() / 1e6
+                    st.metric("Dépôts totaux", f"{total_depots:.0f} Mrd")
+                
+                # Aperçu
+                with st.expander("🔍 Aperçu des données", expanded=False):
+                    st.dataframe(df_combine.head(20), use_container_width=True)
                     
+                    # Résumé par année
+                    st.write("**Résumé par année :**")
+                    summary = df_combine.groupby('Annee').agg({
+                        'mois': 'nunique',
+                        'Localite': 'nunique',
+                        'Montant_Depots': 'sum',
+                        'Montant_Credits': 'sum'
+                    }).reset_index()
+                    summary.columns = ['Année', 'Nb Mois', 'Localités', 'Dépôts', 'Crédits']
+                    summary['Dépôts'] = summary['Dépôts'].apply(lambda x: f"{x/1e6:.2f} Mrd")
+                    summary['Crédits'] = summary['Crédits'].apply(lambda x: f"{x/1e6:.2f} Mrd")
+                    st.dataframe(summary, use_container_width=True, hide_index=True)
+                
+                st.info("💡 Les données sont maintenant chargées. Allez sur **'Visualisations BAM'** pour les analyser.")
+                
             except Exception as e:
                 st.error(f"❌ Erreur lors du chargement : {str(e)}")
                 st.exception(e)
         
         return  # Sortir de la fonction ici pour le mode combiné
     
+    # =========================================================================
+    # MODE 3 : AJOUT D'UN MOIS (INCRÉMENTAL)
+    # =========================================================================
+    
+    if mode_import == "➕ Ajout d'un mois":
+        st.markdown("""
+        <div class="info-box">
+            <h4>➕ Ajout d'un mois</h4>
+            <p>Ajoutez un nouveau fichier mensuel aux données BAM déjà chargées, sans tout recombiner.</p>
+            <p>Si le mois existe déjà pour cette année, il est <strong>remplacé</strong>.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        df_actuel = load_bam_data()
+        if df_actuel is not None:
+            st.caption(f"📊 Données actuelles : {len(df_actuel):,} lignes, {df_actuel['Annee'].nunique()} année(s)".replace(',', ' '))
+        
+        fichier_mois = st.file_uploader(
+            "📂 Sélectionnez le fichier Excel du mois",
+            type=['xlsx', 'xls'],
+            key="fichier_bam_ajout"
+        )
+        
+        if fichier_mois:
+            detected_month = get_month_from_filename(fichier_mois.name)
+            
+            col_annee, col_mois = st.columns(2)
+            with col_annee:
+                annee_ajout = st.selectbox(
+                    "Année",
+                    options=list(range(2016, datetime.now().year + 2)),
+                    index=datetime.now().year - 2016,
+                    key="annee_bam_ajout"
+                )
+            with col_mois:
+                mois_ajout = st.selectbox(
+                    "Mois",
+                    options=list(range(1, 13)),
+                    index=(detected_month - 1) if detected_month else 0,
+                    format_func=lambda x: ['Janvier', 'Février', 'Mars', 'Avril', 
+                                           'Mai', 'Juin', 'Juillet', 'Août', 
+                                           'Septembre', 'Octobre', 'Novembre', 'Décembre'][x-1],
+                    key="mois_bam_ajout"
+                )
+            
+            if st.button("➕ Ajouter / remplacer ce mois", type="primary", key="btn_bam_ajout"):
+                with st.spinner("⏳ Ajout du mois en cours..."):
+                    try:
+                        df_mois = read_bam_excel_files([fichier_mois])[0]
+                        if isinstance(df_mois, Exception):
+                            raise df_mois
+                        
+                        df_mois, forcees = prepare_bam_month(df_mois, annee_ajout, mois_ajout)
+                        st.session_state.cleaning_report_bam = forcees
+                        remplace = append_bam_month(df_mois, annee_ajout, mois_ajout)
+                        
+                        action = "remplacé" if remplace else "ajouté"
+                        st.success(f"✅ Mois {mois_ajout:02d}/{annee_ajout} {action} : **{len(df_mois):,}** lignes".replace(',', ' '))
+                        if sum(forcees.values()):
+                            st.caption(f"ℹ️ {sum(forcees.values()):,} valeur(s) non numérique(s) remplacée(s) par 0".replace(',', ' '))
+                        st.info("💡 Les visualisations utilisent maintenant les données mises à jour.")
+                    
+                    except Exception as e:
+                        st.error(f"❌ Erreur lors de l'ajout du mois : {str(e)}")
+                        st.exception(e)
+        
+        return
+    
     # =========================================================================
     # MODE 2 : IMPORT MENSUEL (FICHIERS SÉPARÉS)
     # =========================================================================
@@ -3377,6 +4461,17 @@ def import_bam_multi_annees():
     </div>
     """, unsafe_allow_html=True)
     
+    # Nombre de processus pour décoder les fichiers Excel (1 = séquentiel)
+    st.number_input(
+        "⚙️ Processus de lecture Excel",
+        min_value=1,
+        max_value=PROCESS_POOL_MAX_WORKERS,
+        value=BAM_EXCEL_WORKERS,
+        step=1,
+        key="bam_excel_workers",
+        help="Les fichiers mensuels d'une année sont décodés en parallèle, puis mémorisés (pas de relecture au rerun)"
+    )
+    
     st.divider()
     
     # =========================================================================
@@ -3471,10 +4566,17 @@ def import_bam_multi_annees():
                 
                 fichiers_pour_annee = []
                 
-                for idx, uploaded_file in enumerate(uploaded_files_year):
+                # Décoder les fichiers (en parallèle, mémorisés par contenu)
+                fichiers_decodes = read_bam_excel_files(
+                    uploaded_files_year,
+                    workers=int(st.session_state.get('bam_excel_workers', BAM_EXCEL_WORKERS))
+                )
+                
+                for idx, (uploaded_file, df) in enumerate(zip(uploaded_files_year, fichiers_decodes)):
                     try:
-                        # Lire le fichier
-                        df = pd.read_excel(uploaded_file)
+                        # Fichier illisible : remonter l'erreur de lecture
+                        if isinstance(df, Exception):
+                            raise df
                         
                         # Détecter le mois automatiquement
                         detected_month = get_month_from_filename(uploaded_file.name)
@@ -3532,7 +4634,10 @@ def import_bam_multi_annees():
                                     df_combined = normalize_bam_columns(df_combined)
                                     
                                     # Nettoyer les colonnes numériques
-                                    df_combined = clean_numeric_columns(df_combined)
+                                    df_combined, forcees = clean_numeric_frame(df_combined, BAM_NUMERIC_COLUMNS)
+                                    st.session_state.cleaning_report_bam = forcees
+                                    if sum(forcees.values()):
+                                        st.caption(f"ℹ️ {sum(forcees.values()):,} valeur(s) non numérique(s) remplacée(s) par 0".replace(',', ' '))
                                     
                                     # Ajouter Direction Régionale
                                     df_combined = add_direction_regionale(df_combined)
@@ -3605,20 +4710,24 @@ def import_bam_multi_annees():
                         all_dfs = []
                         
                         for annee in sorted(st.session_state.bam_years_data.keys()):
-                            df_year = st.session_state.bam_years_data[annee]['data'].copy()
-                            all_dfs.append(df_year)
+                            all_dfs.append(st.session_state.bam_years_data[annee]['data'])
                         
                         # Concaténer toutes les dataframes
                         df_final = pd.concat(all_dfs, ignore_index=True)
                         
                         # Stocker le résultat final
-                        st.session_state.bam_final_combined = df_final
-                        st.session_state.combined_data_bam = df_final  # Pour compatibilité
                         st.session_state.processing_done = True
                         
-                        # Calculer les totaux globaux
-                        st.session_state.total_depots_bam = df_final['Montant_Depots'].sum()
-                        st.session_state.total_credits_bam = df_final['Montant_Credits'].sum()
+                        # Données de la session (compactées, une seule copie) et totaux globaux :
+                        # les données par année deviennent des vues sur df_final
+                        st.session_state.bam_final_combined = df_final
+                        df_final = set_bam_data(df_final)
+                        
+                        # Enregistrer dans le stockage local (périodes combinées uniquement)
+                        _, sans_periode = write_bam_store(df_final)
+                        if sans_periode:
+                            st.warning(f"⚠️ {sans_periode} ligne(s) sans Annee ou mois non enregistrée(s) dans le stockage local")
+                        st.session_state.bam_loaded_from_store = False
                         
                         st.success(f"✅ Combinaison réussie ! {nb_annees_combinees} année(s) combinée(s)")
                         st.rerun()
@@ -3648,6 +4757,8 @@ def import_bam_multi_annees():
             nb_annees = df_final['Annee'].nunique() if 'Annee' in df_final.columns else 0
             st.metric("📅 Années", nb_annees)
         
+        show_bam_memory_report()
+        
         st.divider()
         
         # Aperçu des données
@@ -3697,33 +4808,60 @@ def visualisations_bam_avancees():
     
     st.header("📊 Visualisations BAM")
     
-    if st.session_state.combined_data_bam is None:
+    if load_bam_data() is None:
         st.warning("⚠️ Veuillez d'abord importer des données BAM")
         return
     
-    df_all = st.session_state.combined_data_bam.copy()
+    if st.session_state.get('bam_loaded_from_store'):
+        st.caption(f"💾 Données chargées depuis le stockage local ({BAM_STORE_DIR})")
+    
+    # Jeu partagé (share_dataset), lu sans copie : les vues travaillent sur
+    # des agrégats ou des sélections, jamais sur ses colonnes en place
+    df_all = st.session_state.combined_data_bam
     
     if 'Annee' not in df_all.columns or 'mois' not in df_all.columns:
         st.error("❌ Colonnes 'Annee' et 'mois' nécessaires")
         return
     
     # =========================================================================
-    # FONCTION POUR OBTENIR LE DERNIER MOIS DE CHAQUE ANNÉE
+    # CUBE PRÉ-AGRÉGÉ ET DERNIER MOIS DE CHAQUE ANNÉE (calculés une fois par version)
     # =========================================================================
     
-    def get_dernier_mois_par_annee(df):
-        """Retourne uniquement le dernier mois de chaque année"""
-        result = []
-        for annee in df['Annee'].unique():
-            df_y = df[df['Annee'] == annee]
-            mois_max = df_y['mois'].max()
-            df_dernier = df_y[df_y['mois'] == mois_max].copy()
-            result.append(df_dernier)
-        return pd.concat(result, ignore_index=True)
+    # Les onglets lisent des tranches du cube (Annee, mois, Direction_Regionale,
+    # Localite) au lieu de regrouper les lignes détaillées à chaque interaction
+    get_bam_cube()
+    
+    mois_noms = ['Jan','Fév','Mar','Avr','Mai','Jun','Jul','Aoû','Sep','Oct','Nov','Déc']
+    mois_communs = get_bam_common_months()
+    
+    col_ref1, col_ref2 = st.columns([2, 1])
+    with col_ref1:
+        reference = st.radio(
+            "📅 Mois de référence par année",
+            ["Dernier mois disponible", "Mois fixe (toutes années)"],
+            horizontal=True,
+            key="bam_reference_annuelle"
+        )
+    mois_fixe = None
+    if reference == "Mois fixe (toutes années)":
+        with col_ref2:
+            if mois_communs:
+                mois_fixe = st.selectbox(
+                    "Mois",
+                    options=mois_communs,
+                    index=len(mois_communs) - 1,
+                    format_func=lambda x: mois_noms[int(x)-1] if 1 <= x <= 12 else str(x),
+                    key="bam_mois_fixe"
+                )
+            else:
+                st.warning("Aucun mois commun à toutes les années")
     
-    df_derniers_mois = get_dernier_mois_par_annee(df_all)
+    df_derniers_mois = get_bam_cube_year_end(mois_fixe)
     
-    st.info("⚠️ **MÉTHODOLOGIE** : Toutes les analyses utilisent UNIQUEMENT le dernier mois de chaque année (JAMAIS de somme)")
+    if mois_fixe is None:
+        st.info("⚠️ **MÉTHODOLOGIE** : Toutes les analyses utilisent UNIQUEMENT le dernier mois de chaque année (JAMAIS de somme)")
+    else:
+        st.info(f"⚠️ **MÉTHODOLOGIE** : Toutes les analyses utilisent UNIQUEMENT le mois de {mois_noms[int(mois_fixe)-1]} de chaque année (périmètre constant, JAMAIS de somme)")
     
     st.divider()
     
@@ -3731,18 +4869,30 @@ def visualisations_bam_avancees():
     # ONGLETS
     # =========================================================================
     
-    tab1, tab2, tab3, tab4 = st.tabs([
+    # Seule la vue choisie est calculée (st.tabs exécute tous les onglets)
+    vues = [
         "📊 Répartition par Année",
         "🔍 Exploration Détaillée", 
         "📈 Évolution par Année",
         "🏙️ Top Localités"
-    ])
+    ]
+    vue = select_view(vues, key="bam_vue")
     
     # =========================================================================
     # TAB 1 : RÉPARTITION PAR ANNÉE
     # =========================================================================
     
-    with tab1:
+    _render_bam_view(vue, vues, df_derniers_mois, mois_noms)
+
+
+@st.fragment
+def _render_bam_view(vue, vues, df_derniers_mois, mois_noms):
+    """
+    Vue active des visualisations BAM. Fragment : ses widgets (année, mois,
+    région, périodes, Top N) ne relancent que cette vue, à partir du cube
+    et des instantanés en cache.
+    """
+    if vue == vues[0]:
         st.subheader("Répartition par Année")
         
         st.info("💡 Chaque année est évaluée par son DERNIER MOIS uniquement")
@@ -3757,7 +4907,7 @@ def visualisations_bam_avancees():
             mois_noms = ['Jan','Fév','Mar','Avr','Mai','Jun','Jul','Aoû','Sep','Oct','Nov','Déc']
             nom_mois = mois_noms[int(mois_num)-1] if 1 <= mois_num <= 12 else str(mois_num)
             
-            nb_lignes = len(df_y)
+            nb_lignes = int(df_y['Nb_Lignes'].sum())
             total_depots = df_y['Montant_Depots'].sum()
             total_credits = df_y['Montant_Credits'].sum()
             
@@ -3834,25 +4984,25 @@ def visualisations_bam_avancees():
     # TAB 2 : EXPLORATION DÉTAILLÉE
     # =========================================================================
     
-    with tab2:
+    if vue == vues[1]:
         st.subheader("Exploration Détaillée")
         
         col_sel1, col_sel2 = st.columns(2)
         
         # Sélection année
         with col_sel1:
-            annees_dispo = sorted(df_all['Annee'].unique())
+            annees_dispo = sorted(st.session_state.bam_year_bounds)
             annee_select = st.selectbox(
                 "📅 Sélectionnez une année",
                 options=annees_dispo,
                 key="annee_explore"
             )
         
-        df_annee = df_all[df_all['Annee'] == annee_select]
+        df_annee = get_bam_cube_year(annee_select)
         
         # Sélection mois
         with col_sel2:
-            mois_dispo = sorted(df_annee['mois'].unique())
+            mois_dispo = get_bam_months(annee_select)
             mois_noms = ['Jan','Fév','Mar','Avr','Mai','Jun','Jul','Aoû','Sep','Oct','Nov','Déc']
             
             mois_select = st.selectbox(
@@ -3862,7 +5012,7 @@ def visualisations_bam_avancees():
                 key="mois_explore"
             )
         
-        df_mois = df_annee[df_annee['mois'] == mois_select]
+        df_mois = get_bam_cube_period(annee_select, mois_select)
         
         st.divider()
         
@@ -3983,7 +5133,7 @@ def visualisations_bam_avancees():
                 
                 st.write(f"**🏙️ Localités de {region_select}**")
                 
-                df_loc_region = df_region.groupby('Localite').agg({
+                df_loc_region = df_region.groupby('Localite', observed=True).agg({
                     'Montant_Depots': 'sum',
                     'Montant_Credits': 'sum'
                 }).reset_index().sort_values('Montant_Depots', ascending=False)
@@ -4036,7 +5186,7 @@ def visualisations_bam_avancees():
     # TAB 3 : ÉVOLUTION PAR ANNÉE
     # =========================================================================
     
-    with tab3:
+    if vue == vues[2]:
         st.subheader("Évolution par Année")
         
         st.info("💡 Chaque point représente le DERNIER MOIS de l'année")
@@ -4131,12 +5281,11 @@ def visualisations_bam_avancees():
             st.write("**Période 1**")
             col_a1, col_m1 = st.columns(2)
             with col_a1:
-                annee_p1 = st.selectbox("Année", options=sorted(df_all['Annee'].unique()), key="annee_p1")
-            df_a1 = df_all[df_all['Annee'] == annee_p1]
+                annee_p1 = st.selectbox("Année", options=sorted(st.session_state.bam_year_bounds), key="annee_p1")
             with col_m1:
                 mois_p1 = st.selectbox(
                     "Mois",
-                    options=sorted(df_a1['mois'].unique()),
+                    options=get_bam_months(annee_p1),
                     format_func=lambda x: mois_noms[int(x)-1] if 1 <= x <= 12 else str(x),
                     key="mois_p1"
                 )
@@ -4147,31 +5296,25 @@ def visualisations_bam_avancees():
             with col_a2:
                 annee_p2 = st.selectbox(
                     "Année",
-                    options=sorted(df_all['Annee'].unique()),
-                    index=min(len(sorted(df_all['Annee'].unique()))-1, 1),
+                    options=sorted(st.session_state.bam_year_bounds),
+                    index=min(len(st.session_state.bam_year_bounds)-1, 1),
                     key="annee_p2"
                 )
-            df_a2 = df_all[df_all['Annee'] == annee_p2]
             with col_m2:
                 mois_p2 = st.selectbox(
                     "Mois",
-                    options=sorted(df_a2['mois'].unique()),
+                    options=get_bam_months(annee_p2),
                     format_func=lambda x: mois_noms[int(x)-1] if 1 <= x <= 12 else str(x),
                     key="mois_p2"
                 )
         
         if st.button("Calculer le Taux de Croissance", type="primary", use_container_width=True):
             
-            df_per1 = df_all[(df_all['Annee'] == annee_p1) & (df_all['mois'] == mois_p1)]
-            d1 = df_per1['Montant_Depots'].sum()
-            c1 = df_per1['Montant_Credits'].sum()
-            
-            df_per2 = df_all[(df_all['Annee'] == annee_p2) & (df_all['mois'] == mois_p2)]
-            d2 = df_per2['Montant_Depots'].sum()
-            c2 = df_per2['Montant_Credits'].sum()
-            
-            taux_d = ((d2 - d1) / d1 * 100) if d1 > 0 else 0
-            taux_c = ((c2 - c1) / c1 * 100) if c1 > 0 else 0
+            comparaison = compare_bam_periods((annee_p1, mois_p1), (annee_p2, mois_p2))
+            d1, d2 = comparaison['depots']
+            c1, c2 = comparaison['credits']
+            taux_d = comparaison['taux_depots']
+            taux_c = comparaison['taux_credits']
             
             st.divider()
             
@@ -4226,50 +5369,18 @@ def visualisations_bam_avancees():
             
             st.write("**📊 Analyse Détaillée : Contribution des Localités à la Croissance**")
             
-            # Grouper par localité pour chaque période
-            df_loc_p1 = df_per1.groupby('Localite').agg({
-                'Montant_Depots': 'sum',
-                'Montant_Credits': 'sum'
-            }).reset_index()
-            
-            df_loc_p2 = df_per2.groupby('Localite').agg({
-                'Montant_Depots': 'sum',
-                'Montant_Credits': 'sum'
-            }).reset_index()
-            
-            # Fusionner les deux périodes
-            df_compare_loc = df_loc_p1.merge(
-                df_loc_p2,
-                on='Localite',
-                how='outer',
-                suffixes=('_P1', '_P2')
-            ).fillna(0)
-            
-            # Calculer les variations
-            df_compare_loc['Variation_Depots'] = df_compare_loc['Montant_Depots_P2'] - df_compare_loc['Montant_Depots_P1']
-            df_compare_loc['Variation_Credits'] = df_compare_loc['Montant_Credits_P2'] - df_compare_loc['Montant_Credits_P1']
-            
-            # Calculer la contribution en % de chaque localité
-            variation_totale_depots = d2 - d1
-            variation_totale_credits = c2 - c1
-            
-            if variation_totale_depots != 0:
-                df_compare_loc['Contribution_Depots_%'] = (df_compare_loc['Variation_Depots'] / variation_totale_depots * 100)
-            else:
-                df_compare_loc['Contribution_Depots_%'] = 0
-            
-            if variation_totale_credits != 0:
-                df_compare_loc['Contribution_Credits_%'] = (df_compare_loc['Variation_Credits'] / variation_totale_credits * 100)
-            else:
-                df_compare_loc['Contribution_Credits_%'] = 0
+            # Contributions par localité (toutes localités, y compris entrées / sorties)
+            df_compare_loc = comparaison['localites']
             
-            # Trier par contribution aux dépôts
-            df_compare_loc = df_compare_loc.sort_values('Contribution_Depots_%', ascending=False)
+            nb_entrees = int((df_compare_loc['Statut'] == 'Entrée').sum())
+            nb_sorties = int((df_compare_loc['Statut'] == 'Sortie').sum())
+            if nb_entrees or nb_sorties:
+                st.caption(f"🆕 {nb_entrees} localité(s) apparue(s), {nb_sorties} localité(s) disparue(s) entre les deux périodes")
             
             # Afficher les top contributeurs
             st.write(f"**🔝 Top 10 Localités Contribuant à la Croissance**")
             
-            df_top_contrib = df_compare_loc.head(10).copy()
+            df_top_contrib = top_k_rows(df_compare_loc, 'Contribution_Depots_%', 10)
             
             # Préparer l'affichage
             df_display = pd.DataFrame({
@@ -4327,8 +5438,9 @@ def visualisations_bam_avancees():
             top_localite_depots = df_top_contrib.iloc[0]['Localite'] if len(df_top_contrib) > 0 else "N/A"
             top_contrib_depots = df_top_contrib.iloc[0]['Contribution_Depots_%'] if len(df_top_contrib) > 0 else 0
             
-            top_localite_credits = df_compare_loc.sort_values('Contribution_Credits_%', ascending=False).iloc[0]['Localite'] if len(df_compare_loc) > 0 else "N/A"
-            top_contrib_credits = df_compare_loc.sort_values('Contribution_Credits_%', ascending=False).iloc[0]['Contribution_Credits_%'] if len(df_compare_loc) > 0 else 0
+            df_top_credits = top_k_rows(df_compare_loc, 'Contribution_Credits_%', 1)
+            top_localite_credits = df_top_credits.iloc[0]['Localite'] if len(df_top_credits) > 0 else "N/A"
+            top_contrib_credits = df_top_credits.iloc[0]['Contribution_Credits_%'] if len(df_top_credits) > 0 else 0
             
             st.info(f"""
             **Dépôts :**
@@ -4345,7 +5457,7 @@ def visualisations_bam_avancees():
     # TAB 4 : TOP LOCALITÉS
     # =========================================================================
     
-    with tab4:
+    if vue == vues[3]:
         st.subheader("Top Localités")
         
         st.info("💡 Basé sur les DERNIERS MOIS des années sélectionnées")
@@ -4368,7 +5480,7 @@ def visualisations_bam_avancees():
         
         st.divider()
         
-        df_loc = df_top_filtered.groupby('Localite').agg({
+        df_loc = df_top_filtered.groupby('Localite', observed=True).agg({
             'Montant_Depots': 'sum',
             'Montant_Credits': 'sum'
         }).reset_index().sort_values('Montant_Depots', ascending=False)
@@ -4456,141 +5568,316 @@ def visualisations_bam_avancees():
 # ============================================================================
 
 import re
+import codecs
+from io import StringIO
 from datetime import datetime
 
-def parse_balance_txt(txt_content, type_document="Produits"):
+# Taille des blocs lus dans les fichiers Balance (en octets)
+BALANCE_CHUNK_SIZE = 1024 * 1024
+
+# Parsing parallèle : taille minimale d'un segment (groupe d'agences consécutives)
+# envoyé à un processus, et nombre de processus par défaut
+BALANCE_SEGMENT_SIZE = 8 * 1024 * 1024
+BALANCE_PARSE_WORKERS = PROCESS_POOL_MAX_WORKERS
+
+# Cache des balances parsées (clé : SHA-256 du fichier + type de document).
+# Le répertoire disque est optionnel (vide = cache mémoire uniquement).
+BALANCE_CACHE_MAX_ENTRIES = 8
+BALANCE_CACHE_DIR = os.environ.get('BALANCE_CACHE_DIR', '')
+
+# Colonnes produites par le parser Balance (dans l'ordre)
+BALANCE_COLUMNS = [
+    'ID_AGENCI', 'DESC_AGENCE', 'ID_ACCOUNT', 'DESC_ACCOUNT',
+    'Montants', 'TOP_ACCOUNT', 'TOP_ACCOUNT_DESC', 'Type'
+]
+
+# Motif unique de classification des lignes (appliqué ligne par ligne) :
+#   - en-tête d'agence       : "AGENCE : <id> <description>"
+#   - TOP_ACCOUNT            : | 7023 | intitulé | débit | crédit
+#   - compte détaillé        : | 000 0570102 | intitulé | débit | crédit
+_BALANCE_LINE_RE = re.compile(
+    r'(?=.*AGENCE).*?AGENCE\s*:\s*(?P<agence_id>\d+)\s+(?P<agence_desc>.+)'
+    r'|'
+    r'[^|]*\|\s*(?:(?P<top>\d{4})|000\s+(?P<compte>\d[^|]*?))\s*'
+    r'\|(?P<intitule>[^|]*)\|(?P<debit>[^|]*)\|(?P<credit>[^|]*)'
+)
+
+# Marqueurs des lignes non-données (cadres, en-têtes de colonnes, soldes)
+_BALANCE_SKIP_MARKERS = ('*---', '+---', 'No DU COMPTE', 'INTITULE DU COMPTE', 'SOLDES')
+
+
+def _is_balance_skip_line(ligne):
+    """Vrai pour une ligne de cadre, d'en-tête, de total ou trop courte."""
+    for marqueur in _BALANCE_SKIP_MARKERS:
+        if marqueur in ligne:
+            return True
+    if len(ligne.strip()) < 10:
+        return True
+    return 'TOTAL' in ligne and 'GENERAL' in ligne
+
+
+def iter_balance_blocks(source, chunk_size=BALANCE_CHUNK_SIZE, encoding='utf-8'):
     """
-    Parser CORRIGÉ pour fichiers Balance SGMB
+    Lit un fichier Balance par blocs de taille fixe et produit des blocs de
+    lignes complètes (sans '\\r').
     
-    LOGIQUE CORRECTE :
-    Les comptes détaillés (000 XXXXX) appartiennent au TOP_ACCOUNT qui vient APRÈS eux.
-    
-    Exemple :
-    | 000 0570102  |INT DEBIT...|0,00|4 211,40|...    ← Compte
-    |   7023       |- INT.S/... |0,00|4 211,40|...    ← TOP_ACCOUNT pour le compte au-dessus
-    | 000 0570550  |INTERETS ...|0,00|15 683,77|...   ← Nouveau compte
-    |   7101       |INTERETS ...|0,00|131 787,35|...  ← TOP_ACCOUNT pour les comptes au-dessus
+    `source` peut être le texte déjà décodé ou un objet fichier (fichier
+    uploadé Streamlit, BytesIO...). Les octets sont décodés au fil de l'eau :
+    le contenu complet n'est jamais chargé en mémoire.
+    """
+    if isinstance(source, str):
+        source = StringIO(source)
+    
+    decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+    reste = ''
+    
+    while True:
+        bloc = source.read(chunk_size)
+        if not bloc:
+            break
+        if isinstance(bloc, bytes):
+            bloc = decoder.decode(bloc)
+        
+        bloc = reste + bloc.replace('\r', '')
+        # La dernière ligne peut être incomplète : on la garde pour le bloc suivant
+        coupure = bloc.rfind('\n') + 1
+        reste = bloc[coupure:]
+        if coupure:
+            yield bloc[:coupure]
+    
+    reste += decoder.decode(b'', final=True).replace('\r', '')
+    if reste:
+        yield reste
+
+
+def iter_balance_records(blocks, flush_pending=True):
+    """
+    Générateur : produit un tuple par compte détaillé
+    (ID_AGENCI, DESC_AGENCE, ID_ACCOUNT, DESC_ACCOUNT, débit, crédit,
+    TOP_ACCOUNT, TOP_ACCOUNT_DESC), les montants restant au format texte.
+    
+    Les comptes détaillés (000 XXXXX) sont mis en attente jusqu'au
+    TOP_ACCOUNT qui vient APRÈS eux ; le buffer est vidé à chaque nouvelle
+    agence. Les comptes restant en attente en fin de fichier sont produits
+    avec un TOP_ACCOUNT vide (sauf si `flush_pending` est faux : segment
+    suivi d'une autre agence, qui aurait vidé le buffer).
     """
-    
-    # Nettoyer le contenu
-    lines = txt_content.replace('\r', '').split('\n')
-    
-    data = []
     current_agence_id = None
     current_agence_desc = None
     
-    # NOUVEAU : Buffer pour stocker les comptes en attente d'un TOP_ACCOUNT
+    # Buffer pour stocker les comptes en attente d'un TOP_ACCOUNT
     pending_comptes = []
     
-    for line in lines:
-        # ─────────────────────────────────────────────────────────────────
-        # 1. Détecter l'agence
-        # ─────────────────────────────────────────────────────────────────
-        if 'AGENCE' in line and ':' in line:
-            match = re.search(r'AGENCE\s*:\s*(\d+)\s+(.+)', line)
-            if match:
-                current_agence_id = match.group(1).strip()
-                current_agence_desc = match.group(2).strip()
-                # Réinitialiser le buffer pour une nouvelle agence
-                pending_comptes = []
+    for bloc in blocks:
+        for ligne in bloc.split('\n'):
+            match = _BALANCE_LINE_RE.match(ligne)
+            if match is None:
                 continue
-        
-        # ─────────────────────────────────────────────────────────────────
-        # 2. Ignorer les lignes non-données
-        # ─────────────────────────────────────────────────────────────────
-        if '*---' in line or '+---' in line:
-            continue
-        if 'No DU COMPTE' in line or 'INTITULE DU COMPTE' in line or 'SOLDES' in line:
-            continue
-        if not line.strip() or len(line.strip()) < 10:
-            continue
-        if 'TOTAL' in line and 'GENERAL' in line:
-            continue
-        
-        # ─────────────────────────────────────────────────────────────────
-        # 3. Parser les lignes avec des pipes |...|
-        # ─────────────────────────────────────────────────────────────────
-        if '|' in line:
-            parts = line.split('|')
+            agence_id, agence_desc, top, compte, intitule, debit, credit = match.groups()
             
-            if len(parts) < 5:
-                continue
+            # En-tête d'agence : réinitialiser le buffer
+            if agence_id is not None:
+                current_agence_id = agence_id
+                current_agence_desc = agence_desc.strip()
+                pending_comptes = []
             
-            try:
-                compte = parts[1].strip()
-                intitule = parts[2].strip()
-                debit = parts[3].strip()
-                credit = parts[4].strip() if len(parts) > 4 else "0,00"
-            except:
+            # Ignorer les lignes non-données
+            elif _is_balance_skip_line(ligne):
                 continue
             
-            # ─────────────────────────────────────────────────────────────
-            # 4. Identifier le type de ligne
-            # ─────────────────────────────────────────────────────────────
-            
-            # Ligne TOP_ACCOUNT : juste des chiffres (ex: "7023" ou "  7023  ")
-            if re.match(r'^\s*\d{4}\s*$', compte):
-                top_account = compte.strip()
-                top_account_desc = intitule
-                
-                # NOUVEAU : Assigner ce TOP_ACCOUNT à tous les comptes en attente
+            # TOP_ACCOUNT : assigner à tous les comptes en attente
+            elif top is not None:
+                intitule = intitule.strip()
                 for pending_compte in pending_comptes:
-                    pending_compte['TOP_ACCOUNT'] = top_account
-                    pending_compte['TOP_ACCOUNT_DESC'] = top_account_desc
-                    data.append(pending_compte)
-                
-                # Vider le buffer
+                    yield pending_compte + (top, intitule)
                 pending_comptes = []
-                continue
             
-            # Ligne COMPTE détaillé : commence par "000 " (ex: "000 0570102")
-            if re.match(r'^\s*000\s+\d+', compte):
-                compte_num = re.sub(r'^\s*000\s+', '', compte).strip()
-                
-                # Convertir les montants
-                try:
-                    debit_clean = debit.replace(' ', '').replace(',', '.')
-                    credit_clean = credit.replace(' ', '').replace(',', '.')
-                    
-                    debit_val = float(debit_clean) if debit_clean and debit_clean != '0.00' else 0
-                    credit_val = float(credit_clean) if credit_clean and credit_clean != '0.00' else 0
-                    
-                    if type_document == "Produits":
-                        montant = credit_val - debit_val
-                    else:
-                        montant = debit_val - credit_val
-                    
-                except Exception as e:
-                    montant = 0
-                
-                # NOUVEAU : Ajouter au buffer (sans TOP_ACCOUNT pour l'instant)
-                pending_comptes.append({
-                    'ID_AGENCI': current_agence_id,
-                    'DESC_AGENCE': current_agence_desc,
-                    'ID_ACCOUNT': compte_num,
-                    'DESC_ACCOUNT': intitule,
-                    'Montants': montant,
-                    'TOP_ACCOUNT': None,  # Sera rempli plus tard
-                    'TOP_ACCOUNT_DESC': None,  # Sera rempli plus tard
-                    'Type': type_document
-                })
+            # Compte détaillé : ajouter au buffer (sans TOP_ACCOUNT pour l'instant)
+            else:
+                pending_comptes.append((
+                    current_agence_id, current_agence_desc, compte,
+                    intitule.strip(), debit.strip(), credit.strip()
+                ))
+    
+    # À la fin, s'il reste des comptes sans TOP_ACCOUNT, les ajouter quand même
+    if flush_pending:
+        for pending_compte in pending_comptes:
+            yield pending_compte + ('', '')
+
+
+def _find_agence_boundary(texte, debut):
+    """
+    Position du début de la première ligne d'en-tête d'agence située à partir
+    de `debut` dans `texte` (lignes complètes), ou -1 s'il n'y en a pas.
+    """
+    pos = texte.find('AGENCE', debut)
+    while pos != -1:
+        ligne_debut = texte.rfind('\n', 0, pos) + 1
+        ligne_fin = texte.find('\n', pos)
+        if ligne_fin == -1:
+            ligne_fin = len(texte)
+        match = _BALANCE_LINE_RE.match(texte, ligne_debut, ligne_fin)
+        if ligne_debut > 0 and match is not None and match.group('agence_id') is not None:
+            return ligne_debut
+        pos = texte.find('AGENCE', ligne_fin)
+    return -1
+
+
+def iter_balance_segments(blocks, segment_size=BALANCE_SEGMENT_SIZE):
+    """
+    Regroupe les blocs de lignes en segments d'au moins `segment_size`
+    caractères, coupés uniquement sur un en-tête d'agence.
+    
+    Chaque agence remet à zéro le buffer des comptes en attente : les segments
+    sont donc indépendants et peuvent être parsés séparément. Produit des
+    tuples (texte, est_dernier).
+    """
+    precedent = None
+    tampon = ''
+    recherche = 0
+    
+    for bloc in blocks:
+        tampon += bloc
+        if len(tampon) < segment_size:
+            continue
+        coupure = _find_agence_boundary(tampon, max(recherche, segment_size))
+        if coupure == -1:
+            recherche = len(tampon)
+            continue
+        if precedent is not None:
+            yield precedent, False
+        precedent = tampon[:coupure]
+        tampon = tampon[coupure:]
+        recherche = 0
+    
+    if precedent is not None:
+        yield precedent, False
+    yield tampon, True
+
+
+def _convert_balance_amounts(valeurs):
+    """
+    Convertit en une passe des montants au format français ("4 211,40").
+    Renvoie un tableau float : 0 pour une valeur vide, NaN si invalide.
+    """
+    textes = pd.Series(valeurs, dtype=object).str.replace(' ', '', regex=False).str.replace(',', '.', regex=False)
+    nombres = pd.to_numeric(textes, errors='coerce')
+    return nombres.mask(textes == '', 0.0).to_numpy(dtype=np.float64)
+
+
+def _build_balance_frame(records, type_document):
+    """
+    Construit le DataFrame Balance à partir des enregistrements texte.
+    
+    Les enregistrements sont accumulés par colonne puis les montants débit /
+    crédit sont convertis en une seule passe vectorisée à la fin.
+    """
+    agences, desc_agences, comptes, desc_comptes = [], [], [], []
+    debits, credits = [], []
+    tops, desc_tops = [], []
+    
+    for agence, desc_agence, compte, desc_compte, debit, credit, top, desc_top in records:
+        agences.append(agence)
+        desc_agences.append(desc_agence)
+        comptes.append(compte)
+        desc_comptes.append(desc_compte)
+        debits.append(debit)
+        credits.append(credit)
+        tops.append(top)
+        desc_tops.append(desc_top)
+    
+    # Convertir les montants (un montant invalide met la ligne à 0)
+    debit_vals = _convert_balance_amounts(debits)
+    credit_vals = _convert_balance_amounts(credits)
+    
+    if type_document == "Produits":
+        montants = credit_vals - debit_vals
+    else:
+        montants = debit_vals - credit_vals
+    montants[np.isnan(montants)] = 0
+    
+    return pd.DataFrame({
+        'ID_AGENCI': pd.Series(agences, dtype=object).astype(str),
+        'DESC_AGENCE': pd.Series(desc_agences, dtype=object),
+        'ID_ACCOUNT': pd.Series(comptes, dtype=object),
+        'DESC_ACCOUNT': pd.Series(desc_comptes, dtype=object),
+        'Montants': montants,
+        'TOP_ACCOUNT': pd.Series(tops, dtype=object),
+        'TOP_ACCOUNT_DESC': pd.Series(desc_tops, dtype=object),
+        'Type': type_document
+    }, columns=BALANCE_COLUMNS)
+
+
+def _parse_balance_segment(texte, est_dernier, type_document):
+    """
+    Parse un segment de fichier Balance (exécuté dans un processus du pool).
+    """
+    records = iter_balance_records([texte], flush_pending=est_dernier)
+    return _build_balance_frame(records, type_document)
+
+
+def _parse_balance_parallel(source, type_document, workers):
+    """
+    Découpe le fichier aux en-têtes d'agence et parse les segments dans le
+    pool de processus du serveur. Les résultats sont concaténés dans l'ordre
+    du fichier.
+    
+    Au plus 2 × `workers` segments sont en cours à la fois : le texte d'un
+    segment est libéré dès son résultat reçu. Si le parsing parallèle échoue
+    (pool cassé, sérialisation...), le fichier est relu et parsé
+    séquentiellement.
+    """
+    debut = None if isinstance(source, str) else source.tell()
+    segments = iter_balance_segments(iter_balance_blocks(source))
+    
+    # Fichier tenant en un seul segment : pas de pool
+    texte, est_dernier = next(segments)
+    if est_dernier:
+        return _parse_balance_segment(texte, est_dernier, type_document)
+    
+    taches = (
+        (segment, dernier, type_document)
+        for segment, dernier in itertools.chain(iter([(texte, est_dernier)]), segments)
+    )
+    del texte
+    
+    frames = []
+    try:
+        for future in iter_process_pool(_parse_balance_segment, taches, 2 * workers):
+            frames.append(future.result())
+    except Exception as e:
+        print(f"⚠️ Parsing parallèle indisponible ({e}) : parsing séquentiel")
+        if isinstance(e, BrokenProcessPool):
+            reset_process_pool()
+        if debut is not None:
+            source.seek(debut)
+        return _build_balance_frame(iter_balance_records(iter_balance_blocks(source)), type_document)
+    
+    return pd.concat(frames, ignore_index=True)
+
+
+def parse_balance_txt(source, type_document="Produits", workers=1):
+    """
+    Parser CORRIGÉ pour fichiers Balance SGMB
     
-    # NOUVEAU : À la fin, s'il reste des comptes sans TOP_ACCOUNT, les ajouter quand même
-    for pending_compte in pending_comptes:
-        if pending_compte['TOP_ACCOUNT'] is None:
-            pending_compte['TOP_ACCOUNT'] = ''
-            pending_compte['TOP_ACCOUNT_DESC'] = ''
-        data.append(pending_compte)
+    `source` : texte décodé ou fichier uploadé (lu par blocs, en streaming).
+    `workers` : nombre de processus ; au-delà de 1, le fichier est découpé aux
+    en-têtes d'agence et les segments sont parsés en parallèle.
     
-    # Créer DataFrame
-    df = pd.DataFrame(data)
+    LOGIQUE CORRECTE :
+    Les comptes détaillés (000 XXXXX) appartiennent au TOP_ACCOUNT qui vient APRÈS eux.
+    
+    Exemple :
+    | 000 0570102  |INT DEBIT...|0,00|4 211,40|...    ← Compte
+    |   7023       |- INT.S/... |0,00|4 211,40|...    ← TOP_ACCOUNT pour le compte au-dessus
+    | 000 0570550  |INTERETS ...|0,00|15 683,77|...   ← Nouveau compte
+    |   7101       |INTERETS ...|0,00|131 787,35|...  ← TOP_ACCOUNT pour les comptes au-dessus
+    """
     
-    # Nettoyer et convertir
-    if len(df) > 0:
-        df['Montants'] = pd.to_numeric(df['Montants'], errors='coerce').fillna(0)
-        df['ID_AGENCI'] = df['ID_AGENCI'].astype(str)
-        df['ID_ACCOUNT'] = df['ID_ACCOUNT'].astype(str)
-        df['TOP_ACCOUNT'] = df['TOP_ACCOUNT'].fillna('').astype(str)
+    if workers > 1:
+        df = _parse_balance_parallel(source, type_document, workers)
+    else:
+        df = _build_balance_frame(iter_balance_records(iter_balance_blocks(source)), type_document)
     
     print(f"✅ Parser v3 : {len(df)} lignes extraites")
     print(f"   Agences uniques : {df['ID_AGENCI'].nunique() if len(df) > 0 else 0}")
@@ -4599,6 +5886,93 @@ def parse_balance_txt(txt_content, type_document="Produits"):
     return df
 
 
+def hash_balance_file(source, chunk_size=BALANCE_CHUNK_SIZE):
+    """
+    SHA-256 du contenu d'un fichier Balance (texte ou fichier uploadé),
+    calculé par blocs. Le fichier est rembobiné après lecture.
+    """
+    if isinstance(source, str):
+        return hashlib.sha256(source.encode('utf-8')).hexdigest()
+    
+    sha = hashlib.sha256()
+    source.seek(0)
+    while True:
+        bloc = source.read(chunk_size)
+        if not bloc:
+            break
+        sha.update(bloc if isinstance(bloc, bytes) else bloc.encode('utf-8'))
+    source.seek(0)
+    return sha.hexdigest()
+
+
+def balance_file_digest(source):
+    """
+    Empreinte (hash_balance_file) d'un fichier Balance, mémorisée dans la
+    session pour chaque fichier uploadé (file_id, nom, taille) : aux reruns,
+    le cache est consulté sans relire le fichier.
+    """
+    file_id = getattr(source, 'file_id', None)
+    if file_id is None:
+        return hash_balance_file(source)
+    cle = (file_id, source.name, source.size)
+    empreintes = st.session_state.setdefault('_balance_digests', {})
+    if cle not in empreintes:
+        empreintes[cle] = hash_balance_file(source)
+    return empreintes[cle]
+
+
+@st.cache_resource
+def _get_balance_parse_cache():
+    """
+    Cache LRU des balances parsées, partagé par toutes les sessions du serveur.
+    """
+    return new_lru_cache()
+
+
+def _balance_cache_path(digest, type_document):
+    """Chemin Parquet du cache disque, ou None si le cache disque est inactif."""
+    if not BALANCE_CACHE_DIR or not PARQUET_DISPONIBLE:
+        return None
+    return os.path.join(BALANCE_CACHE_DIR, f"{digest}_{type_document}.parquet")
+
+
+def parse_balance_cached(source, type_document="Produits", workers=1):
+    """
+    Parse un fichier Balance en passant par le cache (mémoire puis disque).
+    
+    Un fichier inchangé n'est parsé qu'une fois par vie du serveur, quels que
+    soient les reruns et les sessions ; aux reruns, l'empreinte d'un fichier
+    uploadé est reprise de la session (balance_file_digest). Le DataFrame
+    renvoyé est partagé : il ne doit pas être modifié en place.
+    """
+    cache = _get_balance_parse_cache()
+    digest = balance_file_digest(source)
+    cle = (digest, type_document)
+    
+    df = lru_cache_get(cache, cle)
+    if df is not None:
+        return df
+    
+    chemin = _balance_cache_path(digest, type_document)
+    if chemin and os.path.exists(chemin):
+        try:
+            df = pd.read_parquet(chemin)
+        except Exception as e:
+            print(f"⚠️ Cache Balance illisible ({e}) : nouveau parsing")
+    
+    if df is None:
+        df = parse_balance_txt(source, type_document=type_document, workers=workers)
+        if chemin:
+            try:
+                os.makedirs(BALANCE_CACHE_DIR, exist_ok=True)
+                df.to_parquet(chemin, index=False)
+            except Exception as e:
+                print(f"⚠️ Écriture du cache Balance impossible : {e}")
+    
+    lru_cache_put(cache, cle, df, BALANCE_CACHE_MAX_ENTRIES)
+    return df
+
+
 def convert_balance_to_excel(df, filename="Balance_Export.xlsx"):
     """
     Convertit le DataFrame en fichier Excel téléchargeable.
@@ -4610,6 +5984,20 @@ def convert_balance_to_excel(df, filename="Balance_Export.xlsx"):
     return output.getvalue()
 
 
+def summarize_balance_agences(df_produits, df_charges):
+    """Produits, charges, résultat net et marge par agence (trié par résultat net)."""
+    agence_produits = df_produits.groupby(['ID_AGENCI', 'DESC_AGENCE'])['Montants'].sum().reset_index()
+    agence_produits.columns = ['ID_AGENCI', 'DESC_AGENCE', 'Produits']
+    
+    agence_charges = df_charges.groupby(['ID_AGENCI', 'DESC_AGENCE'])['Montants'].sum().reset_index()
+    agence_charges.columns = ['ID_AGENCI', 'DESC_AGENCE', 'Charges']
+    
+    agence_summary = agence_produits.merge(agence_charges, on=['ID_AGENCI', 'DESC_AGENCE'], how='outer').fillna(0)
+    agence_summary['Resultat_Net'] = agence_summary['Produits'] - agence_summary['Charges']
+    agence_summary['Marge_%'] = (agence_summary['Resultat_Net'] / agence_summary['Produits'] * 100).replace([float('inf'), -float('inf')], 0).fillna(0)
+    return agence_summary.sort_values('Resultat_Net', ascending=False)
+
+
 def visualisations_balance(df_produits, df_charges):
     """
     Crée les visualisations pour le module Balance.
@@ -4617,8 +6005,11 @@ def visualisations_balance(df_produits, df_charges):
     
     st.header("📊 Analyse Balance - Produits & Charges")
     
-    # Combiner les deux DataFrames
-    df_all = pd.concat([df_produits, df_charges], ignore_index=True)
+    # Combiner les deux DataFrames (une fois par couple de fichiers)
+    df_all = memo_view(
+        'balance_all', (df_produits, df_charges),
+        lambda: pd.concat([df_produits, df_charges], ignore_index=True)
+    )
     
     if len(df_all) == 0:
         st.warning("⚠️ Aucune donnée à visualiser")
@@ -4654,18 +6045,30 @@ def visualisations_balance(df_produits, df_charges):
     # ONGLETS
     # =========================================================================
     
-    tab1, tab2, tab3, tab4 = st.tabs([
+    # Seule la vue choisie est calculée (st.tabs exécute tous les onglets)
+    vues = [
         "📊 Vue Globale",
         "🏦 Analyse par Agence",
         "🎯 Analyse par Compte",
         "📋 Données Détaillées"
-    ])
+    ]
+    vue = select_view(vues, key="balance_vue")
     
+    _render_balance_view(vue, vues, df_produits, df_charges, df_all, total_produits, total_charges, resultat_net)
+
+
+@st.fragment
+def _render_balance_view(vue, vues, df_produits, df_charges, df_all, total_produits, total_charges, resultat_net):
+    """
+    Vue active de l'analyse Balance. Fragment : les filtres (tri, nombre
+    d'agences, recherche, type, agence, compte) ne relancent que cette vue,
+    à partir des agrégations mémorisées.
+    """
     # ─────────────────────────────────────────────────────────────────────────
     # TAB 1 : VUE GLOBALE
     # ─────────────────────────────────────────────────────────────────────────
     
-    with tab1:
+    if vue == vues[0]:
         st.subheader("Vue d'Ensemble")
         
         # Graphique Produits vs Charges
@@ -4770,259 +6173,254 @@ def visualisations_balance(df_produits, df_charges):
     # TAB 2 : ANALYSE PAR AGENCE - VERSION AMÉLIORÉE
     # =========================================================================
 
-    with tab2:
+    if vue == vues[1]:
         st.subheader("Analyse par Agence")
     
-        # Agrégation par agence
-        agence_produits = df_produits.groupby(['ID_AGENCI', 'DESC_AGENCE'])['Montants'].sum().reset_index()
-        agence_produits.columns = ['ID_AGENCI', 'DESC_AGENCE', 'Produits']
-    
-        agence_charges = df_charges.groupby(['ID_AGENCI', 'DESC_AGENCE'])['Montants'].sum().reset_index()
-        agence_charges.columns = ['ID_AGENCI', 'DESC_AGENCE', 'Charges']
-    
-        agence_summary = agence_produits.merge(agence_charges, on=['ID_AGENCI', 'DESC_AGENCE'], how='outer').fillna(0)
-        agence_summary['Resultat_Net'] = agence_summary['Produits'] - agence_summary['Charges']
-        agence_summary['Marge_%'] = (agence_summary['Resultat_Net'] / agence_summary['Produits'] * 100).replace([float('inf'), -float('inf')], 0).fillna(0)
-        agence_summary = agence_summary.sort_values('Resultat_Net', ascending=False)
+        # Agrégation par agence (mémorisée tant que les fichiers ne changent pas)
+        agence_summary = memo_view(
+            'balance_agences', (df_produits, df_charges),
+            lambda: summarize_balance_agences(df_produits, df_charges)
+        )
     
-    # ─────────────────────────────────────────────────────────────────────
-    # MÉTRIQUES GLOBALES
-    # ─────────────────────────────────────────────────────────────────────
+        # ─────────────────────────────────────────────────────────────────────
+        # MÉTRIQUES GLOBALES
+        # ─────────────────────────────────────────────────────────────────────
     
-    st.info(f"📊 **{len(agence_summary)} agences** au total")
+        st.info(f"📊 **{len(agence_summary)} agences** au total")
     
-    col_m1, col_m2, col_m3, col_m4 = st.columns(4)
+        col_m1, col_m2, col_m3, col_m4 = st.columns(4)
     
-    with col_m1:
-        st.metric("Total Produits", f"{agence_summary['Produits'].sum()/1e6:.2f} Mrd")
-    with col_m2:
-        st.metric("Total Charges", f"{agence_summary['Charges'].sum()/1e6:.2f} Mrd")
-    with col_m3:
-        st.metric("Résultat Net Total", f"{agence_summary['Resultat_Net'].sum()/1e6:.2f} Mrd")
-    with col_m4:
-        marge_globale = (agence_summary['Resultat_Net'].sum() / agence_summary['Produits'].sum() * 100)
-        st.metric("Marge Globale", f"{marge_globale:.2f}%")
+        with col_m1:
+            st.metric("Total Produits", f"{agence_summary['Produits'].sum()/1e6:.2f} Mrd")
+        with col_m2:
+            st.metric("Total Charges", f"{agence_summary['Charges'].sum()/1e6:.2f} Mrd")
+        with col_m3:
+            st.metric("Résultat Net Total", f"{agence_summary['Resultat_Net'].sum()/1e6:.2f} Mrd")
+        with col_m4:
+            marge_globale = (agence_summary['Resultat_Net'].sum() / agence_summary['Produits'].sum() * 100)
+            st.metric("Marge Globale", f"{marge_globale:.2f}%")
     
-    st.divider()
+        st.divider()
     
-    # ─────────────────────────────────────────────────────────────────────
-    # OPTIONS DE VISUALISATION
-    # ─────────────────────────────────────────────────────────────────────
+        # ─────────────────────────────────────────────────────────────────────
+        # OPTIONS DE VISUALISATION
+        # ─────────────────────────────────────────────────────────────────────
     
-    col_opt1, col_opt2 = st.columns(2)
+        col_opt1, col_opt2 = st.columns(2)
     
-    with col_opt1:
-        critere_tri = st.selectbox(
-            "Trier par",
-            ["Résultat Net", "Produits", "Charges", "Marge %"],
-            key="tri_agence"
-        )
+        with col_opt1:
+            critere_tri = st.selectbox(
+                "Trier par",
+                ["Résultat Net", "Produits", "Charges", "Marge %"],
+                key="tri_agence"
+            )
     
-    with col_opt2:
-        nb_agences = st.slider(
-            "Nombre d'agences à afficher",
-            min_value=10,
-            max_value=min(100, len(agence_summary)),
-            value=20,
-            step=5,
-            key="nb_agences"
-        )
+        with col_opt2:
+            nb_agences = st.slider(
+                "Nombre d'agences à afficher",
+                min_value=10,
+                max_value=min(100, len(agence_summary)),
+                value=20,
+                step=5,
+                key="nb_agences"
+            )
     
-    # Mapper le critère de tri
-    critere_map = {
-        "Résultat Net": "Resultat_Net",
-        "Produits": "Produits",
-        "Charges": "Charges",
-        "Marge %": "Marge_%"
-    }
+        # Mapper le critère de tri
+        critere_map = {
+            "Résultat Net": "Resultat_Net",
+            "Produits": "Produits",
+            "Charges": "Charges",
+            "Marge %": "Marge_%"
+        }
     
-    # Trier et sélectionner top N
-    agence_top = agence_summary.sort_values(critere_map[critere_tri], ascending=False).head(nb_agences)
+        # Trier et sélectionner top N
+        agence_top = agence_summary.sort_values(critere_map[critere_tri], ascending=False).head(nb_agences)
     
-    st.divider()
+        st.divider()
     
-    # ─────────────────────────────────────────────────────────────────────
-    # GRAPHIQUE 1 : BARRES GROUPÉES (TOP N)
-    # ─────────────────────────────────────────────────────────────────────
+        # ─────────────────────────────────────────────────────────────────────
+        # GRAPHIQUE 1 : BARRES GROUPÉES (TOP N)
+        # ─────────────────────────────────────────────────────────────────────
     
-    st.write(f"**📊 Top {nb_agences} Agences par {critere_tri}**")
+        st.write(f"**📊 Top {nb_agences} Agences par {critere_tri}**")
     
-    fig_agence = go.Figure()
+        fig_agence = go.Figure()
     
-    # Trier pour l'affichage (ascending pour avoir le plus grand en haut)
-    agence_plot = agence_top.sort_values(critere_map[critere_tri], ascending=True)
+        # Trier pour l'affichage (ascending pour avoir le plus grand en haut)
+        agence_plot = agence_top.sort_values(critere_map[critere_tri], ascending=True)
     
-    fig_agence.add_trace(go.Bar(
-        name='Produits',
-        y=agence_plot['DESC_AGENCE'],
-        x=agence_plot['Produits']/1e6,
-        orientation='h',
-        marker_color='#2ecc71',
-        hovertemplate='<b>%{y}</b><br>Produits: %{x:.2f} Mrd<extra></extra>'
-    ))
+        fig_agence.add_trace(go.Bar(
+            name='Produits',
+            y=agence_plot['DESC_AGENCE'],
+            x=agence_plot['Produits']/1e6,
+            orientation='h',
+            marker_color='#2ecc71',
+            hovertemplate='<b>%{y}</b><br>Produits: %{x:.2f} Mrd<extra></extra>'
+        ))
     
-    fig_agence.add_trace(go.Bar(
-        name='Charges',
-        y=agence_plot['DESC_AGENCE'],
-        x=agence_plot['Charges']/1e6,
-        orientation='h',
-        marker_color='#e74c3c',
-        hovertemplate='<b>%{y}</b><br>Charges: %{x:.2f} Mrd<extra></extra>'
-    ))
+        fig_agence.add_trace(go.Bar(
+            name='Charges',
+            y=agence_plot['DESC_AGENCE'],
+            x=agence_plot['Charges']/1e6,
+            orientation='h',
+            marker_color='#e74c3c',
+            hovertemplate='<b>%{y}</b><br>Charges: %{x:.2f} Mrd<extra></extra>'
+        ))
     
-    fig_agence.add_trace(go.Scatter(
-        name='Résultat Net',
-        y=agence_plot['DESC_AGENCE'],
-        x=agence_plot['Resultat_Net']/1e6,
-        mode='markers',
-        marker=dict(size=10, color='#3498db', symbol='diamond'),
-        hovertemplate='<b>%{y}</b><br>Résultat Net: %{x:.2f} Mrd<extra></extra>'
-    ))
+        fig_agence.add_trace(go.Scatter(
+            name='Résultat Net',
+            y=agence_plot['DESC_AGENCE'],
+            x=agence_plot['Resultat_Net']/1e6,
+            mode='markers',
+            marker=dict(size=10, color='#3498db', symbol='diamond'),
+            hovertemplate='<b>%{y}</b><br>Résultat Net: %{x:.2f} Mrd<extra></extra>'
+        ))
     
-    fig_agence.update_layout(
-        barmode='group',
-        height=max(500, nb_agences * 25),
-        xaxis_title='Montant (Mrd DH)',
-        yaxis_title='',
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-    )
+        fig_agence.update_layout(
+            barmode='group',
+            height=max(500, nb_agences * 25),
+            xaxis_title='Montant (Mrd DH)',
+            yaxis_title='',
+            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+        )
     
-    st.plotly_chart(fig_agence, use_container_width=True)
+        st.plotly_chart(fig_agence, use_container_width=True)
     
-    st.divider()
+        st.divider()
     
-    # ─────────────────────────────────────────────────────────────────────
-    # GRAPHIQUE 2 : TREEMAP (VISION GLOBALE)
-    # ─────────────────────────────────────────────────────────────────────
+        # ─────────────────────────────────────────────────────────────────────
+        # GRAPHIQUE 2 : TREEMAP (VISION GLOBALE)
+        # ─────────────────────────────────────────────────────────────────────
     
-    st.write("**🗺️ Vision Globale - Treemap des Produits (Top 30)**")
+        st.write("**🗺️ Vision Globale - Treemap des Produits (Top 30)**")
     
-    agence_treemap = agence_summary.nlargest(30, 'Produits')
+        # Surfaces proportionnelles aux produits : agences sans produits exclues
+        agence_treemap = agence_summary[agence_summary['Produits'] > 0].nlargest(30, 'Produits')
     
-    fig_tree = px.treemap(
-        agence_treemap,
-        path=['DESC_AGENCE'],
-        values='Produits',
-        color='Marge_%',
-        color_continuous_scale='RdYlGn',
-        color_continuous_midpoint=0,
-        hover_data={'Produits': ':,.0f', 'Charges': ':,.0f', 'Resultat_Net': ':,.0f', 'Marge_%': ':.2f'}
-    )
+        fig_tree = px.treemap(
+            agence_treemap,
+            path=['DESC_AGENCE'],
+            values='Produits',
+            color='Marge_%',
+            color_continuous_scale='RdYlGn',
+            color_continuous_midpoint=0,
+            hover_data={'Produits': ':,.0f', 'Charges': ':,.0f', 'Resultat_Net': ':,.0f', 'Marge_%': ':.2f'}
+        )
     
-    fig_tree.update_traces(
-        textposition='middle center',
-        textfont_size=12,
-        hovertemplate='<b>%{label}</b><br>Produits: %{value:,.0f} DH<br>Marge: %{color:.2f}%<extra></extra>'
-    )
+        fig_tree.update_traces(
+            textposition='middle center',
+            textfont_size=12,
+            hovertemplate='<b>%{label}</b><br>Produits: %{value:,.0f} DH<br>Marge: %{color:.2f}%<extra></extra>'
+        )
     
-    fig_tree.update_layout(height=600)
+        fig_tree.update_layout(height=600)
     
-    st.plotly_chart(fig_tree, use_container_width=True)
+        st.plotly_chart(fig_tree, use_container_width=True)
     
-    st.divider()
+        st.divider()
     
-    # ─────────────────────────────────────────────────────────────────────
-    # GRAPHIQUE 3 : MARGE PAR AGENCE
-    # ─────────────────────────────────────────────────────────────────────
+        # ─────────────────────────────────────────────────────────────────────
+        # GRAPHIQUE 3 : MARGE PAR AGENCE
+        # ─────────────────────────────────────────────────────────────────────
     
-    st.write(f"**📈 Marge Nette par Agence (Top {nb_agences})**")
+        st.write(f"**📈 Marge Nette par Agence (Top {nb_agences})**")
     
-    # Filtrer les agences avec produits > 0 pour éviter les marges infinies
-    agence_marge = agence_top[agence_top['Produits'] > 0].sort_values('Marge_%', ascending=True)
+        # Filtrer les agences avec produits > 0 pour éviter les marges infinies
+        agence_marge = agence_top[agence_top['Produits'] > 0].sort_values('Marge_%', ascending=True)
     
-    fig_marge = px.bar(
-        agence_marge,
-        y='DESC_AGENCE',
-        x='Marge_%',
-        orientation='h',
-        color='Marge_%',
-        color_continuous_scale='RdYlGn',
-        color_continuous_midpoint=0,
-        text='Marge_%'
-    )
+        fig_marge = px.bar(
+            agence_marge,
+            y='DESC_AGENCE',
+            x='Marge_%',
+            orientation='h',
+            color='Marge_%',
+            color_continuous_scale='RdYlGn',
+            color_continuous_midpoint=0,
+            text='Marge_%'
+        )
     
-    fig_marge.update_traces(
-        texttemplate='%{text:.1f}%',
-        textposition='outside',
-        hovertemplate='<b>%{y}</b><br>Marge: %{x:.2f}%<extra></extra>'
-    )
+        fig_marge.update_traces(
+            texttemplate='%{text:.1f}%',
+            textposition='outside',
+            hovertemplate='<b>%{y}</b><br>Marge: %{x:.2f}%<extra></extra>'
+        )
     
-    fig_marge.update_layout(
-        height=max(500, len(agence_marge) * 25),
-        xaxis_title='Marge Nette (%)',
-        yaxis_title='',
-        showlegend=False
-    )
+        fig_marge.update_layout(
+            height=max(500, len(agence_marge) * 25),
+            xaxis_title='Marge Nette (%)',
+            yaxis_title='',
+            showlegend=False
+        )
     
-    st.plotly_chart(fig_marge, use_container_width=True)
+        st.plotly_chart(fig_marge, use_container_width=True)
     
-    st.divider()
+        st.divider()
     
-    # ─────────────────────────────────────────────────────────────────────
-    # TABLEAU RÉCAPITULATIF COMPLET
-    # ─────────────────────────────────────────────────────────────────────
+        # ─────────────────────────────────────────────────────────────────────
+        # TABLEAU RÉCAPITULATIF COMPLET
+        # ─────────────────────────────────────────────────────────────────────
     
-    st.write("**📋 Tableau Récapitulatif - Toutes les Agences**")
+        st.write("**📋 Tableau Récapitulatif - Toutes les Agences**")
     
-    # Filtres pour le tableau
-    col_f1, col_f2 = st.columns(2)
+        # Filtres pour le tableau
+        col_f1, col_f2 = st.columns(2)
     
-    with col_f1:
-        filtre_nom = st.text_input(
-            "🔍 Rechercher une agence",
-            placeholder="Tapez le nom de l'agence...",
-            key="filtre_agence_nom"
-        )
+        with col_f1:
+            filtre_nom = st.text_input(
+                "🔍 Rechercher une agence",
+                placeholder="Tapez le nom de l'agence...",
+                key="filtre_agence_nom"
+            )
     
-    with col_f2:
-        filtre_min_produits = st.number_input(
-            "Produits minimum (Millions DH)",
-            min_value=0.0,
-            value=0.0,
-            step=1.0,
-            key="filtre_min_prod"
-        )
+        with col_f2:
+            filtre_min_produits = st.number_input(
+                "Produits minimum (Millions DH)",
+                min_value=0.0,
+                value=0.0,
+                step=1.0,
+                key="filtre_min_prod"
+            )
     
-    # Appliquer les filtres
-    agence_filtered = agence_summary.copy()
+        # Appliquer les filtres
+        agence_filtered = agence_summary.copy()
     
-    if filtre_nom:
-        agence_filtered = agence_filtered[
-            agence_filtered['DESC_AGENCE'].str.contains(filtre_nom, case=False, na=False)
-        ]
+        if filtre_nom:
+            agence_filtered = agence_filtered[
+                agence_filtered['DESC_AGENCE'].str.contains(filtre_nom, case=False, na=False)
+            ]
     
-    if filtre_min_produits > 0:
-        agence_filtered = agence_filtered[agence_filtered['Produits'] >= filtre_min_produits * 1e6]
+        if filtre_min_produits > 0:
+            agence_filtered = agence_filtered[agence_filtered['Produits'] >= filtre_min_produits * 1e6]
     
-    # Affichage
-    st.write(f"**{len(agence_filtered)} agences** affichées (sur {len(agence_summary)} total)")
+        # Affichage
+        st.write(f"**{len(agence_filtered)} agences** affichées (sur {len(agence_summary)} total)")
     
-    agence_display = agence_filtered.copy()
-    agence_display['Produits'] = agence_display['Produits'].apply(lambda x: f"{x/1e6:.2f} Mrd")
-    agence_display['Charges'] = agence_display['Charges'].apply(lambda x: f"{x/1e6:.2f} Mrd")
-    agence_display['Resultat_Net'] = agence_display['Resultat_Net'].apply(lambda x: f"{x/1e6:.2f} Mrd")
-    agence_display['Marge_%'] = agence_display['Marge_%'].apply(lambda x: f"{x:.2f}%")
-    agence_display = agence_display[['DESC_AGENCE', 'Produits', 'Charges', 'Resultat_Net', 'Marge_%']]
-    agence_display.columns = ['Agence', 'Produits', 'Charges', 'Résultat Net', 'Marge (%)']
+        agence_display = agence_filtered.copy()
+        agence_display['Produits'] = agence_display['Produits'].apply(lambda x: f"{x/1e6:.2f} Mrd")
+        agence_display['Charges'] = agence_display['Charges'].apply(lambda x: f"{x/1e6:.2f} Mrd")
+        agence_display['Resultat_Net'] = agence_display['Resultat_Net'].apply(lambda x: f"{x/1e6:.2f} Mrd")
+        agence_display['Marge_%'] = agence_display['Marge_%'].apply(lambda x: f"{x:.2f}%")
+        agence_display = agence_display[['DESC_AGENCE', 'Produits', 'Charges', 'Resultat_Net', 'Marge_%']]
+        agence_display.columns = ['Agence', 'Produits', 'Charges', 'Résultat Net', 'Marge (%)']
     
-    st.dataframe(agence_display, use_container_width=True, hide_index=True, height=400)
+        st.dataframe(agence_display, use_container_width=True, hide_index=True, height=400)
     
-    # Export
-    st.divider()
+        # Export
+        st.divider()
     
-    excel_agence = convert_balance_to_excel(agence_filtered)
-    st.download_button(
-        label="📥 Télécharger tableau des agences (Excel)",
-        data=excel_agence,
-        file_name=f"Balance_Agences_{datetime.now().strftime('%Y%m%d')}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+        excel_agence = convert_balance_to_excel(agence_filtered)
+        st.download_button(
+            label="📥 Télécharger tableau des agences (Excel)",
+            data=excel_agence,
+            file_name=f"Balance_Agences_{datetime.now().strftime('%Y%m%d')}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
 
     # ─────────────────────────────────────────────────────────────────────────
     # TAB 3 : ANALYSE PAR COMPTE (TOP_ACCOUNT)
     # ─────────────────────────────────────────────────────────────────────────
     
-    with tab3:
+    if vue == vues[2]:
         st.subheader("Analyse par Catégorie de Compte (TOP_ACCOUNT)")
         
         # Filtre Type
@@ -5040,8 +6438,11 @@ def visualisations_balance(df_produits, df_charges):
             df_analyse = df_all
         
         # Agrégation par TOP_ACCOUNT
-        top_summary = df_analyse.groupby(['TOP_ACCOUNT', 'TOP_ACCOUNT_DESC', 'Type'])['Montants'].sum().reset_index()
-        top_summary = top_summary.sort_values('Montants', ascending=False)
+        top_summary = memo_view(
+            f'balance_top_{type_analyse}', (df_analyse,),
+            lambda: df_analyse.groupby(['TOP_ACCOUNT', 'TOP_ACCOUNT_DESC', 'Type'])['Montants'].sum().reset_index()
+                              .sort_values('Montants', ascending=False)
+        )
         
         # Graphique
         st.write(f"**📊 Répartition par Catégorie de Compte**")
@@ -5075,7 +6476,7 @@ def visualisations_balance(df_produits, df_charges):
     # TAB 4 : DONNÉES DÉTAILLÉES
     # ─────────────────────────────────────────────────────────────────────────
     
-    with tab4:
+    if vue == vues[3]:
         st.subheader("Données Détaillées")
         
         # Filtres
@@ -5180,6 +6581,17 @@ def balance_module():
         </div>
         """, unsafe_allow_html=True)
         
+        # Nombre de processus pour le parsing (1 = séquentiel)
+        workers = st.number_input(
+            "⚙️ Processus de parsing (découpage par agence)",
+            min_value=1,
+            max_value=PROCESS_POOL_MAX_WORKERS,
+            value=BALANCE_PARSE_WORKERS,
+            step=1,
+            key="balance_workers",
+            help="Au-delà de 1, les fichiers volumineux sont découpés aux en-têtes d'agence et parsés en parallèle"
+        )
+        
         st.divider()
         
         col1, col2 = st.columns(2)
@@ -5200,11 +6612,8 @@ def balance_module():
             if fichier_produits:
                 try:
                     with st.spinner("⏳ Traitement du fichier Produits..."):
-                        # Lire le contenu
-                        content = fichier_produits.read().decode('utf-8', errors='ignore')
-                        
-                        # Parser
-                        df_produits = parse_balance_txt(content, type_document="Produits")
+                        # Parser le fichier (cache par contenu : un seul parsing par fichier)
+                        df_produits = parse_balance_cached(fichier_produits, type_document="Produits", workers=int(workers))
                         
                         st.success(f"✅ **{len(df_produits):,} lignes** extraites".replace(',', ' '))
                         
@@ -5257,11 +6666,8 @@ def balance_module():
             if fichier_charges:
                 try:
                     with st.spinner("⏳ Traitement du fichier Charges..."):
-                        # Lire le contenu
-                        content = fichier_charges.read().decode('utf-8', errors='ignore')
-                        
-                        # Parser
-                        df_charges = parse_balance_txt(content, type_document="Charges")
+                        # Parser le fichier (cache par contenu : un seul parsing par fichier)
+                        df_charges = parse_balance_cached(fichier_charges, type_document="Charges", workers=int(workers))
                         
                         st.success(f"✅ **{len(df_charges):,} lignes** extraites".replace(',', ' '))
                         
@@ -5329,7 +6735,13 @@ def bam_module():
         ["Import & Traitement", "Visualisations BAM", "Visualisations Saham Bank", "À propos"]
     )
     
+    # Recharger les données BAM depuis le stockage local si la session est vide
+    load_bam_data()
+    
     st.sidebar.divider()
+    nb_jeux, taille_jeux, nb_refs = dataset_cache_stats()
+    if nb_jeux:
+        st.sidebar.caption(f"🧠 Cache partagé : {nb_jeux} jeu(x), {taille_jeux/1e6:.0f} Mo, {nb_refs} référence(s)")
     if st.session_state.uploaded_files_bam:
         st.sidebar.metric("Fichiers", len(st.session_state.uploaded_files_bam))
     if st.session_state.combined_data_bam is not None:
@@ -5386,7 +6798,10 @@ def bam_module():
                 
                 if ref_file:
                     try:
-                        df_ref = pd.read_excel(ref_file)
+                        df_ref = share_upload(
+                            'saham_referentiel', ref_file,
+                            lambda fichier: read_excel_fast(fichier, lambda nom: referentiel_column_target(nom) is not None)
+                        )
                         st.success(f"✅ {len(df_ref)} agences chargées")
                         st.session_state.saham_referentiel = df_ref
                         
@@ -5406,7 +6821,10 @@ def bam_module():
                 
                 if fin_file:
                     try:
-                        df_fin = pd.read_excel(fin_file)
+                        df_fin = share_upload(
+                            'saham_financial', fin_file,
+                            lambda fichier: read_excel_fast(fichier, lambda nom: financial_column_target(nom) is not None)
+                        )
                         st.success(f"✅ {len(df_fin)} lignes chargées")
                         st.session_state.saham_financial = df_fin
                         
@@ -5426,16 +6844,15 @@ def bam_module():
                         with st.spinner("Jointure et agrégation en cours..."):
                             try:
                                 # Jointure et agrégation
-                                df_agg = join_and_aggregate_saham(
+                                df_agg, rapport = aggregate_saham(
                                     st.session_state.saham_financial,
                                     st.session_state.saham_referentiel
                                 )
+                                st.session_state.saham_join_report = rapport
                                 
-                                # Recalculer PDM avec totaux BAM si disponibles
-                                if hasattr(st.session_state, 'total_depots_bam') and st.session_state.total_depots_bam is not None:
-                                    st.info("📊 Utilisation des totaux BAM pour calculer la PDM")
-                                    # PDM = (Dépôts Localité Saham / Total Dépôts BAM) × 100
-                                    df_agg['PDM'] = (df_agg['Depots'] / st.session_state.total_depots_bam) * 100
+                                # PDM recalculée à l'affichage sur les totaux BAM de chaque période
+                                if st.session_state.combined_data_bam is not None:
+                                    st.info("📊 Utilisation des totaux BAM de chaque période pour calculer la PDM")
                                 else:
                                     st.warning("⚠️ Totaux BAM non disponibles. PDM calculée sur base Saham uniquement.")
                                 
@@ -5453,8 +6870,11 @@ def bam_module():
                 
                 st.divider()
                 st.success("✅ Données Saham Bank prêtes")
+                show_saham_join_report()
                 
-                df_saham = st.session_state.saham_aggregated
+                # PDM = (Dépôts Localité Saham / Total Dépôts BAM de la période) × 100
+                df_saham = get_saham_pdm(st.session_state.saham_aggregated)
+                show_saham_pdm_warning(df_saham)
                 
                 # Métriques
                 col1, col2, col3, col4 = st.columns(4)
@@ -5468,8 +6888,13 @@ def bam_module():
                     st.metric("Total Crédits Saham", f"{total_credits_saham/1e6:.2f} Md")
                 
                 with col3:
-                    pdm_globale = df_saham['PDM'].sum()
-                    st.metric("PDM Globale", f"{pdm_globale:.2f}%")
+                    # Dépôts Saham des périodes associées / dépôts de place de ces périodes
+                    totaux = saham_market_totals(df_saham)
+                    if totaux is not None and totaux[0]:
+                        depots_apparies = df_saham.loc[df_saham['Annee_BAM'].notna(), 'Depots'].sum()
+                        st.metric("PDM Globale", f"{depots_apparies / totaux[0] * 100:.2f}%")
+                    else:
+                        st.metric("PDM Globale", "N/A")
                 
                 with col4:
                     nb_localites = df_saham['Localite'].nunique()
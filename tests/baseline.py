@@ -0,0 +1,283 @@
+"""
+Implémentations d'origine (version de référence de l'application), reprises
+telles quelles pour vérifier que les versions optimisées donnent les mêmes
+résultats. Seuls les print et l'affichage Streamlit ont été retirés.
+"""
+import re
+
+import pandas as pd
+
+
+def parse_balance_txt(txt_content, type_document="Produits"):
+    """Parser Balance d'origine : texte complet, ligne par ligne."""
+    lines = txt_content.replace('\r', '').split('\n')
+
+    data = []
+    current_agence_id = None
+    current_agence_desc = None
+    pending_comptes = []
+
+    for line in lines:
+        # 1. Détecter l'agence
+        if 'AGENCE' in line and ':' in line:
+            match = re.search(r'AGENCE\s*:\s*(\d+)\s+(.+)', line)
+            if match:
+                current_agence_id = match.group(1).strip()
+                current_agence_desc = match.group(2).strip()
+                pending_comptes = []
+                continue
+
+        # 2. Ignorer les lignes non-données
+        if '*---' in line or '+---' in line:
+            continue
+        if 'No DU COMPTE' in line or 'INTITULE DU COMPTE' in line or 'SOLDES' in line:
+            continue
+        if not line.strip() or len(line.strip()) < 10:
+            continue
+        if 'TOTAL' in line and 'GENERAL' in line:
+            continue
+
+        # 3. Parser les lignes avec des pipes |...|
+        if '|' in line:
+            parts = line.split('|')
+
+            if len(parts) < 5:
+                continue
+
+            try:
+                compte = parts[1].strip()
+                intitule = parts[2].strip()
+                debit = parts[3].strip()
+                credit = parts[4].strip() if len(parts) > 4 else "0,00"
+            except:
+                continue
+
+            # 4. TOP_ACCOUNT : assigné à tous les comptes en attente
+            if re.match(r'^\s*\d{4}\s*$', compte):
+                top_account = compte.strip()
+                top_account_desc = intitule
+                for pending_compte in pending_comptes:
+                    pending_compte['TOP_ACCOUNT'] = top_account
+                    pending_compte['TOP_ACCOUNT_DESC'] = top_account_desc
+                    data.append(pending_compte)
+                pending_comptes = []
+                continue
+
+            # Compte détaillé "000 XXXXX"
+            if re.match(r'^\s*000\s+\d+', compte):
+                compte_num = re.sub(r'^\s*000\s+', '', compte).strip()
+
+                try:
+                    debit_clean = debit.replace(' ', '').replace(',', '.')
+                    credit_clean = credit.replace(' ', '').replace(',', '.')
+
+                    debit_val = float(debit_clean) if debit_clean and debit_clean != '0.00' else 0
+                    credit_val = float(credit_clean) if credit_clean and credit_clean != '0.00' else 0
+
+                    if type_document == "Produits":
+                        montant = credit_val - debit_val
+                    else:
+                        montant = debit_val - credit_val
+
+                except Exception:
+                    montant = 0
+
+                pending_comptes.append({
+                    'ID_AGENCI': current_agence_id,
+                    'DESC_AGENCE': current_agence_desc,
+                    'ID_ACCOUNT': compte_num,
+                    'DESC_ACCOUNT': intitule,
+                    'Montants': montant,
+                    'TOP_ACCOUNT': None,
+                    'TOP_ACCOUNT_DESC': None,
+                    'Type': type_document
+                })
+
+    # Comptes restés sans TOP_ACCOUNT en fin de fichier
+    for pending_compte in pending_comptes:
+        if pending_compte['TOP_ACCOUNT'] is None:
+            pending_compte['TOP_ACCOUNT'] = ''
+            pending_compte['TOP_ACCOUNT_DESC'] = ''
+        data.append(pending_compte)
+
+    df = pd.DataFrame(data)
+
+    if len(df) > 0:
+        df['Montants'] = pd.to_numeric(df['Montants'], errors='coerce').fillna(0)
+        df['ID_AGENCI'] = df['ID_AGENCI'].astype(str)
+        df['ID_ACCOUNT'] = df['ID_ACCOUNT'].astype(str)
+        df['TOP_ACCOUNT'] = df['TOP_ACCOUNT'].fillna('').astype(str)
+
+    return df
+
+
+def get_dernier_mois_par_annee(df):
+    """Retourne uniquement le dernier mois de chaque année"""
+    result = []
+    for annee in df['Annee'].unique():
+        df_y = df[df['Annee'] == annee]
+        mois_max = df_y['mois'].max()
+        df_dernier = df_y[df_y['mois'] == mois_max].copy()
+        result.append(df_dernier)
+    return pd.concat(result, ignore_index=True)
+
+
+def compare_periods(df_all, annee_p1, mois_p1, annee_p2, mois_p2):
+    """
+    Comparaison de deux périodes d'origine (onglet Comparaison) : filtres
+    booléens sur tout le jeu puis jointure externe des localités.
+    Renvoie (d1, d2, c1, c2, df_compare_loc).
+    """
+    df_per1 = df_all[(df_all['Annee'] == annee_p1) & (df_all['mois'] == mois_p1)]
+    df_per2 = df_all[(df_all['Annee'] == annee_p2) & (df_all['mois'] == mois_p2)]
+    d1 = df_per1['Montant_Depots'].sum()
+    d2 = df_per2['Montant_Depots'].sum()
+    c1 = df_per1['Montant_Credits'].sum()
+    c2 = df_per2['Montant_Credits'].sum()
+
+    df_loc_p1 = df_per1.groupby('Localite').agg({
+        'Montant_Depots': 'sum',
+        'Montant_Credits': 'sum'
+    }).reset_index()
+
+    df_loc_p2 = df_per2.groupby('Localite').agg({
+        'Montant_Depots': 'sum',
+        'Montant_Credits': 'sum'
+    }).reset_index()
+
+    df_compare_loc = df_loc_p1.merge(
+        df_loc_p2,
+        on='Localite',
+        how='outer',
+        suffixes=('_P1', '_P2')
+    ).fillna(0)
+
+    df_compare_loc['Variation_Depots'] = df_compare_loc['Montant_Depots_P2'] - df_compare_loc['Montant_Depots_P1']
+    df_compare_loc['Variation_Credits'] = df_compare_loc['Montant_Credits_P2'] - df_compare_loc['Montant_Credits_P1']
+
+    variation_totale_depots = d2 - d1
+    variation_totale_credits = c2 - c1
+
+    if variation_totale_depots != 0:
+        df_compare_loc['Contribution_Depots_%'] = (df_compare_loc['Variation_Depots'] / variation_totale_depots * 100)
+    else:
+        df_compare_loc['Contribution_Depots_%'] = 0
+
+    if variation_totale_credits != 0:
+        df_compare_loc['Contribution_Credits_%'] = (df_compare_loc['Variation_Credits'] / variation_totale_credits * 100)
+    else:
+        df_compare_loc['Contribution_Credits_%'] = 0
+
+    df_compare_loc = df_compare_loc.sort_values('Contribution_Depots_%', ascending=False)
+    return d1, d2, c1, c2, df_compare_loc
+
+
+def get_tranche_pdm(pdm):
+    if pdm >= 10:
+        return 'Sup >10%'
+    elif pdm >= 7:
+        return 'Sup 7-10%'
+    elif pdm >= 5:
+        return 'Inf 5-7%'
+    else:
+        return 'Inf <5%'
+
+
+def classify_saham(df_filtered, top_n=25):
+    """Classification d'origine : Top N par apply, tranches PDM ligne à ligne."""
+    df_filtered = df_filtered.copy()
+    df_sorted = df_filtered.sort_values('Depots', ascending=False)
+    top_villes = df_sorted.head(top_n)['Localite'].tolist()
+    df_filtered['Top'] = df_filtered['Localite'].apply(
+        lambda x: f'Top {top_n}' if x in top_villes else 'Autres'
+    )
+    df_filtered['Tranche_PDM'] = df_filtered['PDM'].apply(get_tranche_pdm)
+    return df_filtered
+
+
+def normalize_referentiel_columns(df):
+    """Normalise les colonnes du référentiel agences"""
+    df_normalized = df.copy()
+    df_normalized.columns = df_normalized.columns.str.strip()
+
+    for col in df_normalized.columns:
+        col_lower = col.lower()
+
+        if 'code' in col_lower and 'agence' in col_lower:
+            df_normalized.rename(columns={col: 'Code_Agence'}, inplace=True)
+        elif 'code' in col_lower and 'localit' in col_lower:
+            df_normalized.rename(columns={col: 'Code_Localite'}, inplace=True)
+        elif 'localit' in col_lower and 'code' not in col_lower:
+            df_normalized.rename(columns={col: 'Localite'}, inplace=True)
+
+    return df_normalized
+
+
+def normalize_financial_columns(df):
+    """Normalise les colonnes des données financières"""
+    df_normalized = df.copy()
+    df_normalized.columns = df_normalized.columns.str.strip()
+
+    for col in df_normalized.columns:
+        col_lower = col.lower()
+
+        if 'p' in col_lower and 'riod' in col_lower:
+            df_normalized.rename(columns={col: 'Periode'}, inplace=True)
+        elif 'code' in col_lower and 'agence' in col_lower:
+            df_normalized.rename(columns={col: 'Code_Agence'}, inplace=True)
+        elif 'd' in col_lower and 'p' in col_lower and 't' in col_lower:
+            df_normalized.rename(columns={col: 'Depots'}, inplace=True)
+        elif 'cr' in col_lower and 'dit' in col_lower:
+            df_normalized.rename(columns={col: 'Credits'}, inplace=True)
+
+    return df_normalized
+
+
+def clean_numeric_saham(df, columns):
+    """Nettoie les colonnes numériques Saham"""
+    df_clean = df.copy()
+
+    for col in columns:
+        if col in df_clean.columns:
+            df_clean[col] = df_clean[col].astype(str)
+            df_clean[col] = df_clean[col].str.replace(r'\s+', '', regex=True)
+            df_clean[col] = df_clean[col].str.replace(r'[^\d.,]', '', regex=True)
+            df_clean[col] = df_clean[col].str.replace(',', '.')
+            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
+            df_clean[col] = df_clean[col].fillna(0)
+
+    return df_clean
+
+
+def join_and_aggregate_saham(df_financial, df_referentiel):
+    """
+    Jointure des données financières avec le référentiel agences
+    puis agrégation par localité avec calcul PDM
+    """
+    df_fin = normalize_financial_columns(df_financial.copy())
+    df_ref = normalize_referentiel_columns(df_referentiel.copy())
+
+    df_fin = clean_numeric_saham(df_fin, ['Depots', 'Credits'])
+
+    df_fin['Code_Agence'] = df_fin['Code_Agence'].astype(str).str.strip()
+    df_ref['Code_Agence'] = df_ref['Code_Agence'].astype(str).str.strip()
+
+    df_joined = df_fin.merge(
+        df_ref[['Code_Agence', 'Localite']],
+        on='Code_Agence',
+        how='left'
+    )
+
+    df_agg = df_joined.groupby(['Periode', 'Localite']).agg({
+        'Depots': 'sum',
+        'Credits': 'sum'
+    }).reset_index()
+
+    total_depots_par_periode = df_agg.groupby('Periode')['Depots'].sum().reset_index()
+    total_depots_par_periode.columns = ['Periode', 'Total_Global_Depots']
+
+    df_agg = df_agg.merge(total_depots_par_periode, on='Periode')
+    df_agg['PDM'] = (df_agg['Depots'] / df_agg['Total_Global_Depots']) * 100
+    df_agg = df_agg.drop('Total_Global_Depots', axis=1)
+
+    return df_agg
@@ -0,0 +1,71 @@
+"""
+Configuration commune des tests : l'application est importée hors serveur
+Streamlit, avec une session simulée (st.session_state) propre à chaque test.
+"""
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(RACINE, 'app_saham_final_avec_balance_cor.py')
+sys.path.insert(0, RACINE)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app_saham_final_avec_balance_cor  # noqa: E402
+
+
+class SessionSimulee(dict):
+    """st.session_state hors serveur : dictionnaire avec accès par attribut."""
+
+    def __getattr__(self, cle):
+        try:
+            return self[cle]
+        except KeyError:
+            raise AttributeError(cle) from None
+
+    def __setattr__(self, cle, valeur):
+        self[cle] = valeur
+
+    def __delattr__(self, cle):
+        del self[cle]
+
+
+def session_initiale():
+    """Clés initialisées par l'application au premier chargement."""
+    return {
+        'combined_data_bam': None,
+        'cleaning_report_bam': None,
+        'missing_report_bam': None,
+        'total_depots_bam': None,
+        'total_credits_bam': None,
+        'bam_period_bounds': {},
+        'bam_year_bounds': {},
+        'bam_cube': None,
+        'bam_cube_year_end': {},
+        'bam_cube_periods': {},
+        'bam_market_totals': {},
+        'bam_rows_without_period': 0,
+        'bam_years_data': {},
+        'bam_final_combined': None,
+        'saham_referentiel': None,
+        'saham_financial': None,
+        'saham_aggregated': None,
+    }
+
+
+@pytest.fixture(scope='session')
+def app():
+    return app_saham_final_avec_balance_cor
+
+
+@pytest.fixture
+def session(app, monkeypatch, tmp_path):
+    """Session simulée et stockage BAM temporaire pour un test."""
+    ss = SessionSimulee(session_initiale())
+    monkeypatch.setattr(app.st, 'session_state', ss)
+    monkeypatch.setattr(app, 'BAM_STORE_DIR', str(tmp_path / 'bam_store'))
+    return ss
+
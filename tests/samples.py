@@ -0,0 +1,117 @@
+"""
+Jeux de données synthétiques des tests : fichiers Balance SGMB, fichiers
+mensuels BAM et fichiers Saham (référentiel agences, données financières).
+"""
+import random
+
+import numpy as np
+import pandas as pd
+
+LOCALITES = ['CASABLANCA', 'RABAT', 'FES', 'TANGER', 'MARRAKECH', 'AGADIR', 'OUJDA', 'MEKNES']
+
+
+def balance_text(nb_agences=50, seed=1):
+    """
+    Fichier Balance au format SGMB : en-têtes d'agence, comptes détaillés
+    suivis de leur TOP_ACCOUNT, montants invalides ou vides, comptes
+    orphelins et lignes avant la première agence / après le dernier TOP.
+    """
+    r = random.Random(seed)
+    lignes = ["      BALANCE GENERALE SGMB\r", "| 000 0000001 |AVANT AGENCE | 1,00 | 2,00 |"]
+    for a in range(nb_agences):
+        lignes.append(f"   AGENCE : {1000 + a}   AGENCE NUMERO {a} SOLDES\r")
+        lignes.append("*-----------------------------------------*")
+        lignes.append("| No DU COMPTE | INTITULE DU COMPTE | DEBIT | CREDIT |")
+        lignes.append("+-----------------------------------------+")
+        for t in range(r.randint(1, 6)):
+            for c in range(r.randint(0, 5)):
+                debit = f"{r.randint(0, 99999):,}".replace(',', ' ') + f",{r.randint(0, 99):02d}"
+                credit = f"{r.randint(0, 999999):,}".replace(',', ' ') + f",{r.randint(0, 99):02d}"
+                if r.random() < 0.05:
+                    debit = "ABC"
+                if r.random() < 0.05:
+                    credit = ""
+                lignes.append(f"| 000 {r.randint(100000, 9999999)}  |INT DEBIT {c} |{debit}|{credit}|   |")
+            lignes.append(f"|   {r.randint(6000, 7999)}       |- TOTAL CAT {t} |0,00|1 000,00|")
+        if r.random() < 0.5:
+            lignes.append(f"| 000 {r.randint(100000, 9999999)}  |ORPHELIN |1,00|2,00|")
+        lignes.append("| TOTAL GENERAL | | 0 | 0 |")
+        lignes.append("")
+    lignes.append("| 000 7777777 |FIN SANS TOP | 3,00 | 10,50 |")
+    return "\n".join(lignes)
+
+
+def balance_edge_text():
+    """Lignes limites du format Balance (colonnes manquantes, faux en-têtes...)."""
+    return "\n".join([
+        "| 000 111 | AVANT |1,00|2,00|",
+        "AGENCE : 12 PREMIERE\r",
+        "| 000 0570102  |INT SOLDES|0,00|4 211,40|",
+        "| 000 0570103  |INT OK|0,00|4 211,40|x",
+        "|7023||||",
+        "|   7023       |- INT.S/... |0,00|4 211,40|...",
+        "| 000 0570550 9 |INTERETS |abc|15 683,77|",
+        "| 000 0570551  |FRAIS AGENCE : 12 MOIS |1|15 683,77|",
+        "|  0001 |TOP|1|2|",
+        "| 000 0570552  |INTERETS |1|nan|",
+        "| 000 0570553  |TOTAL DU GENERAL |1|3|",
+        "|0000 12|x|1|2|",
+        "   |  000   77  |  desc  |  1 000,5 |  |",
+        "|   7101       |INTERETS ...|0,00|131 787,35|",
+        "AGENCE: 99X",
+        "xx AGENCE :7   desc  ",
+        "| 000 5 |a|1|2|",
+        "| 000 6 |a|1|2",
+        "| 000 7 |a|1",
+    ])
+
+
+def bam_month(rng, n=60, localites=LOCALITES, echelle=1.0):
+    """Fichier mensuel BAM brut (noms de colonnes du fichier Excel)."""
+    return pd.DataFrame({
+        'Localité': rng.choice(localites, n),
+        'Nombre de guichets': rng.integers(1, 5, n),
+        'Montant des dépôts': rng.random(n) * 1e6 * echelle,
+        'Montant des crédits': rng.random(n) * 1e6 * echelle
+    })
+
+
+def bam_dataset(app, rng, periodes, n=60):
+    """
+    Jeu BAM combiné (préparé comme à l'import) pour les périodes données ;
+    certaines localités sont absentes de certaines périodes.
+    Renvoie ({(annee, mois): DataFrame}, DataFrame combiné).
+    """
+    parties = {}
+    for i, (annee, mois) in enumerate(periodes):
+        localites = LOCALITES[i % 3:] if i % 2 else LOCALITES[:-1]
+        parties[(annee, mois)] = app.prepare_bam_month(bam_month(rng, n, localites), annee, mois)[0]
+    combine = pd.concat([parties[cle] for cle in sorted(parties)], ignore_index=True)
+    return parties, combine
+
+
+def saham_referentiel(nb_agences=40, seed=0):
+    """Référentiel agences Saham (codes parfois saisis avec des espaces)."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Code Agence': [f' {i} ' if i % 3 == 0 else i for i in range(nb_agences)],
+        'Code Localité': range(nb_agences),
+        'Localité': rng.choice(LOCALITES, nb_agences)
+    })
+
+
+def saham_financial(periodes, nb_lignes=300, nb_agences=40, seed=0):
+    """Données financières Saham (montants au format texte français)."""
+    rng = np.random.default_rng(seed)
+    depots = rng.random(nb_lignes) * 1e5
+    return pd.DataFrame({
+        'Période': rng.choice(periodes, nb_lignes),
+        'Code Agence': rng.integers(0, nb_agences, nb_lignes),
+        'Dépôts': [f"{v:,.2f}".replace(',', ' ').replace('.', ',') for v in depots],
+        'Crédits': rng.random(nb_lignes) * 1e4
+    })
+
+
+def as_object(df):
+    """Colonnes catégorielles en objets (comparaison indépendante du compactage)."""
+    return df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
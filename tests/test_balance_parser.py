@@ -0,0 +1,109 @@
+"""
+Parser Balance en streaming (séquentiel et parallèle) et cache des balances
+parsées, comparés au parser d'origine.
+"""
+import io
+
+import pandas as pd
+import pytest
+
+import baseline
+from samples import balance_edge_text, balance_text
+
+TEXTES = [balance_text(60, seed) for seed in range(3)] + [balance_edge_text()]
+
+
+def assert_same_balance(reference, df):
+    pd.testing.assert_frame_equal(
+        reference.reset_index(drop=True), df.reset_index(drop=True), check_dtype=False
+    )
+
+
+@pytest.mark.parametrize('type_document', ['Produits', 'Charges'])
+@pytest.mark.parametrize('texte', TEXTES)
+def test_parse_matches_baseline(app, texte, type_document):
+    reference = baseline.parse_balance_txt(texte, type_document)
+    assert_same_balance(reference, app.parse_balance_txt(texte, type_document))
+    assert_same_balance(reference, app.parse_balance_txt(io.BytesIO(texte.encode()), type_document))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 4096])
+def test_block_boundaries_do_not_change_records(app, chunk_size):
+    texte = TEXTES[0]
+    records = app.iter_balance_records(app.iter_balance_blocks(io.BytesIO(texte.encode()), chunk_size=chunk_size))
+    df = app._build_balance_frame(records, 'Produits')
+    assert_same_balance(baseline.parse_balance_txt(texte, 'Produits'), df)
+
+
+@pytest.mark.parametrize('segment_size', [50, 300, 5000])
+def test_segments_parse_independently(app, segment_size):
+    texte = TEXTES[1]
+    segments = list(app.iter_balance_segments(app.iter_balance_blocks(io.BytesIO(texte.encode())), segment_size))
+    assert ''.join(segment for segment, _ in segments) == texte.replace('\r', '')
+    assert [dernier for _, dernier in segments] == [False] * (len(segments) - 1) + [True]
+    df = pd.concat([app._parse_balance_segment(segment, dernier, 'Charges') for segment, dernier in segments])
+    assert_same_balance(baseline.parse_balance_txt(texte, 'Charges'), df)
+
+
+def test_parallel_parse_matches_baseline(app, capsys, monkeypatch):
+    # Petits segments : plusieurs tâches envoyées au pool de processus
+    monkeypatch.setattr(app.iter_balance_segments, '__defaults__', (300,))
+    try:
+        for texte in TEXTES:
+            reference = baseline.parse_balance_txt(texte, 'Produits')
+            assert_same_balance(reference, app.parse_balance_txt(io.BytesIO(texte.encode()), 'Produits', workers=2))
+        assert 'indisponible' not in capsys.readouterr().out
+    finally:
+        app.reset_process_pool()
+
+
+def test_parallel_parse_falls_back_to_sequential(app, capsys, monkeypatch):
+    def pool_indisponible():
+        raise OSError('no processes')
+
+    monkeypatch.setattr(app.iter_balance_segments, '__defaults__', (300,))
+    monkeypatch.setattr(app, '_get_process_pool', pool_indisponible)
+    texte = TEXTES[2]
+    source = io.BytesIO(b'xx' + texte.encode())
+    source.read(2)
+    df = app.parse_balance_txt(source, 'Produits', workers=2)
+    assert_same_balance(baseline.parse_balance_txt(texte, 'Produits'), df)
+    assert 'indisponible' in capsys.readouterr().out
+
+
+def test_parse_cached_reuses_memory_and_disk_cache(app, session, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'BALANCE_CACHE_DIR', str(tmp_path / 'balance_cache'))
+    cache = app.new_lru_cache()
+    monkeypatch.setattr(app, '_get_balance_parse_cache', lambda: cache)
+    texte = balance_text(40, seed=11)
+    reference = baseline.parse_balance_txt(texte, 'Produits')
+
+    df = app.parse_balance_cached(io.BytesIO(texte.encode()), 'Produits')
+    assert_same_balance(reference, df)
+    assert app.parse_balance_cached(io.BytesIO(texte.encode()), 'Produits') is df
+
+    # Cache mémoire vidé (redémarrage) : relecture du Parquet sans nouveau parsing
+    cache['entries'].clear()
+    monkeypatch.setattr(app, 'parse_balance_txt', None)
+    assert_same_balance(reference, app.parse_balance_cached(io.BytesIO(texte.encode()), 'Produits'))
+
+
+def test_balance_digest_is_memoized_per_upload(app, session, monkeypatch):
+    class Upload(io.BytesIO):
+        file_id = 'f1'
+        name = 'balance.txt'
+
+        @property
+        def size(self):
+            return len(self.getvalue())
+
+    source = Upload(balance_text(5).encode())
+    digest = app.balance_file_digest(source)
+    assert digest == app.hash_balance_file(io.BytesIO(source.getvalue()))
+    assert source.tell() == 0
+
+    # Rerun : l'empreinte est reprise de la session, le fichier n'est pas relu
+    appels = []
+    monkeypatch.setattr(app, 'hash_balance_file', lambda s: appels.append(s) or 'autre')
+    assert app.balance_file_digest(source) == digest
+    assert not appels
@@ -0,0 +1,123 @@
+"""
+Index des périodes, cube BAM pré-agrégé et comparaison de périodes,
+comparés aux filtres booléens et agrégations d'origine sur tout le jeu.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from samples import as_object, bam_dataset
+
+PERIODES = [(2021, 12), (2022, 6), (2022, 12), (2023, 3), (2023, 11), (2024, 1), (2024, 2), (2024, 3)]
+
+
+@pytest.fixture
+def combine(app, session):
+    """Jeu BAM de la session ; renvoie une copie non compactée pour les références."""
+    _, df = bam_dataset(app, np.random.default_rng(1), PERIODES)
+    app.set_bam_data(df)
+    return as_object(session.combined_data_bam)
+
+
+@pytest.mark.parametrize('periode', PERIODES + [(2030, 1)])
+def test_period_view_matches_boolean_filter(app, combine, periode):
+    annee, mois = periode
+    vue = app.get_bam_period(annee, mois)
+    attendu = combine[(combine['Annee'] == annee) & (combine['mois'] == mois)]
+    pd.testing.assert_frame_equal(as_object(vue), attendu)
+
+
+def test_year_view_and_months_match_boolean_filter(app, combine):
+    for annee in combine['Annee'].unique():
+        attendu = combine[combine['Annee'] == annee]
+        pd.testing.assert_frame_equal(as_object(app.get_bam_year(annee)), attendu)
+        assert app.get_bam_months(annee) == sorted(attendu['mois'].unique())
+
+
+def test_rows_without_period_are_set_aside(app, session):
+    _, df = bam_dataset(app, np.random.default_rng(2), PERIODES[:3])
+    df = df.astype({'mois': float})
+    df.loc[df.index[:4], 'mois'] = np.nan
+    app.set_bam_data(df)
+    assert session.bam_rows_without_period == 4
+    assert len(session.combined_data_bam) == len(df) - 4
+
+
+def test_cube_matches_groupby(app, combine):
+    cube = app.get_bam_cube()
+    attendu = combine.groupby(['Annee', 'mois', 'DirectionRegionale', 'Localite']).agg(
+        Montant_Depots=('Montant_Depots', 'sum'),
+        Montant_Credits=('Montant_Credits', 'sum'),
+        Nombre_Guichets=('Nombre_Guichets', 'sum'),
+        Nb_Lignes=('Montant_Depots', 'size')
+    ).reset_index().rename(columns={'DirectionRegionale': 'Direction_Regionale'})
+    pd.testing.assert_frame_equal(as_object(cube), attendu, check_dtype=False)
+
+    for annee, mois in PERIODES:
+        tranche = app.get_bam_cube_period(annee, mois)
+        pd.testing.assert_frame_equal(
+            tranche, cube[(cube['Annee'] == annee) & (cube['mois'] == mois)]
+        )
+
+
+@pytest.mark.parametrize('mesure', ['Montant_Depots', 'Montant_Credits', 'Nombre_Guichets'])
+def test_cube_year_end_matches_baseline(app, combine, mesure):
+    reference = baseline.get_dernier_mois_par_annee(combine)
+    instantane = app.get_bam_cube_year_end()
+    attendu = reference.groupby(['Annee', 'Localite'])[mesure].sum()
+    obtenu = as_object(instantane).groupby(['Annee', 'Localite'])[mesure].sum()
+    pd.testing.assert_series_equal(obtenu, attendu, check_dtype=False)
+    assert app.get_bam_cube_year_end() is instantane
+
+
+def test_cube_fixed_month_keeps_years_with_that_month(app, combine):
+    instantane = app.get_bam_cube_year_end(mois_fixe=12)
+    assert sorted(instantane['Annee'].unique()) == [2021, 2022]
+    attendu = combine[combine['mois'] == 12].groupby('Annee')['Montant_Depots'].sum()
+    assert np.allclose(instantane.groupby('Annee')['Montant_Depots'].sum(), attendu)
+
+
+def test_market_totals_match_groupby(app, combine):
+    totaux = app.get_bam_market_totals()
+    attendu = combine.groupby(['Annee', 'mois'])[['Montant_Depots', 'Montant_Credits']].sum()
+    assert np.allclose(totaux.loc[attendu.index, ['Montant_Depots', 'Montant_Credits']], attendu)
+
+
+@pytest.mark.parametrize('periode_1, periode_2', [
+    ((2021, 12), (2024, 3)),
+    ((2023, 3), (2022, 6)),
+    ((2024, 1), (2024, 2)),
+    ((2022, 12), (2022, 12)),
+])
+def test_compare_periods_matches_baseline(app, combine, periode_1, periode_2):
+    d1, d2, c1, c2, reference = baseline.compare_periods(combine, *periode_1, *periode_2)
+    resultat = app.compare_bam_periods(periode_1, periode_2)
+
+    assert np.allclose(resultat['depots'], (d1, d2))
+    assert np.allclose(resultat['credits'], (c1, c2))
+    assert np.isclose(resultat['taux_depots'], (d2 - d1) / d1 * 100)
+
+    colonnes = [
+        'Montant_Depots_P1', 'Montant_Depots_P2', 'Montant_Credits_P1', 'Montant_Credits_P2',
+        'Variation_Depots', 'Variation_Credits', 'Contribution_Depots_%', 'Contribution_Credits_%'
+    ]
+    obtenu = resultat['localites'].set_index('Localite')[colonnes].sort_index()
+    attendu = reference.set_index('Localite')[colonnes].sort_index()
+    pd.testing.assert_frame_equal(obtenu, attendu, check_dtype=False, check_index_type=False)
+
+    # Statut : localité présente dans une seule des deux périodes
+    localites_1 = set(combine[(combine['Annee'] == periode_1[0]) & (combine['mois'] == periode_1[1])]['Localite'])
+    localites_2 = set(combine[(combine['Annee'] == periode_2[0]) & (combine['mois'] == periode_2[1])]['Localite'])
+    statuts = resultat['localites'].set_index('Localite')['Statut']
+    assert set(statuts[statuts == 'Entrée'].index) == localites_2 - localites_1
+    assert set(statuts[statuts == 'Sortie'].index) == localites_1 - localites_2
+
+
+@pytest.mark.parametrize('k', [0, 1, 3, 100])
+@pytest.mark.parametrize('plus_grands', [True, False])
+def test_top_k_rows_matches_sort(app, k, plus_grands):
+    rng = np.random.default_rng(k)
+    df = pd.DataFrame({'Localite': [f'L{i}' for i in range(40)], 'Valeur': rng.random(40)})
+    attendu = df.sort_values('Valeur', ascending=not plus_grands).head(k)
+    pd.testing.assert_frame_equal(app.top_k_rows(df, 'Valeur', k, plus_grands), attendu)
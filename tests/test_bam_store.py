@@ -0,0 +1,120 @@
+"""
+Stockage Parquet BAM (une partition par période) et ajout incrémental d'un
+mois, comparés à la concaténation complète des fichiers mensuels.
+"""
+import glob
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from samples import as_object, bam_dataset, bam_month
+
+PERIODES = [(2023, 1), (2023, 2), (2023, 12), (2024, 1), (2024, 2), (2024, 3)]
+
+
+@pytest.fixture
+def dataset(app, session):
+    rng = np.random.default_rng(0)
+    parties, combine = bam_dataset(app, rng, PERIODES)
+    return rng, parties, combine
+
+
+def test_store_round_trip(app, dataset):
+    _, _, combine = dataset
+    assert app.write_bam_store(combine) == (len(PERIODES), 0)
+    relu = app.read_bam_store()
+    pd.testing.assert_frame_equal(as_object(combine), as_object(relu), check_dtype=False)
+    assert isinstance(relu['Localite'].dtype, pd.CategoricalDtype)
+    assert not glob.glob(os.path.join(app.BAM_STORE_DIR, '**', '*.tmp'), recursive=True)
+
+
+def test_store_replaces_only_written_periods(app, dataset):
+    _, _, combine = dataset
+    annee_2023 = combine[combine['Annee'] == 2023]
+    annee_2024 = combine[combine['Annee'] == 2024]
+    app.write_bam_store(annee_2023)
+    app.write_bam_store(annee_2024)
+    assert len(app.read_bam_store()) == len(combine)
+
+    app.write_bam_store(annee_2024, remplacer=True)
+    pd.testing.assert_frame_equal(
+        as_object(annee_2024.reset_index(drop=True)), as_object(app.read_bam_store()), check_dtype=False
+    )
+
+
+def test_store_counts_rows_without_period(app, dataset):
+    _, _, combine = dataset
+    df = combine.astype({'mois': float})
+    df.loc[df.index[:3], 'mois'] = np.nan
+    assert app.write_bam_store(df) == (len(PERIODES), 3)
+    assert len(app.read_bam_store()) == len(combine) - 3
+
+
+def test_concurrent_writers_leave_a_complete_partition(app, dataset):
+    _, _, combine = dataset
+    erreurs = []
+
+    def ecrire():
+        try:
+            for _ in range(5):
+                app.write_bam_store(combine)
+        except Exception as e:
+            erreurs.append(e)
+
+    threads = [threading.Thread(target=ecrire) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not erreurs
+    assert not glob.glob(os.path.join(app.BAM_STORE_DIR, '**', '*.tmp'), recursive=True)
+    pd.testing.assert_frame_equal(as_object(combine), as_object(app.read_bam_store()), check_dtype=False)
+
+
+def test_failed_write_removes_temp_file(app, dataset, monkeypatch):
+    _, _, combine = dataset
+
+    def echec(self, *args, **kwargs):
+        raise OSError('disque plein')
+
+    monkeypatch.setattr(pd.DataFrame, 'to_parquet', echec)
+    with pytest.raises(OSError):
+        app.write_bam_store(combine)
+    assert not glob.glob(os.path.join(app.BAM_STORE_DIR, '**', '*.tmp'), recursive=True)
+
+
+@pytest.mark.parametrize('periode', [(2024, 2), (2024, 4), (2022, 6), (2023, 6)])
+def test_append_month_matches_full_concat(app, session, dataset, periode):
+    rng, parties, combine = dataset
+    app.set_bam_data(combine)
+    app.write_bam_store(combine)
+    app.get_bam_cube()
+
+    # Nouvelle localité : la table des catégories est étendue
+    nouveau = app.prepare_bam_month(bam_month(rng, 70, ['CASABLANCA', 'LAAYOUNE'], 5), *periode)[0]
+    app.append_bam_month(nouveau, *periode)
+    parties[periode] = nouveau
+    attendu = pd.concat([parties[cle] for cle in sorted(parties)], ignore_index=True)
+
+    pd.testing.assert_frame_equal(as_object(attendu), as_object(session.combined_data_bam), check_dtype=False)
+    assert np.isclose(session.total_depots_bam, attendu['Montant_Depots'].sum())
+    assert np.isclose(session.total_credits_bam, attendu['Montant_Credits'].sum())
+    pd.testing.assert_frame_equal(as_object(attendu), as_object(app.read_bam_store()), check_dtype=False)
+
+    for annee, mois in sorted(parties):
+        periode_bam = app.get_bam_period(annee, mois)
+        assert len(periode_bam) == len(parties[(annee, mois)])
+        assert (periode_bam['Annee'] == annee).all() and (periode_bam['mois'] == mois).all()
+
+    cube = app.build_bam_cube(attendu)
+    pd.testing.assert_frame_equal(as_object(cube), as_object(app.get_bam_cube()), check_dtype=False)
+    pd.testing.assert_frame_equal(
+        as_object(app.get_bam_cube_year_end()),
+        as_object(baseline.get_dernier_mois_par_annee(cube)),
+        check_dtype=False
+    )
@@ -0,0 +1,72 @@
+"""
+Lecture rapide des fichiers Excel BAM (calamine / openpyxl) et décodage
+parallèle des fichiers mensuels, comparés à pd.read_excel.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def excel_bytes(df):
+    tampon = io.BytesIO()
+    df.to_excel(tampon, index=False)
+    return tampon.getvalue()
+
+
+def fichier_bam(seed, n=500):
+    rng = np.random.default_rng(seed)
+    return excel_bytes(pd.DataFrame({
+        'Code Localité': rng.integers(1, 500, n),
+        'Localité': rng.choice(['CASABLANCA', 'FES', None], n),
+        'Banque': 'X',
+        'Nombre de guichets': rng.choice([1, 2, np.nan], n),
+        'Montant des dépôts': rng.choice(['1 234,5', '12', None], n),
+        'Montant des crédits': rng.random(n) * 1e6,
+        'Autre': rng.random(n)
+    }))
+
+
+def reference(app, contenu):
+    return pd.read_excel(io.BytesIO(contenu), usecols=lambda col: app.bam_column_wanted(str(col)))
+
+
+@pytest.mark.parametrize('moteur', ['calamine', 'openpyxl', 'pandas'])
+def test_fast_reader_matches_read_excel(app, monkeypatch, moteur):
+    if moteur == 'calamine' and not app.CALAMINE_DISPONIBLE:
+        pytest.skip('python-calamine non installé')
+    monkeypatch.setattr(app, 'EXCEL_READER_ENGINE', moteur)
+    for seed in range(3):
+        contenu = fichier_bam(seed)
+        pd.testing.assert_frame_equal(app.read_excel_fast(contenu, app.bam_column_wanted), reference(app, contenu))
+    pd.testing.assert_frame_equal(app.read_excel_fast(io.BytesIO(contenu)), pd.read_excel(io.BytesIO(contenu)))
+
+
+def test_fast_reader_falls_back_on_unreadable_content(app, monkeypatch, capsys):
+    monkeypatch.setattr(app, 'EXCEL_READER_ENGINE', 'openpyxl')
+    with pytest.raises(Exception):
+        app.read_excel_fast(b'pas un fichier excel', app.bam_column_wanted)
+    assert 'impossible' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_read_bam_files_matches_read_excel(app, monkeypatch, workers):
+    cache = app.new_lru_cache()
+    monkeypatch.setattr(app, '_get_bam_excel_cache', lambda: cache)
+    contenus = [fichier_bam(seed) for seed in range(3)]
+    fichiers = [io.BytesIO(contenu) for contenu in contenus + [contenus[0], b'illisible']]
+
+    try:
+        resultats = app.read_bam_excel_files(fichiers, workers=workers)
+    finally:
+        app.reset_process_pool()
+
+    for contenu, df in zip(contenus + [contenus[0]], resultats):
+        pd.testing.assert_frame_equal(df, reference(app, contenu))
+    assert resultats[3] is resultats[0]
+    assert isinstance(resultats[4], Exception)
+
+    # Rerun : fichiers lus dans le cache, sans nouveau décodage
+    monkeypatch.setattr(app, '_read_excel_bytes', None)
+    assert all(a is b for a, b in zip(app.read_bam_excel_files(fichiers[:4], workers=workers), resultats))
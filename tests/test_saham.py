@@ -0,0 +1,116 @@
+"""
+Jointure Saham / référentiel agences, classification (Top N, tranches PDM)
+et PDM de place par période BAM, comparées aux calculs d'origine.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from samples import as_object, bam_dataset, saham_financial, saham_referentiel
+
+
+@pytest.fixture
+def agence_cache(app, monkeypatch):
+    cache = app.new_lru_cache()
+    monkeypatch.setattr(app, '_get_agence_index_cache', lambda: cache)
+    return cache
+
+
+@pytest.mark.parametrize('periodes', [['2023-12', '2024-12'], ['2024-01', '2024-02', '2024-03']])
+def test_join_and_aggregate_matches_baseline(app, agence_cache, periodes):
+    # Codes 40..44 absents du référentiel
+    financier = saham_financial(periodes, nb_agences=45)
+    referentiel = saham_referentiel()
+    attendu = baseline.join_and_aggregate_saham(financier, referentiel)
+    obtenu, rapport = app.aggregate_saham(financier, referentiel)
+    pd.testing.assert_frame_equal(obtenu, attendu, check_dtype=False)
+    assert rapport['codes_non_trouves'] == [str(code) for code in sorted(set(range(40, 45)) & set(financier['Code Agence']))]
+
+
+def test_agence_index_is_built_once_per_content(app, agence_cache):
+    referentiel = saham_referentiel()
+    assert app.build_agence_index(referentiel) is app.build_agence_index(referentiel.copy())
+    doublons = pd.concat([referentiel, referentiel.iloc[:3].assign(**{'Localité': 'X'})])
+    assert app.build_agence_index(doublons)['doublons'] == 3
+
+
+@pytest.mark.parametrize('top_n', [5, 10, 25])
+def test_classification_matches_baseline(app, top_n):
+    rng = np.random.default_rng(top_n)
+    n = 400
+    df = pd.DataFrame({
+        'Periode': rng.choice(['2023-12', '2024-12'], n),
+        'Localite': [f'V{i}' for i in rng.integers(0, 300, n)],
+        'Depots': rng.random(n) * 100,
+        'Credits': rng.random(n),
+        'PDM': rng.choice([np.nan, 4.99, 5, 6.99, 7, 9.99, 10, 25, -1, np.inf, -np.inf], n)
+    })
+    attendu = baseline.classify_saham(df, top_n)
+    obtenu = app.classify_saham(df, top_n)
+    pd.testing.assert_frame_equal(obtenu, attendu)
+    assert 'Top' not in df.columns
+
+
+@pytest.fixture
+def bam(app, session):
+    """Jeu BAM de la session : 2024-01 à 2024-03 et décembre 2023."""
+    _, df = bam_dataset(app, np.random.default_rng(3), [(2023, 12), (2024, 1), (2024, 2), (2024, 3)])
+    app.set_bam_data(df)
+    return as_object(session.combined_data_bam)
+
+
+@pytest.mark.parametrize('periode, attendu', [
+    ('2024-02', (2024, 2)),
+    ('02/2024', (2024, 2)),
+    (202402, (2024, 2)),
+    (202402.0, (2024, 2)),
+    (pd.Timestamp('2024-03-31'), (2024, 3)),
+    ('31/03/2024', (2024, 3)),
+    ('2023', (2023, 12)),
+    ('2024', None),
+    ('2024-05', None),
+    ('foo', None),
+])
+def test_match_periods_only_loaded_months(app, bam, periode, attendu):
+    assert app.match_saham_periods([periode]) == [attendu]
+
+
+def test_pdm_matches_per_period_filters(app, bam, agence_cache):
+    financier = saham_financial(['2024-01', '2024-03', '2023', '2022-12'])
+    referentiel = saham_referentiel()
+    # Une localité Saham absente de BAM
+    referentiel.loc[referentiel.index[:2], 'Localité'] = 'SMARA'
+    df_saham = app.join_and_aggregate_saham(financier, referentiel)
+    resultat = app.compute_saham_pdm(df_saham)
+
+    correspondances = {'2024-01': (2024, 1), '2024-03': (2024, 3), '2023': (2023, 12), '2022-12': None}
+    for _, ligne in resultat.iterrows():
+        periode = correspondances[ligne['Periode']]
+        if periode is None:
+            assert pd.isna(ligne['Annee_BAM']) and np.isnan(ligne['PDM'])
+            assert np.isnan(ligne['Total_Global_Depots']) and np.isnan(ligne['Total_Global_Credits'])
+            continue
+        annee, mois = periode
+        place = bam[(bam['Annee'] == annee) & (bam['mois'] == mois)]
+        assert (ligne['Annee_BAM'], ligne['Mois_BAM']) == periode
+        assert np.isclose(ligne['Total_Global_Depots'], place['Montant_Depots'].sum())
+        assert np.isclose(ligne['Total_Global_Credits'], place['Montant_Credits'].sum())
+        assert np.isclose(ligne['PDM'], ligne['Depots'] / place['Montant_Depots'].sum() * 100)
+        depots_localite = place.loc[place['Localite'] == ligne['Localite'], 'Montant_Depots'].sum()
+        if depots_localite > 0:
+            assert np.isclose(ligne['PDM_Localite'], ligne['Depots'] / depots_localite * 100)
+        else:
+            # Localité absente de BAM sur la période
+            assert np.isnan(ligne['PDM_Localite'])
+
+    # Totaux de place : somme des périodes BAM associées, sans période absente
+    totaux = app.saham_market_totals(resultat)
+    attendu = sum(bam[(bam['Annee'] == a) & (bam['mois'] == m)]['Montant_Depots'].sum() for a, m in [(2024, 1), (2024, 3), (2023, 12)])
+    assert np.isclose(totaux[0], attendu)
+    assert app.saham_market_totals(resultat, '2022-12') is None
+
+
+def test_pdm_is_memoized_per_data_version(app, bam, agence_cache):
+    df_saham = app.join_and_aggregate_saham(saham_financial(['2024-02']), saham_referentiel())
+    assert app.get_saham_pdm(df_saham) is app.get_saham_pdm(df_saham)
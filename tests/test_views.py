@@ -0,0 +1,106 @@
+"""
+Exécution de bout en bout (streamlit AppTest) de chaque vue des pages BAM,
+Saham et Balance : aucune exception, et les jeux partagés de la session ne
+sont pas modifiés par les vues.
+"""
+import numpy as np
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from conftest import APP_PATH
+from samples import balance_text, bam_dataset, saham_financial, saham_referentiel
+
+PERIODES = [(2022, 12), (2023, 6), (2023, 12), (2024, 1), (2024, 2)]
+
+
+@pytest.fixture
+def bam_store(app, monkeypatch, tmp_path):
+    """Stockage BAM relu par l'application au démarrage de la session."""
+    chemin = str(tmp_path / 'bam_store')
+    monkeypatch.setattr(app, 'BAM_STORE_DIR', chemin)
+    monkeypatch.setenv('BAM_STORE_DIR', chemin)
+    _, df = bam_dataset(app, np.random.default_rng(5), PERIODES)
+    app.write_bam_store(df)
+    return df
+
+
+def new_app_test(module, **etat):
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    etat = dict(show_welcome=False, authenticated=True, username='test', selected_module=module, **etat)
+    for cle, valeur in etat.items():
+        at.session_state[cle] = valeur
+    at.run()
+    assert not at.exception, at.exception
+    return at
+
+
+def radio(at, key):
+    return next(r for r in at.radio if r.key == key)
+
+
+def run_each_view(at, key, choix=True):
+    """Affiche chaque vue, puis (choix=True) change le premier sélecteur de la vue."""
+    for vue in radio(at, key).options:
+        radio(at, key).set_value(vue).run()
+        assert not at.exception, (vue, at.exception)
+        if not choix:
+            continue
+        for selecteur in at.selectbox:
+            if len(selecteur.options) > 1:
+                try:
+                    selecteur.select_index(1)
+                except TypeError:
+                    # AppTest ne sait pas relire les options non textuelles (format_func)
+                    continue
+                at.run()
+                assert not at.exception, (vue, selecteur.label, at.exception)
+                break
+
+
+def shared_digests(app, at, cles):
+    return {cle: app.hash_dataframe(at.session_state[cle]) for cle in cles}
+
+
+@pytest.fixture
+def saham_aggregated(app):
+    financier = saham_financial(['2024-01', '2024-02', '2023-06'], nb_lignes=80)
+    return app.join_and_aggregate_saham(financier, saham_referentiel())
+
+
+def test_bam_views(app, bam_store, saham_aggregated):
+    at = new_app_test('BAM', saham_aggregated=saham_aggregated)
+    assert len(at.session_state['combined_data_bam']) == len(bam_store)
+    avant = shared_digests(app, at, ['combined_data_bam', 'saham_aggregated'])
+
+    at.sidebar.radio[0].set_value("Visualisations BAM").run()
+    assert not at.exception, at.exception
+    run_each_view(at, 'bam_vue')
+    assert shared_digests(app, at, avant) == avant
+
+
+def test_saham_views(app, bam_store, saham_aggregated):
+    at = new_app_test('BAM', saham_aggregated=saham_aggregated)
+    avant = shared_digests(app, at, ['combined_data_bam', 'saham_aggregated'])
+
+    at.sidebar.radio[0].set_value("Visualisations Saham Bank").run()
+    assert not at.exception, at.exception
+    run_each_view(at, 'saham_vue', choix=False)
+    cible = next(s for s in at.slider if s.key == 'saham_target_pdm')
+    cible.set_value(10.0).run()
+    assert not at.exception, at.exception
+    assert shared_digests(app, at, avant) == avant
+
+
+def test_balance_views(app):
+    produits = app.parse_balance_txt(balance_text(30, seed=1), 'Produits')
+    charges = app.parse_balance_txt(balance_text(30, seed=2), 'Charges')
+    avant = (app.hash_dataframe(produits), app.hash_dataframe(charges))
+
+    at = new_app_test('Balance', balance_produits=produits, balance_charges=charges)
+    for vue in radio(at, 'balance_vue').options:
+        radio(at, 'balance_vue').set_value(vue).run()
+        assert not at.exception, (vue, at.exception)
+        for curseur in at.slider[:1]:
+            curseur.set_value(curseur.max).run()
+            assert not at.exception, (vue, curseur.label, at.exception)
+    assert (app.hash_dataframe(produits), app.hash_dataframe(charges)) == avant